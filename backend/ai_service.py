@@ -1,8 +1,15 @@
 import google.generativeai as genai
 import os
 import json
+import re
+import hashlib
+import mimetypes
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any
 from dotenv import load_dotenv
+from utils.cache import get_cache
+from utils.events import subscribe, EXPENSE_CHANGED, INCOME_CHANGED
 
 load_dotenv()
 # Configure Gemini API
@@ -13,12 +20,180 @@ if GEMINI_API_KEY:
 else:
     print("⚠️  WARNING: GEMINI_API_KEY not found in environment variables")
 
+# Off-loop execution of blocking Gemini SDK calls
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "30"))
+AI_RECEIPT_TIMEOUT_SECONDS = float(os.getenv("AI_RECEIPT_TIMEOUT_SECONDS", "60"))
+
+# Chat response cache: (user_id, hash(persona, question, db_context)) -> answer
+chat_cache = get_cache(
+    "ai_chat",
+    maxsize=int(os.getenv("AI_CHAT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("AI_CHAT_CACHE_TTL", "600"))
+)
+
+
+def _invalidate_user_chat_cache(event: Dict[str, Any]):
+    """Expense/income changed - the user's cached answers are stale"""
+    chat_cache.invalidate_prefix(event["user_id"])
+
+
+subscribe(EXPENSE_CHANGED, _invalidate_user_chat_cache)
+subscribe(INCOME_CHANGED, _invalidate_user_chat_cache)
+
+
+class ChatStreamError(Exception):
+    """A chat stream failed part-way; str(e) is the message to show the user"""
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip("?!.… ")
+
 
 class FinMateAI:
     """AI Service for FinMate - handles both chatbot and receipt analysis"""
     
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Bounded pool so slow Gemini round-trips never run on the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=AI_MAX_CONCURRENCY, thread_name_prefix="gemini"
+        )
+        self._semaphore = None  # Created lazily inside the running loop
+        self.stats = {"calls": 0, "in_flight": 0, "timeouts": 0, "errors": 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+        return self._semaphore
+
+    async def _run_off_loop(self, func, *args, timeout: float = None, **kwargs):
+        """
+        Run a blocking SDK call in the AI thread pool
+
+        Waiting for a free slot counts towards the timeout.
+        Raises asyncio.TimeoutError when the call does not finish in time. A timed-out
+        call keeps its slot until its thread really returns, so hung calls can never
+        pile up unseen in the executor queue behind the semaphore.
+        """
+        timeout = timeout or AI_TIMEOUT_SECONDS
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        semaphore = self._get_semaphore()
+
+        self.stats["calls"] += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            print(f"⏱️ Gemini call timed out after {timeout:.0f}s (no free slot)")
+            raise
+
+        self.stats["in_flight"] += 1
+        future = loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+        def _release(_):
+            self.stats["in_flight"] -= 1
+            semaphore.release()
+
+        future.add_done_callback(_release)
+        try:
+            # shield: a timeout must not "finish" the future while its thread still runs
+            return await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            print(f"⏱️ Gemini call timed out after {timeout:.0f}s")
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    async def generate_content_async(self, contents, timeout: float = None):
+        """Async facade over model.generate_content"""
+        timeout = timeout or AI_TIMEOUT_SECONDS
+        return await self._run_off_loop(
+            self.model.generate_content,
+            contents,
+            request_options={"timeout": timeout},
+            timeout=timeout
+        )
+
+    async def stream_content_async(self, contents, timeout: float = None):
+        """
+        Async generator over model.generate_content(stream=True)
+
+        The blocking SDK iterator is drained in the AI thread pool and chunks are
+        handed to the event loop through a queue. The timeout covers the whole stream.
+        """
+        timeout = timeout or AI_TIMEOUT_SECONDS
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        abandoned = False
+
+        def _produce():
+            try:
+                stream = self.model.generate_content(
+                    contents, stream=True, request_options={"timeout": timeout}
+                )
+                for chunk in stream:
+                    if abandoned:
+                        break
+                    text = chunk.text
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        self.stats["calls"] += 1
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+
+        self.stats["in_flight"] += 1
+        producer = loop.run_in_executor(self._executor, _produce)
+
+        def _release(_):
+            # The slot is held until the producer thread is really done
+            self.stats["in_flight"] -= 1
+            semaphore.release()
+
+        producer.add_done_callback(_release)
+        try:
+            while True:
+                remaining = max(deadline - loop.time(), 0)
+                item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            print(f"⏱️ Gemini stream timed out after {timeout:.0f}s")
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            abandoned = True  # Producer stops at the next chunk if we left early
+
+    def get_stats(self) -> Dict[str, Any]:
+        """AI call counters for /api/metrics"""
+        return {
+            **self.stats,
+            "max_concurrency": AI_MAX_CONCURRENCY,
+            "timeout_seconds": AI_TIMEOUT_SECONDS,
+        }
     
     def determine_persona(self, user) -> tuple:
         """
@@ -205,7 +380,170 @@ Bu rola TAM uyğun şəkildə danış. Heç vaxt roldan çıxma.
         Returns:
             AI response as string
         """
-        
+        base_personality = self._resolve_persona(user)
+        cache_key = self._chat_cache_key(user, base_personality, user_message, db_context, language)
+        cached = chat_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        system_prompt, gem_suggestion = self._build_chat_prompt(
+            user_message, db_context, chat_history, language, user, base_personality
+        )
+
+        try:
+            response = self.model.generate_content(
+                system_prompt, request_options={"timeout": AI_TIMEOUT_SECONDS}
+            )
+            response_text = self._finish_chat_response(response.text, gem_suggestion)
+            chat_cache.set(cache_key, response_text)
+            return response_text
+        except Exception as e:
+            print(f"❌ Gemini API Error: {e}")
+            return f"AI-də problem var 🤔 Gemini API açarını yoxla. Xəta: {str(e)}"
+
+    async def chat_with_cfo_async(
+        self,
+        user_message: str,
+        db_context: Dict[str, Any],
+        chat_history: List[Dict[str, str]] = None,
+        language: str = "az",
+        user = None
+    ) -> str:
+        """
+        Async variant of chat_with_cfo - the Gemini call runs off the event loop
+
+        The prompt (persona, local gems) is still built on the caller's side because
+        it may touch the caller's DB session.
+        """
+        base_personality = self._resolve_persona(user)
+        cache_key = self._chat_cache_key(user, base_personality, user_message, db_context, language)
+        cached = chat_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        system_prompt, gem_suggestion = self._build_chat_prompt(
+            user_message, db_context, chat_history, language, user, base_personality
+        )
+
+        try:
+            response = await self.generate_content_async(system_prompt)
+            response_text = self._finish_chat_response(response.text, gem_suggestion)
+            chat_cache.set(cache_key, response_text)
+            return response_text
+        except asyncio.TimeoutError:
+            return "AI cavab vermək üçün çox gecikdi ⏱️ Bir az sonra yenidən cəhd et."
+        except Exception as e:
+            print(f"❌ Gemini API Error: {e}")
+            return f"AI-də problem var 🤔 Gemini API açarını yoxla. Xəta: {str(e)}"
+
+    async def chat_with_cfo_stream(
+        self,
+        user_message: str,
+        db_context: Dict[str, Any],
+        chat_history: List[Dict[str, str]] = None,
+        language: str = "az",
+        user = None
+    ):
+        """
+        Streaming variant of chat_with_cfo_async - yields text chunks as Gemini produces them
+
+        A cached answer is yielded as a single chunk. Gem suggestions the model
+        skipped are yielded at the end, so the joined chunks equal the final answer.
+        Raises ChatStreamError if Gemini fails or times out mid-stream.
+        """
+        base_personality = self._resolve_persona(user)
+        cache_key = self._chat_cache_key(user, base_personality, user_message, db_context, language)
+        cached = chat_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        system_prompt, gem_suggestion = self._build_chat_prompt(
+            user_message, db_context, chat_history, language, user, base_personality
+        )
+
+        parts = []
+        try:
+            async for chunk in self.stream_content_async(system_prompt):
+                # Drop leading whitespace so the stream matches the stripped answer
+                if not parts:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                parts.append(chunk)
+                yield chunk
+        except asyncio.TimeoutError:
+            raise ChatStreamError("AI cavab vermək üçün çox gecikdi ⏱️ Bir az sonra yenidən cəhd et.")
+        except Exception as e:
+            print(f"❌ Gemini API Error: {e}")
+            raise ChatStreamError(f"AI-də problem var 🤔 Gemini API açarını yoxla. Xəta: {str(e)}")
+
+        streamed_text = "".join(parts).rstrip()
+        final_text = self._finish_chat_response(streamed_text, gem_suggestion)
+        if len(final_text) > len(streamed_text):
+            yield final_text[len(streamed_text):]
+        chat_cache.set(cache_key, final_text)
+
+    def _resolve_persona(self, user) -> str:
+        """Persona system prompt for the user (friendly default without a user)"""
+        if user:
+            _, base_personality = self.determine_persona(user)
+            return base_personality
+        return "Sən FinMate AI, dostcasına maliyyə köməkçisisən."
+
+    def _chat_cache_key(
+        self,
+        user,
+        base_personality: str,
+        user_message: str,
+        db_context: Dict[str, Any],
+        language: str
+    ) -> tuple:
+        """
+        Cache key for a chat answer
+
+        Chat history is deliberately left out so repeated questions hit the cache;
+        the financial snapshot (db_context) and persona are what change the answer.
+        """
+        payload = json.dumps(
+            {
+                "persona": base_personality,
+                "username": user.username if user else None,
+                "language": (language or "az").lower(),
+                "question": normalize_question(user_message),
+                "context": db_context,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return (user.id if user else None, digest)
+
+    def _finish_chat_response(self, response_text: str, gem_suggestion: str) -> str:
+        """Strip the model output and make sure gem suggestions are included"""
+        response_text = response_text.strip()
+
+        # If we have gem suggestions but AI didn't include them, append them
+        if gem_suggestion and gem_suggestion not in response_text:
+            response_text += "\n\n" + gem_suggestion
+
+        return response_text
+
+    def _build_chat_prompt(
+        self,
+        user_message: str,
+        db_context: Dict[str, Any],
+        chat_history: List[Dict[str, str]] = None,
+        language: str = "az",
+        user = None,
+        base_personality: str = None
+    ) -> tuple:
+        """
+        Build the CFO system prompt
+
+        Returns: (system_prompt, gem_suggestion)
+        """
         # Build context string from database
         context_parts = []
         
@@ -262,11 +600,8 @@ Bu rola TAM uyğun şəkildə danış. Heç vaxt roldan çıxma.
         username = user.username if user else "İstifadəçi"
         
         # Get dynamic persona
-        if user:
-            persona_name, base_personality = self.determine_persona(user)
-        else:
-            # Fallback if no user object
-            base_personality = "Sən FinMate AI, dostcasına maliyyə köməkçisisən."
+        if base_personality is None:
+            base_personality = self._resolve_persona(user)
         
         # Import local gems for suggestions
         try:
@@ -346,25 +681,15 @@ Bu rola TAM uyğun şəkildə danış. Heç vaxt roldan çıxma.
 
 **Your Response:**"""
 
-        try:
-            response = self.model.generate_content(system_prompt)
-            response_text = response.text.strip()
-            
-            # If we have gem suggestions but AI didn't include them, append them
-            if gem_suggestion and gem_suggestion not in response_text:
-                response_text += "\n\n" + gem_suggestion
-            
-            return response_text
-        except Exception as e:
-            print(f"❌ Gemini API Error: {e}")
-            return f"AI-də problem var 🤔 Gemini API açarını yoxla. Xəta: {str(e)}"
+        return system_prompt, gem_suggestion
     
-    def analyze_receipt(self, image_path: str) -> Dict[str, Any]:
+    def analyze_receipt(self, image_path: str, display_name: str = None) -> Dict[str, Any]:
         """
         Analyze receipt image and extract itemized data
         
         Args:
             image_path: Path to receipt image file
+            display_name: Original upload filename (used by the offline fallback)
             
         Returns:
             Dictionary with merchant, date, items, total
@@ -373,7 +698,7 @@ Bu rola TAM uyğun şəkildə danış. Heç vaxt roldan çıxma.
         # If API key missing, avoid remote call and return graceful fallback
         if not GEMINI_API_KEY:
             return self._fallback_receipt(
-                image_path,
+                display_name or image_path,
                 "Gemini API açarı tapılmadı, sadə offline nəticə göstərildi."
             )
         
@@ -404,11 +729,18 @@ IMPORTANT:
 Return ONLY the JSON, no additional text."""
 
         try:
-            # Upload image to Gemini
-            uploaded_file = genai.upload_file(image_path)
+            # Send the image inline - a separate upload_file() call has no timeout
+            with open(image_path, "rb") as f:
+                image_part = {
+                    "mime_type": mimetypes.guess_type(image_path)[0] or "image/jpeg",
+                    "data": f.read()
+                }
             
             # Generate content with image
-            response = self.model.generate_content([prompt, uploaded_file])
+            response = self.model.generate_content(
+                [prompt, image_part],
+                request_options={"timeout": AI_RECEIPT_TIMEOUT_SECONDS}
+            )
             
             # Parse JSON response
             response_text = response.text.strip()
@@ -431,10 +763,22 @@ Return ONLY the JSON, no additional text."""
         except Exception as e:
             print(f"❌ Receipt Analysis Error: {e}")
             return self._fallback_receipt(
-                image_path,
+                display_name or image_path,
                 f"AI xidməti çatmadı ({str(e)}) - əl ilə təsdiq üçün sadə nəticə."
             )
 
+    async def analyze_receipt_async(self, image_path: str, display_name: str = None) -> Dict[str, Any]:
+        """Async variant of analyze_receipt - upload + generate run off the event loop"""
+        try:
+            return await self._run_off_loop(
+                self.analyze_receipt, image_path, display_name, timeout=AI_RECEIPT_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            return self._fallback_receipt(
+                display_name or image_path,
+                "AI xidməti vaxtında cavab vermədi - əl ilə təsdiq üçün sadə nəticə."
+            )
+
     def _fallback_receipt(self, image_path: str, reason: str) -> Dict[str, Any]:
         """Offline/failed AI fallback so UX doesn't break."""
         merchant_guess = os.path.splitext(os.path.basename(image_path))[0] or "Unknown Merchant"
@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from utils.response_cache import ResponseCacheMiddleware
 import os
 from dotenv import load_dotenv
 
@@ -18,6 +19,10 @@ SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", "finmate-secret-key-change-
 # Initialize FastAPI app
 app = FastAPI(title="FinMate AI", description="Your Personal CFO Assistant")
 
+# ETag/304 cache for polled read endpoints - added first so it runs inside CORS
+# (304s still get CORS headers) and inside SessionMiddleware (needs user_id)
+app.add_middleware(ResponseCacheMiddleware)
+
 # Add CORS middleware for React frontend - MUST be before other middleware
 app.add_middleware(
     CORSMiddleware,
@@ -1,14 +1,166 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from models import Base, User, Expense, ChatMessage
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from models import Base, User, Expense, ChatMessage, UserMonthSummary
 from datetime import datetime, timedelta
+import os
+import sys
 
 # SQLite Database Configuration
 DATABASE_URL = "sqlite:///./finmate.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./finmate.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Engine profile: "dev" (default journaling, SQLAlchemy default pool) or "production"
+DB_PROFILE = os.getenv("DB_PROFILE", "dev").lower()
+
+ENGINE_PROFILES = {
+    "dev": {
+        "pragmas": {},
+        "pool": None,
+    },
+    "production": {
+        # Applied on every new DBAPI connection
+        "pragmas": {
+            "journal_mode": "WAL",  # Readers no longer block the writer
+            "synchronous": "NORMAL",  # Safe with WAL, far fewer fsyncs
+            "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+            "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+            "cache_size": -int(os.getenv("DB_CACHE_SIZE_KB", "65536")),  # Negative = KiB
+            "temp_store": "MEMORY",
+        },
+        "pool": {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            "pool_pre_ping": True,
+        },
+    },
+}
+
+
+def apply_sqlite_pragmas(engine, pragmas: dict):
+    """Run PRAGMA statements on every new connection of the engine"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_engine_for_profile(url: str, profile_name: str):
+    """Create SQLAlchemy engine configured by ENGINE_PROFILES"""
+    profile = ENGINE_PROFILES.get(profile_name)
+    if profile is None:
+        print(f"⚠️ Unknown DB_PROFILE '{profile_name}', using 'dev'")
+        profile = ENGINE_PROFILES["dev"]
+
+    engine_kwargs = {"connect_args": {"check_same_thread": False}}
+    if profile["pool"]:
+        engine_kwargs["poolclass"] = QueuePool
+        engine_kwargs.update(profile["pool"])
+
+    profile_engine = create_engine(url, **engine_kwargs)
+    apply_sqlite_pragmas(profile_engine, profile["pragmas"])
+    return profile_engine
+
+
+def create_async_engine_for_profile(url: str, profile_name: str):
+    """Create async (aiosqlite) engine with the same profile as the sync one"""
+    profile = ENGINE_PROFILES.get(profile_name, ENGINE_PROFILES["dev"])
+
+    engine_kwargs = {}
+    if profile["pool"]:
+        engine_kwargs["poolclass"] = AsyncAdaptedQueuePool
+        engine_kwargs.update(profile["pool"])
+
+    profile_engine = create_async_engine(url, **engine_kwargs)
+    # Pragmas are set on the underlying DBAPI connections
+    apply_sqlite_pragmas(profile_engine.sync_engine, profile["pragmas"])
+    return profile_engine
+
+
+engine = create_engine_for_profile(DATABASE_URL, DB_PROFILE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async path for request handlers - queries do not block the event loop
+async_engine = create_async_engine_for_profile(ASYNC_DATABASE_URL, DB_PROFILE)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def _describe_pool(pool) -> dict:
+    """Size/checked-in/checked-out/overflow of a connection pool"""
+    stats = {
+        "pool_class": type(pool).__name__,
+        "status": pool.status(),
+    }
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    return stats
+
+
+def get_pool_stats() -> dict:
+    """Connection pool statistics for the sync and async engines"""
+    stats = {"profile": DB_PROFILE}
+    stats.update(_describe_pool(engine.pool))
+    stats["async"] = _describe_pool(async_engine.pool)
+    return stats
+
+
+# Composite indexes for the hot (user_id, ...) filters - created idempotently by ensure_schema
+HOT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_expenses_user_date ON expenses (user_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_user_sub_date ON expenses (user_id, is_subscription, date)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_user_created ON expenses (user_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_incomes_user_date ON incomes (user_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_incomes_user_created ON incomes (user_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_user_timestamp ON chat_messages (user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS ix_xp_logs_user_created ON xp_logs (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_xp_logs_user_action ON xp_logs (user_id, action_type)",
+]
+
+# Hot queries checked with EXPLAIN QUERY PLAN on startup: (name, sql, params)
+HOT_QUERIES = [
+    ("expenses_by_date",
+     "SELECT sum(amount), count(id) FROM expenses WHERE user_id = ? AND date >= ? AND date <= ?",
+     (1, "2024-01-01 00:00:00", "2024-01-31 23:59:59")),
+    ("expenses_by_category",
+     "SELECT category, sum(amount) FROM expenses WHERE user_id = ? AND date >= ? GROUP BY category",
+     (1, "2024-01-01 00:00:00")),
+    ("subscriptions_by_date",
+     "SELECT sum(amount) FROM expenses WHERE user_id = ? AND is_subscription = 1 AND date >= ?",
+     (1, "2024-01-01 00:00:00")),
+    ("recent_expenses",
+     "SELECT * FROM expenses WHERE user_id = ? ORDER BY created_at DESC LIMIT 10",
+     (1,)),
+    ("incomes_by_date",
+     "SELECT source, sum(amount) FROM incomes WHERE user_id = ? AND date >= ? GROUP BY source",
+     (1, "2024-01-01 00:00:00")),
+    ("recent_incomes",
+     "SELECT * FROM incomes WHERE user_id = ? ORDER BY created_at DESC LIMIT 10",
+     (1,)),
+    ("chat_history",
+     "SELECT * FROM chat_messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10",
+     (1,)),
+    ("xp_logs_recent",
+     "SELECT * FROM xp_logs WHERE user_id = ? ORDER BY created_at DESC LIMIT 20",
+     (1,)),
+    ("xp_breakdown",
+     "SELECT action_type, sum(amount) FROM xp_logs WHERE user_id = ? GROUP BY action_type",
+     (1,)),
+    ("month_summary",
+     "SELECT kind, category, total, count FROM user_month_summary WHERE user_id = ? AND month = ? AND count > 0",
+     (1, "2024-01")),
+]
+
 
 def get_db():
     """Dependency for getting database session"""
@@ -19,11 +171,80 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency for getting async database session
+
+    Sync query helpers can be reused through `await db.run_sync(fn, ...)`.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize database and create tables, preserving existing data"""
     Base.metadata.create_all(bind=engine)
     ensure_schema()
-    print("✅ Database initialized")
+    ensure_month_summaries()
+    if os.getenv("DB_QUERY_PLAN_AUDIT", "1") != "0":
+        audit_query_plans()
+    print(f"✅ Database initialized (profile: {DB_PROFILE})")
+
+
+def audit_query_plans() -> list:
+    """Run EXPLAIN QUERY PLAN on HOT_QUERIES and warn about full table scans
+
+    Returns:
+        List of (query_name, plan_detail) tuples that fall back to a full scan
+    """
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    full_scans = []
+    try:
+        for name, sql, params in HOT_QUERIES:
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = cursor.fetchall()
+            except Exception as e:
+                print(f"⚠️ Query plan audit failed for '{name}': {e}")
+                continue
+            for row in plan:
+                detail = str(row[-1])
+                # "SCAN <table>" means a full table scan; indexed lookups are "SEARCH ..."
+                if detail.startswith("SCAN ") and "USING" not in detail:
+                    full_scans.append((name, detail))
+    finally:
+        conn.close()
+
+    for name, detail in full_scans:
+        print(f"⚠️ Hot query '{name}' falls back to a full scan: {detail}")
+    if not full_scans:
+        print(f"✅ Query plan audit: {len(HOT_QUERIES)} hot queries use indexes")
+    return full_scans
+
+
+def ensure_month_summaries():
+    """Backfill user_month_summary once for databases created before the rollup existed"""
+    from utils.month_summary import rebuild_month_summaries
+    db = SessionLocal()
+    try:
+        has_summaries = db.query(UserMonthSummary.id).first() is not None
+        has_expenses = db.query(Expense.id).first() is not None
+        if not has_summaries and has_expenses:
+            written = rebuild_month_summaries(db)
+            print(f"✅ Monthly summaries backfilled ({written} rows)")
+    finally:
+        db.close()
+
+
+def rebuild_summaries():
+    """Recompute all monthly summaries from raw expense/income rows"""
+    from utils.month_summary import rebuild_month_summaries
+    db = SessionLocal()
+    try:
+        written = rebuild_month_summaries(db)
+        print(f"✅ Monthly summaries rebuilt ({written} rows)")
+    finally:
+        db.close()
 
 
 def ensure_schema():
@@ -74,6 +295,9 @@ def ensure_schema():
     add_column_if_missing("expenses", "notes TEXT")
     add_column_if_missing("expenses", "created_at DATETIME DEFAULT CURRENT_TIMESTAMP")
 
+    # Receipt scan cache -> the expense it produced (duplicate uploads reuse it)
+    add_column_if_missing("receipt_scans", "expense_id INTEGER")
+
     # Create incomes table if it doesn't exist
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS incomes (
@@ -97,6 +321,10 @@ def ensure_schema():
     add_column_if_missing("incomes", "amount FLOAT")
     add_column_if_missing("incomes", "user_id INTEGER")
 
+    # Composite indexes for hot queries
+    for index_sql in HOT_INDEXES:
+        cursor.execute(index_sql)
+
     conn.commit()
     conn.close()
 
@@ -216,6 +444,10 @@ def seed_demo_data():
     
     db.commit()
     
+    # Keep monthly rollup in sync with the seeded expenses
+    from utils.month_summary import rebuild_month_summaries
+    rebuild_month_summaries(db, demo_user.id)
+    
     total_amount = sum([exp["amount"] for exp in expense_data])
     print(f"✅ Seeded Azerbaijan market data:")
     print(f"   - {len(expense_data)} real expenses")
@@ -267,9 +499,16 @@ def reset_demo_data():
         db.add(expense)
 
     db.commit()
+
+    from utils.month_summary import rebuild_month_summaries
+    rebuild_month_summaries(db, demo_user.id)
     db.close()
 
 
 if __name__ == "__main__":
     init_db()
-    seed_demo_data()
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-summaries":
+        # python database.py rebuild-summaries
+        rebuild_summaries()
+    else:
+        seed_demo_data()
@@ -4,9 +4,10 @@ Predicts if user will exceed budget before month ends
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import Expense, User
+from models import User
+from utils.month_summary import get_month_totals
 from datetime import datetime
+from typing import Optional
 import calendar
 
 
@@ -17,19 +18,9 @@ class ForecastService:
     def calculate_daily_average(user_id: int, db_session: Session) -> float:
         """Calculate average daily spending for current month"""
         now = datetime.utcnow()
-        month_start = datetime(now.year, now.month, 1)
-
-        # Get current month's expenses
-        total = (
-            db_session.query(func.sum(Expense.amount))
-            .filter(
-                Expense.user_id == user_id,
-                Expense.date >= month_start,
-                Expense.date <= now,
-            )
-            .scalar()
-            or 0.0
-        )
+
+        # Get current month's spending from the monthly rollup
+        total = get_month_totals(db_session, user_id, now)["total_spending"]
 
         # Days elapsed in current month
         days_elapsed = now.day
@@ -40,10 +31,18 @@ class ForecastService:
         return total / days_elapsed
 
     @staticmethod
-    def get_forecast(user_id: int, db_session: Session) -> dict:
+    def get_forecast(
+        user_id: int,
+        db_session: Session,
+        user: Optional[User] = None,
+        month_totals: Optional[dict] = None
+    ) -> dict:
         """
         Generate comprehensive forecast for user's spending
 
+        Args:
+            user / month_totals: Already loaded by the caller (skips those queries)
+
         Returns:
             dict with keys:
                 - current_spending: float
@@ -57,26 +56,22 @@ class ForecastService:
                 - sufficient_data: bool
         """
         now = datetime.utcnow()
-        month_start = datetime(now.year, now.month, 1)
         days_in_month = calendar.monthrange(now.year, now.month)[1]
         days_elapsed = now.day
         days_remaining = days_in_month - days_elapsed
 
         # Get user budget
-        user = db_session.query(User).filter(User.id == user_id).first()
+        if user is None:
+            user = db_session.query(User).filter(User.id == user_id).first()
         if not user:
             return {"error": "User not found"}
 
         budget = user.monthly_budget
 
-        # Get current month's expenses
-        expenses = (
-            db_session.query(Expense)
-            .filter(Expense.user_id == user_id, Expense.date >= month_start)
-            .all()
-        )
-
-        current_spending = sum(exp.amount for exp in expenses)
+        # Get current month's spending from the monthly rollup
+        if month_totals is None:
+            month_totals = get_month_totals(db_session, user_id, now)
+        current_spending = month_totals["total_spending"]
 
         # Need at least 3 days of data for meaningful forecast
         if days_elapsed < 3:
@@ -130,7 +125,7 @@ class ForecastService:
         }
 
     @staticmethod
-    def get_chart_forecast_data(user_id: int, db_session: Session) -> list:
+    def get_chart_forecast_data(user_id: int, db_session: Session, forecast: Optional[dict] = None) -> list:
         """
         Generate forecast data points for chart visualization
         Returns list of {date, projected_amount} for remaining days
@@ -138,7 +133,8 @@ class ForecastService:
         now = datetime.utcnow()
         days_in_month = calendar.monthrange(now.year, now.month)[1]
 
-        forecast = ForecastService.get_forecast(user_id, db_session)
+        if forecast is None:
+            forecast = ForecastService.get_forecast(user_id, db_session)
 
         if not forecast.get("sufficient_data"):
             return []
@@ -0,0 +1,219 @@
+"""
+Background job queue - long-running work (receipt scans) is processed by a
+worker pool instead of inside the HTTP request.
+
+The queue is pluggable: JOB_QUEUE_BACKEND selects a backend registered with
+register_backend(). A backend owns both the queue and the job records (status,
+result), so any worker that can reach the backend can run and report a job; only
+the handlers are per process (registered at import time, so every worker has
+them). The built-in "memory" backend keeps everything in this process. Job
+payloads and results must be JSON-serializable for out-of-process backends.
+"""
+import asyncio
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))  # Seconds a finished job stays queryable
+JOB_STORE_MAX = 5000
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobBackend(ABC):
+    """Queue + job record store shared by submitters and workers"""
+
+    @abstractmethod
+    async def put(self, job: Dict[str, Any]):
+        """Store a new job record and enqueue it (raise asyncio.QueueFull when saturated)"""
+
+    @abstractmethod
+    async def get(self) -> Dict[str, Any]:
+        """Wait for the next queued job and return its full record"""
+
+    @abstractmethod
+    async def save(self, job: Dict[str, Any]):
+        """Persist an updated job record (status, result, error)"""
+
+    @abstractmethod
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job record by id, or None if unknown / expired"""
+
+    def qsize(self) -> int:
+        return 0
+
+    def tracked(self) -> int:
+        return 0
+
+
+class InMemoryJobBackend(JobBackend):
+    """asyncio.Queue + dict of records (single process)"""
+
+    def __init__(self, maxsize: int = JOB_QUEUE_MAX):
+        self._queue: Optional[asyncio.Queue] = None
+        self._maxsize = maxsize
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _get_queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._maxsize)
+        return self._queue
+
+    async def put(self, job: Dict[str, Any]):
+        self._prune()
+        self._get_queue().put_nowait(job["id"])  # Raises asyncio.QueueFull when saturated
+        self.jobs[job["id"]] = job
+
+    async def get(self) -> Dict[str, Any]:
+        while True:
+            job = self.jobs.get(await self._get_queue().get())
+            if job is not None:
+                return job
+
+    async def save(self, job: Dict[str, Any]):
+        self.jobs[job["id"]] = job
+
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        """Forget finished jobs older than JOB_RESULT_TTL (and cap the registry size)"""
+        cutoff = time.time() - JOB_RESULT_TTL
+        for job_id in list(self.jobs):
+            finished = self.jobs[job_id]["finished_at"]
+            if (finished and finished < cutoff) or (len(self.jobs) > JOB_STORE_MAX and finished):
+                del self.jobs[job_id]
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def tracked(self) -> int:
+        return len(self.jobs)
+
+
+_backends: Dict[str, Callable[[], JobBackend]] = {
+    "memory": InMemoryJobBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], JobBackend]):
+    """Register an alternative queue backend (e.g. Redis) under JOB_QUEUE_BACKEND=name"""
+    _backends[name] = factory
+
+
+class JobQueue:
+    """Worker pool on top of a JobBackend"""
+
+    def __init__(self):
+        self.backend: Optional[JobBackend] = None
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self.workers = []
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def register_handler(self, job_type: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        """Handler receives the job dict and returns the job result"""
+        self.handlers[job_type] = handler
+
+    def _get_backend(self) -> JobBackend:
+        if self.backend is None:
+            factory = _backends.get(JOB_QUEUE_BACKEND)
+            if factory is None:
+                print(f"⚠️ Unknown JOB_QUEUE_BACKEND '{JOB_QUEUE_BACKEND}', using 'memory'")
+                factory = InMemoryJobBackend
+            self.backend = factory()
+        return self.backend
+
+    def start(self, workers: int = JOB_WORKERS):
+        """Start the worker pool (call from the app startup event)"""
+        if self.workers:
+            return
+        backend = self._get_backend()
+        for index in range(workers):
+            self.workers.append(asyncio.create_task(self._worker(index)))
+        print(f"✅ Job queue started ({type(backend).__name__}, {workers} workers)")
+
+    async def submit(self, job_type: str, user_id: int, payload: Dict[str, Any]) -> Optional[str]:
+        """Queue a job and return its id (None if the queue is full)"""
+        if job_type not in self.handlers:
+            raise ValueError(f"No handler registered for job type '{job_type}'")
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "type": job_type,
+            "user_id": user_id,
+            "payload": payload,
+            "status": STATUS_QUEUED,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+        }
+        try:
+            await self._get_backend().put(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return None
+
+        self.stats["submitted"] += 1
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._get_backend().load(job_id)
+
+    def public_view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job fields that are safe to return to the client"""
+        return {
+            "job_id": job["id"],
+            "type": job["type"],
+            "status": job["status"],
+            "result": job["result"],
+            "error": job["error"],
+        }
+
+    async def _worker(self, index: int):
+        backend = self._get_backend()
+        while True:
+            job = await backend.get()
+            handler = self.handlers.get(job["type"])
+
+            job["status"] = STATUS_RUNNING
+            await backend.save(job)
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler registered for job type '{job['type']}'")
+                job["result"] = await handler(job)
+                job["status"] = STATUS_DONE
+                self.stats["completed"] += 1
+            except Exception as e:
+                print(f"❌ Job {job['id']} ({job['type']}) failed: {e}")
+                job["status"] = STATUS_FAILED
+                job["error"] = str(e)
+                self.stats["failed"] += 1
+            finally:
+                job["finished_at"] = time.time()
+                job["payload"] = None  # Drop inputs once processed
+                await backend.save(job)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backend": type(self._get_backend()).__name__,
+            "workers": len(self.workers),
+            "queued": self._get_backend().qsize(),
+            "tracked_jobs": self._get_backend().tracked(),
+        }
+
+
+# Singleton instance
+job_queue = JobQueue()
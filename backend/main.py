@@ -24,9 +24,13 @@ import routes.heatmap
 import routes.notifications
 import routes.websocket
 import routes.export
+import routes.bootstrap
 
 # Import random notifications scheduler
 from routes.random_notifications import start_random_notifications
+from job_queue import job_queue
+from notification_engine import notification_engine
+from routes.websocket import start_notification_broker
 
 
 @app.on_event("startup")
@@ -36,6 +40,12 @@ async def startup_event():
     seed_demo_data()
     # Start random notifications scheduler (background task)
     start_random_notifications()
+    # Start background job workers (receipt scans)
+    job_queue.start()
+    # Event-driven notification pushes (needs the running loop)
+    notification_engine.start()
+    # Cross-worker WebSocket fan-out (memory or Redis broker)
+    await start_notification_broker()
 
 @app.options("/{full_path:path}")
 async def options_handler(full_path: str):
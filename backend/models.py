@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, JSON, Date
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, JSON, Date, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -55,16 +55,13 @@ class User(Base):
     dreams = relationship("Dream", back_populates="user", cascade="all, delete-orphan")
     
     def calculate_current_month_spending(self):
-        """Calculate total spending for current month"""
-        from datetime import datetime
-        now = datetime.utcnow()
-        month_start = datetime(now.year, now.month, 1)
-        
-        total = 0
-        for expense in self.expenses:
-            if expense.date >= month_start:
-                total += expense.amount
-        return total
+        """Calculate total spending for current month (from the monthly rollup)"""
+        from sqlalchemy.orm import object_session
+        from utils.month_summary import get_month_totals
+        db = object_session(self)
+        if db is None:
+            return 0
+        return get_month_totals(db, self.id)["total_spending"]
     
     def __repr__(self):
         return f"<User(username='{self.username}', budget={self.monthly_budget})>"
@@ -193,3 +190,42 @@ class Income(Base):
     
     def __repr__(self):
         return f"<Income(source='{self.source}', amount={self.amount}, date={self.date})>"
+
+
+
+class UserMonthSummary(Base):
+    __tablename__ = "user_month_summary"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(String, nullable=False)  # Format: "YYYY-MM"
+    kind = Column(String, nullable=False)  # 'expense' or 'income'
+    category = Column(String, nullable=False)  # Expense category or income source
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "month", "kind", "category", name="uq_user_month_summary"),
+    )
+    
+    def __repr__(self):
+        return f"<UserMonthSummary(user_id={self.user_id}, month='{self.month}', {self.kind}:{self.category}={self.total})>"
+
+
+class ReceiptScan(Base):
+    __tablename__ = "receipt_scans"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content_hash = Column(String, nullable=False)  # sha256 of the uploaded image bytes
+    file_path = Column(String, nullable=True)  # Preprocessed image under static/uploads
+    receipt_data = Column(JSON, nullable=False)  # Cached AI extraction result
+    expense_id = Column(Integer, ForeignKey("expenses.id"), nullable=True)  # Expense created from this photo
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "content_hash", name="uq_receipt_scan_user_hash"),
+    )
+    
+    def __repr__(self):
+        return f"<ReceiptScan(user_id={self.user_id}, hash='{self.content_hash[:12]}')>"
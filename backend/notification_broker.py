@@ -0,0 +1,195 @@
+"""
+Notification broker - fans WebSocket messages out across uvicorn workers
+
+Sockets live in the worker that accepted them, so send_notification_to_user publishes
+through a broker and every worker delivers to its own sockets. The broker also tracks
+which users are online anywhere (presence) and elects one leader per periodic task
+(e.g. random notifications) so it runs once per deployment, not once per worker.
+
+NOTIFICATION_BROKER selects a backend registered with register_broker(). "memory"
+is single-process; "redis" works with Redis or any protocol-compatible server
+(REDIS_URL) and needs the optional `redis` package.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+NOTIFICATION_BROKER = os.getenv("NOTIFICATION_BROKER", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+BROKER_CHANNEL = os.getenv("BROKER_CHANNEL", "finmate:notifications")
+PRESENCE_TTL_SECONDS = 90
+PRESENCE_REFRESH_SECONDS = 30
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# (user_id, payload, origin worker id) -> delivered to local sockets
+MessageHandler = Callable[[int, Dict[str, Any], str], Awaitable[None]]
+
+
+class NotificationBroker(ABC):
+    """Transport interface for cross-worker notification delivery"""
+
+    distributed = False
+
+    def __init__(self):
+        self.stats = {"published": 0, "received": 0, "errors": 0}
+
+    @abstractmethod
+    async def start(self, on_message: MessageHandler, local_users: Callable[[], Iterable[int]]):
+        """Begin delivering published messages to on_message"""
+
+    @abstractmethod
+    async def publish(self, user_id: int, payload: Dict[str, Any]):
+        """Send a payload to every worker (including this one)"""
+
+    @abstractmethod
+    async def online_users(self) -> Set[int]:
+        """Users with an open socket in any worker"""
+
+    @abstractmethod
+    async def acquire_leadership(self, name: str, ttl: float) -> bool:
+        """True if this worker holds (or just took / renewed) the named leadership"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "backend": type(self).__name__, "worker_id": WORKER_ID}
+
+
+class InMemoryBroker(NotificationBroker):
+    """Single process - publish delivers directly, this worker is always the leader"""
+
+    def __init__(self):
+        super().__init__()
+        self._on_message: Optional[MessageHandler] = None
+        self._local_users: Callable[[], Iterable[int]] = lambda: ()
+
+    async def start(self, on_message: MessageHandler, local_users: Callable[[], Iterable[int]]):
+        self._on_message = on_message
+        self._local_users = local_users
+
+    async def publish(self, user_id: int, payload: Dict[str, Any]):
+        self.stats["published"] += 1
+        if self._on_message is not None:
+            await self._on_message(user_id, payload, WORKER_ID)
+
+    async def online_users(self) -> Set[int]:
+        return set(self._local_users())
+
+    async def acquire_leadership(self, name: str, ttl: float) -> bool:
+        return True
+
+
+# Renew the leader key only if we still own it
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class RedisBroker(NotificationBroker):
+    """Redis pub/sub fan-out, per-worker presence sets and SET NX leader keys"""
+
+    distributed = True
+
+    def __init__(self, url: str = REDIS_URL):
+        super().__init__()
+        import redis.asyncio as aioredis  # Optional dependency (pip install redis)
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.url = url
+        self._tasks = []
+
+    def _presence_key(self, worker_id: str = WORKER_ID) -> str:
+        return f"{BROKER_CHANNEL}:presence:{worker_id}"
+
+    async def start(self, on_message: MessageHandler, local_users: Callable[[], Iterable[int]]):
+        self._tasks.append(asyncio.create_task(self._listen(on_message)))
+        self._tasks.append(asyncio.create_task(self._refresh_presence(local_users)))
+        print(f"✅ Redis notification broker connected ({self.url.rsplit('@', 1)[-1]})")
+
+    async def _listen(self, on_message: MessageHandler):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(BROKER_CHANNEL)
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    envelope = json.loads(item["data"])
+                    self.stats["received"] += 1
+                    await on_message(envelope["user_id"], envelope["payload"], envelope["origin"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ Broker listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def _refresh_presence(self, local_users: Callable[[], Iterable[int]]):
+        """Each worker owns one expiring set of its connected users"""
+        while True:
+            try:
+                key = self._presence_key()
+                users = [str(user_id) for user_id in local_users()]
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.delete(key)
+                    if users:
+                        pipe.sadd(key, *users)
+                        pipe.expire(key, PRESENCE_TTL_SECONDS)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ Broker presence error: {e}")
+            await asyncio.sleep(PRESENCE_REFRESH_SECONDS)
+
+    async def publish(self, user_id: int, payload: Dict[str, Any]):
+        envelope = {"user_id": user_id, "payload": payload, "origin": WORKER_ID, "ts": time.time()}
+        await self.redis.publish(BROKER_CHANNEL, json.dumps(envelope, ensure_ascii=False, default=str))
+        self.stats["published"] += 1
+
+    async def online_users(self) -> Set[int]:
+        keys = [key async for key in self.redis.scan_iter(match=self._presence_key("*"))]
+        if not keys:
+            return set()
+        return {int(user_id) for user_id in await self.redis.sunion(keys)}
+
+    async def acquire_leadership(self, name: str, ttl: float) -> bool:
+        key = f"{BROKER_CHANNEL}:leader:{name}"
+        ttl_ms = int(ttl * 1000)
+        if await self.redis.set(key, WORKER_ID, nx=True, px=ttl_ms):
+            return True
+        return bool(await self.redis.eval(_RENEW_SCRIPT, 1, key, WORKER_ID, ttl_ms))
+
+
+_brokers: Dict[str, Callable[[], NotificationBroker]] = {
+    "memory": InMemoryBroker,
+    "redis": RedisBroker,
+}
+
+
+def register_broker(name: str, factory: Callable[[], NotificationBroker]):
+    """Register an alternative broker backend under NOTIFICATION_BROKER=name"""
+    _brokers[name] = factory
+
+
+def create_broker(name: str = NOTIFICATION_BROKER) -> NotificationBroker:
+    factory = _brokers.get(name)
+    if factory is None:
+        print(f"⚠️ Unknown NOTIFICATION_BROKER '{name}', using 'memory'")
+        return InMemoryBroker()
+    try:
+        return factory()
+    except ImportError as e:
+        print(f"⚠️ Broker '{name}' unavailable ({e}), using 'memory'")
+        return InMemoryBroker()
+
+
+# Singleton instance
+notification_broker = create_broker()
@@ -0,0 +1,463 @@
+"""
+Event-driven notification engine
+
+Every user with notifications in use gets a rolling state (month / last month /
+week / day totals, category totals, subscriptions) that is built once from the DB
+and then kept current by EXPENSE_CHANGED events. Rules are evaluated against that
+state, so an expense costs O(rules) instead of re-querying every window, and a
+WebSocket push is sent only when the evaluated notifications actually changed.
+
+Pushes are recorded per user as sequenced deltas (add / remove / replace by rule id)
+in a bounded log, so protocol-2 clients get only the ops and a reconnecting client
+can resume from its last sequence number instead of receiving a full snapshot.
+"""
+import asyncio
+import os
+import threading
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Expense, User
+from utils.cache import get_cache
+from utils.events import subscribe, EXPENSE_CHANGED, INCOME_CHANGED
+from utils.month_summary import get_month_totals, month_key
+from notification_broker import notification_broker
+
+# Deltas kept per user for resuming clients
+NOTIFICATION_DELTA_BUFFER = int(os.getenv("NOTIFICATION_DELTA_BUFFER", "64"))
+
+
+class NotificationState:
+    """Rolling per-user totals the rules read"""
+
+    def __init__(self, now: datetime):
+        self.day = now.date()  # Same UTC clock as month / week
+        self.month = month_key(now)
+        month_start = datetime(now.year, now.month, 1)
+        self.last_month = month_key(month_start - timedelta(days=1))
+        self.week_start = datetime.combine(
+            (now - timedelta(days=now.weekday())).date(), datetime.min.time()
+        )
+        self.month_total = 0.0
+        self.month_count = 0
+        self.category_totals: Counter = Counter()
+        self.last_month_total = 0.0
+        self.week_total = 0.0
+        self.day_total = 0.0
+        self.subscription_count = 0
+        self.subscription_names: List[str] = []
+
+    def is_current(self, now: datetime) -> bool:
+        return self.day == now.date() and self.month == month_key(now)
+
+    def apply_expense(self, event: Dict[str, Any], now: datetime) -> bool:
+        """
+        Apply one expense delta
+
+        Returns:
+            False if the state can't be updated incrementally and must be reloaded
+        """
+        when = event.get("date") or now
+        amount = event["amount"]
+        count = event["count"]
+
+        event_month = month_key(when)
+        if event_month == self.month:
+            self.month_total += amount
+            self.month_count += count
+            category = event.get("category") or "Digər"
+            self.category_totals[category] += amount
+            if self.category_totals[category] <= 0.005:
+                del self.category_totals[category]
+        elif event_month == self.last_month:
+            self.last_month_total += amount
+
+        if self.week_start <= when <= now:
+            self.week_total += amount
+        if when.date() == self.day:
+            self.day_total += amount
+
+        if event.get("is_subscription"):
+            self.subscription_count += count
+            merchant = event.get("merchant")
+            if count > 0 and len(self.subscription_names) < 2 and merchant:
+                self.subscription_names.append(merchant)
+            elif count < 0:
+                # Which subscriptions remain is unknown - reload on next read
+                return False
+        return True
+
+
+def load_state(db: Session, user_id: int, now: datetime) -> NotificationState:
+    """Build the rolling state from the rollup table and two small aggregates"""
+    state = NotificationState(now)
+
+    month_totals = get_month_totals(db, user_id, now)
+    state.month_total = month_totals["total_spending"]
+    state.month_count = month_totals["expense_count"]
+    state.category_totals = Counter(month_totals["category_breakdown"])
+    state.last_month_total = get_month_totals(
+        db, user_id, datetime(now.year, now.month, 1) - timedelta(days=1)
+    )["total_spending"]
+
+    day_start = datetime.combine(state.day, datetime.min.time())
+    window_start = min(state.week_start, day_start)
+    week_total, day_total = db.query(
+        func.sum(case((Expense.date >= state.week_start, Expense.amount), else_=0.0)),
+        func.sum(case((Expense.date >= day_start, Expense.amount), else_=0.0)),
+    ).filter(
+        Expense.user_id == user_id,
+        Expense.date >= window_start,
+        Expense.date <= now
+    ).one()
+    state.week_total = week_total or 0.0
+    state.day_total = day_total or 0.0
+
+    subscriptions = (
+        db.query(Expense.merchant)
+        .filter(Expense.user_id == user_id, Expense.is_subscription == True)
+        .order_by(Expense.id)
+    )
+    state.subscription_count = subscriptions.count()
+    state.subscription_names = [row.merchant for row in subscriptions.limit(2)]
+    return state
+
+
+# --- Rules: (state, user, now) -> notification dict or None ---
+
+def rule_budget(state, user, now):
+    budget_percentage = (state.month_total / user.monthly_budget * 100) if user.monthly_budget and user.monthly_budget > 0 else 0
+    if budget_percentage >= 100:
+        return {"icon": "⚠️", "color": "red-500",
+                "message": f"Büdcə limiti keçildi! {budget_percentage:.0f}% istifadə edilib."}
+    if budget_percentage >= 80:
+        return {"icon": "⚡", "color": "amber-500",
+                "message": f"Diqqət: Büdcənin {budget_percentage:.0f}%-ni istifadə etmisən."}
+    return None
+
+
+def rule_daily_limit(state, user, now):
+    if not user.daily_budget_limit:
+        return None
+    if state.day_total > user.daily_budget_limit:
+        return {"icon": "🚨", "color": "red-500",
+                "message": f"Gündəlik limit keçildi! Bu gün {state.day_total:.2f} AZN xərclədiniz (Limit: {user.daily_budget_limit:.2f} AZN)"}
+    if state.day_total >= user.daily_budget_limit * 0.9:
+        return {"icon": "⚡", "color": "amber-500",
+                "message": f"Gündəlik limitə yaxınlaşırsınız! Bu gün {state.day_total:.2f} AZN xərclədiniz (Limit: {user.daily_budget_limit:.2f} AZN)"}
+    return None
+
+
+def rule_subscriptions(state, user, now):
+    if state.subscription_count == 1 and state.subscription_names:
+        return {"icon": "🎬", "color": "purple-500",
+                "message": f"{state.subscription_names[0]} abunəliyinizi yoxlayın."}
+    if state.subscription_count > 1:
+        return {"icon": "💳", "color": "purple-500",
+                "message": f"{state.subscription_count} aktiv abunəliyiniz var."}
+    return None
+
+
+def rule_trend(state, user, now):
+    if state.last_month_total <= 0:
+        return None
+    increase = ((state.month_total - state.last_month_total) / state.last_month_total) * 100
+    if increase > 15:
+        return {"icon": "📈", "color": "blue-500",
+                "message": f"Keçən aya görə {increase:.0f}% çox xərcləyirsən."}
+    if increase < -15:
+        return {"icon": "🎉", "color": "green-500",
+                "message": f"Afərin! Keçən aya görə {abs(increase):.0f}% az xərclədin."}
+    return None
+
+
+def rule_xp(state, user, now):
+    xp = user.xp_points or 0
+    if xp > 0 and xp % 100 < 20:
+        next_milestone = ((xp // 100) + 1) * 100
+        return {"icon": "⭐", "color": "yellow-500",
+                "message": f"{next_milestone} XP-yə çatmağa {next_milestone - xp} XP qalıb!"}
+    return None
+
+
+def rule_salary_early(state, user, now):
+    """Maaşın yarısını (və ya 40%-ni) ayın ilk 10 günündə xərcləmə xəbərdarlığı"""
+    if not user.monthly_income or user.monthly_income <= 0 or now.day > 10:
+        return None
+    total = state.month_total
+    if total >= user.monthly_income / 2:
+        remaining_days = 30 - now.day
+        daily_allowance = (user.monthly_income - total) / remaining_days if remaining_days > 0 else 0
+        return {"icon": "🚨", "color": "red-500",
+                "message": f"Diqqət! Ayın ilk 10 günündə maaşının yarısını ({total:.0f} AZN) xərcləmisən. Qənaət etməsən ac qalacaqsan! Gündəlik limit: {daily_allowance:.0f} AZN"}
+    if total >= user.monthly_income * 0.4:
+        return {"icon": "⚠️", "color": "amber-500",
+                "message": f"Diqqət! Ayın ilk 10 günündə maaşının 40%-ni ({total:.0f} AZN) xərcləmisən. Qənaət etməyə başla!"}
+    return None
+
+
+def rule_salary_half_month(state, user, now):
+    """Ayın ilk yarısında maaşın 70%-ni xərcləmə xəbərdarlığı"""
+    if user.monthly_income and user.monthly_income > 0 and now.day <= 15 \
+            and state.month_total >= user.monthly_income * 0.7:
+        return {"icon": "🔥", "color": "red-500",
+                "message": f"Təhlükə! Ayın ilk yarısında maaşının 70%-ni ({state.month_total:.0f} AZN) xərcləmisən. Dərhal qənaət etməyə başla!"}
+    return None
+
+
+def rule_weekly(state, user, now):
+    if not user.monthly_income or user.monthly_income <= 0:
+        return None
+    weekly_budget = user.monthly_income / 4  # Həftəlik büdcə (aylıq maaşın 1/4-i)
+    if state.week_total > weekly_budget * 1.2:
+        return {"icon": "📊", "color": "amber-500",
+                "message": f"Bu həftə həftəlik büdcənizi ({weekly_budget:.0f} AZN) 20% artıq keçmisiniz. Cari: {state.week_total:.0f} AZN"}
+    return None
+
+
+def rule_top_category(state, user, now):
+    if not state.month_count or not state.category_totals or state.month_total <= 0:
+        return None
+    name, amount = max(state.category_totals.items(), key=lambda x: x[1])
+    percentage = amount / state.month_total * 100
+    if percentage > 50:
+        return {"icon": "🎯", "color": "blue-500",
+                "message": f"'{name}' kateqoriyasına xərclərinizin {percentage:.0f}%-ni ({amount:.0f} AZN) xərcləmisiniz. Diversifikasiya edin!"}
+    return None
+
+
+def rule_savings(state, user, now):
+    if not user.monthly_income or user.monthly_income <= 0:
+        return None
+    savings_potential = user.monthly_income - state.month_total
+    if savings_potential > user.monthly_income * 0.2 and now.day >= 20:
+        return {"icon": "💰", "color": "green-500",
+                "message": f"Əla! Bu ay {savings_potential:.0f} AZN qənaət edə bilərsən. Arzu qutusuna əlavə et!"}
+    return None
+
+
+def rule_daily_overspend(state, user, now):
+    if not user.monthly_income or user.monthly_income <= 0:
+        return None
+    daily_budget = user.monthly_income / 30
+    if state.day_total > daily_budget * 1.5:
+        return {"icon": "🌙", "color": "amber-500",
+                "message": f"Bu gün gündəlik büdcənizi ({daily_budget:.0f} AZN) 50% artıq keçmisiniz. Sabah daha diqqətli olun!"}
+    return None
+
+
+RULES: List[tuple] = [
+    ("budget", rule_budget),
+    ("daily_limit", rule_daily_limit),
+    ("subscriptions", rule_subscriptions),
+    ("trend", rule_trend),
+    ("xp", rule_xp),
+    ("salary_early", rule_salary_early),
+    ("salary_half_month", rule_salary_half_month),
+    ("weekly", rule_weekly),
+    ("top_category", rule_top_category),
+    ("savings", rule_savings),
+    ("daily_overspend", rule_daily_overspend),
+]
+
+
+def evaluate_rules(state: NotificationState, user, now: datetime) -> List[dict]:
+    """Run every rule; adds the all-clear message when nothing is critical"""
+    notifications = []
+    for rule_id, rule in RULES:
+        notification = rule(state, user, now)
+        if notification:
+            notification["id"] = rule_id
+            notifications.append(notification)
+
+    if not any(n["color"] in ("red-500", "amber-500") for n in notifications):
+        notifications.append({
+            "id": "all_good",
+            "icon": "✅",
+            "color": "green-500",
+            "message": "Maliyyə vəziyyətiniz yaxşıdır!"
+        })
+    return notifications
+
+
+class NotificationLog:
+    """What a user's clients have been sent: current list, sequence and recent deltas"""
+
+    def __init__(self):
+        # A new epoch means sequence numbers restarted (log evicted or server restarted)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.current: Dict[str, dict] = {}  # rule id -> notification, in rule order
+        self.deltas: deque = deque(maxlen=NOTIFICATION_DELTA_BUFFER)
+
+    def diff(self, notifications: List[dict]) -> List[dict]:
+        """Ops that turn the current list into `notifications`"""
+        ops = [{"op": "remove", "id": rule_id}
+               for rule_id in self.current if rule_id not in {n["id"] for n in notifications}]
+        for index, notification in enumerate(notifications):
+            previous = self.current.get(notification["id"])
+            if previous is None:
+                ops.append({"op": "add", "id": notification["id"], "index": index, "notification": notification})
+            elif previous != notification:
+                ops.append({"op": "replace", "id": notification["id"], "notification": notification})
+        return ops
+
+    def append(self, ops: List[dict], notifications: List[dict]) -> dict:
+        self.seq += 1
+        self.current = {n["id"]: n for n in notifications}
+        delta = {"seq": self.seq, "ops": ops}
+        self.deltas.append(delta)
+        return delta
+
+    def deltas_since(self, epoch: Optional[str], since: Optional[int]) -> Optional[List[dict]]:
+        """Deltas after `since`, or None if the client must take a snapshot"""
+        if epoch != self.epoch or since is None or since < 0 or since > self.seq:
+            return None
+        oldest = self.deltas[0]["seq"] if self.deltas else self.seq + 1
+        if since + 1 < oldest and since != self.seq:
+            return None
+        return [delta for delta in self.deltas if delta["seq"] > since]
+
+    def snapshot(self) -> List[dict]:
+        return list(self.current.values())
+
+
+class NotificationEngine:
+    """Keeps rolling states current and pushes notification diffs over WebSocket"""
+
+    def __init__(self):
+        self.states = get_cache("notification_state", maxsize=2000)
+        self.logs = get_cache("notification_log", maxsize=5000)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: set = set()
+        self.stats = {
+            "state_loads": 0,
+            "events_applied": 0,
+            "evaluations": 0,
+            "pushes": 0,
+            "unchanged_skipped": 0,
+            "snapshots": 0,
+            "resumes": 0,
+        }
+        subscribe(EXPENSE_CHANGED, self._on_expense_changed)
+        subscribe(INCOME_CHANGED, self._on_income_changed)
+
+    def start(self):
+        """Remember the event loop so events published from worker threads can push"""
+        self._loop = asyncio.get_running_loop()
+
+    def get_state(self, db: Session, user_id: int, now: Optional[datetime] = None) -> NotificationState:
+        now = now or datetime.utcnow()
+        state = self.states.get(user_id)
+        if state is None or not state.is_current(now):
+            state = load_state(db, user_id, now)
+            self.states.set(user_id, state)
+            self.stats["state_loads"] += 1
+        return state
+
+    def get_notifications(self, db: Session, user) -> List[dict]:
+        """Current notifications for a user (state loaded on first use)"""
+        now = datetime.utcnow()
+        state = self.get_state(db, user.id, now)
+        with self._lock:
+            notifications = evaluate_rules(state, user, now)
+        self.stats["evaluations"] += 1
+        return notifications
+
+    def invalidate(self, user_id: int):
+        """Drop the rolling state (reloaded from the DB on next evaluation)"""
+        self.states.delete(user_id)
+
+    def get_log(self, user_id: int) -> NotificationLog:
+        log = self.logs.get(user_id)
+        if log is None:
+            log = NotificationLog()
+            self.logs.set(user_id, log)
+        return log
+
+    def _on_expense_changed(self, event: Dict[str, Any]):
+        user_id = event["user_id"]
+        state = self.states.get(user_id)
+        if state is not None:
+            now = datetime.utcnow()
+            with self._lock:
+                if not state.is_current(now) or not state.apply_expense(event, now):
+                    self.states.delete(user_id)
+            self.stats["events_applied"] += 1
+        self._schedule_push(user_id)
+
+    def _on_income_changed(self, event: Dict[str, Any]):
+        # Income rules read user.monthly_income, re-evaluated on push
+        self._schedule_push(event["user_id"])
+
+    def _schedule_push(self, user_id: int):
+        """Coalesce the events of one write (e.g. update = remove + add) into one push"""
+        from routes.websocket import active_connections
+        if user_id in self._pending:
+            return
+        if user_id not in active_connections and not notification_broker.distributed:
+            return
+        self._pending.add(user_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            loop.create_task(self._push_pending(user_id))
+        elif self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._push_pending(user_id), self._loop)
+        else:
+            self._pending.discard(user_id)
+
+    async def _push_pending(self, user_id: int):
+        # Events are delivered after commit (utils.events), so a fresh session sees the write
+        self._pending.discard(user_id)
+        from routes.websocket import active_connections
+        try:
+            if user_id in active_connections:
+                await self.push_if_changed(user_id)
+            if notification_broker.distributed:
+                # Workers holding this user's other sockets re-evaluate from the DB
+                await notification_broker.publish(user_id, {"kind": "refresh"})
+        except Exception as e:
+            print(f"⚠️ Notification push error: {e}")
+
+    async def push_if_changed(self, user_id: int, user: Optional[User] = None, db: Optional[Session] = None):
+        """Evaluate rules and broadcast a delta only if some notification changed"""
+        from routes.websocket import broadcast_notification_delta
+
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            user = user or db.query(User).filter(User.id == user_id).first()
+            if not user:
+                return
+            notifications = self.get_notifications(db, user)
+        finally:
+            if own_session:
+                db.close()
+
+        log = self.get_log(user_id)
+        ops = log.diff(notifications)
+        if not ops:
+            self.stats["unchanged_skipped"] += 1
+            return
+
+        delta = log.append(ops, notifications)
+        self.stats["pushes"] += 1
+        await broadcast_notification_delta(user_id, log, delta)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "states": len(self.states), "logs": len(self.logs)}
+
+
+# Singleton instance
+notification_engine = NotificationEngine()
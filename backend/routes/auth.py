@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import User
 from config import app
-from utils.auth import hash_password, verify_password
+from utils.auth import hash_password, verify_password, create_ws_token
 
 
 @app.post("/api/login")
@@ -37,7 +37,8 @@ async def login(
                     "xp_points": user.xp_points or 0,
                     "coins": user.coins or 0,
                     "is_premium": user.is_premium or False
-                }
+                },
+                "ws_token": create_ws_token(user.id)
             })
     
     # Check for regular users
@@ -64,12 +65,22 @@ async def login(
                 "xp_points": user.xp_points or 0,
                 "coins": user.coins or 0,
                 "is_premium": user.is_premium or False
-            }
+            },
+            "ws_token": create_ws_token(user.id)
         })
 
 
 
 
+@app.get("/api/ws-token")
+async def get_ws_token(request: Request):
+    """Fresh WebSocket token for the logged-in session (no DB lookup)"""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return JSONResponse({"success": False, "error": "Authentication required"}, status_code=401)
+    return JSONResponse({"success": True, "ws_token": create_ws_token(user_id)})
+
+
 @app.post("/api/signup")
 async def signup(
     request: Request,
@@ -0,0 +1,95 @@
+"""Dashboard bootstrap - every payload the frontend needs on load in one request"""
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import Request, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import app
+from database import get_async_db
+from utils.auth import get_current_user_profile_async
+from utils.month_summary import get_month_totals
+from forecast_service import forecast_service
+from notification_engine import notification_engine
+from routes.stats import build_user_stats
+from routes.profile import build_dashboard_data, build_dashboard_stats
+
+# Section name -> same body as the endpoint it replaces
+BOOTSTRAP_FIELDS = {
+    "stats": "/api/stats",
+    "dashboard": "/api/dashboard-data",
+    "dashboard_stats": "/api/dashboard-stats",
+    "forecast": "/api/forecast",
+    "forecast_chart": "/api/forecast-chart",
+    "notifications": "/api/notifications",
+}
+
+
+@app.get("/api/bootstrap")
+async def get_bootstrap(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma separated sections (default: all)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Dashboard açılışı üçün bütün məlumatlar bir sorğuda (fields ilə seçmək olar)"""
+    user = await get_current_user_profile_async(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    if fields:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in selected if field not in BOOTSTRAP_FIELDS]
+        if unknown:
+            return JSONResponse({
+                "error": f"Unknown fields: {', '.join(unknown)}",
+                "available_fields": list(BOOTSTRAP_FIELDS)
+            }, status_code=400)
+    else:
+        selected = list(BOOTSTRAP_FIELDS)
+
+    data = await db.run_sync(build_bootstrap, user, selected)
+    # Not 200, so the response cache never keeps a partial payload
+    return JSONResponse(data, status_code=207 if data.get("partial") else 200)
+
+
+def build_bootstrap(db: Session, user, selected: List[str]) -> dict:
+    """
+    Build the selected sections from one shared load (sync, run via AsyncSession.run_sync)
+
+    The user and the current month's rollup are read once and handed to every
+    builder; a failing section reports its error without failing the others
+    (and marks the result partial, listing the sections in failed_fields).
+    """
+    now = datetime.utcnow()
+    month_totals = get_month_totals(db, user.id, now) if set(selected) - {"notifications"} else None
+    forecast = None
+    result = {}
+
+    for field in selected:
+        try:
+            if field == "stats":
+                result[field] = {"user": build_user_stats(user, month_totals)}
+            elif field == "dashboard":
+                result[field] = build_dashboard_data(db, user, month_totals=month_totals)
+            elif field == "dashboard_stats":
+                result[field] = build_dashboard_stats(user, month_totals)
+            elif field in ("forecast", "forecast_chart"):
+                if forecast is None:
+                    forecast = forecast_service.get_forecast(user.id, db, user=user, month_totals=month_totals)
+                if field == "forecast":
+                    result[field] = forecast
+                else:
+                    points = forecast_service.get_chart_forecast_data(user.id, db, forecast=forecast)
+                    result[field] = {"forecast_points": points}
+            elif field == "notifications":
+                result[field] = {"notifications": notification_engine.get_notifications(db, user)}
+        except Exception as e:
+            print(f"❌ Bootstrap Error ({field}): {e}")
+            result[field] = {"error": str(e)}
+            result.setdefault("failed_fields", []).append(field)
+
+    if "failed_fields" in result:
+        result["partial"] = True
+    return result
@@ -1,18 +1,87 @@
 """Chat routes"""
 from fastapi import Request, Depends, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
+import json
 import math
-from database import get_db
-from models import ChatMessage
+import random
+import re
+from database import get_db, SessionLocal
+from models import ChatMessage, User
 from config import app
 from utils.auth import get_current_user
 from utils.calculations import build_db_context
-from ai_service import ai_service
+from ai_service import ai_service, ChatStreamError
 from gamification import gamification
 
 
+def format_ai_response(text: str) -> str:
+    """Convert the AI markdown subset to HTML for storage/display"""
+    # Bold text: **text** -> <strong>text</strong>
+    formatted = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+    
+    # Italic text: *text* (but not ** which is bold)
+    formatted = re.sub(r'(?<!\*)\*(?!\*)([^\*]+?)\*(?!\*)', r'<em>\1</em>', formatted)
+    
+    # Bullet points: ↑ or • at start of line -> styled bullet
+    formatted = re.sub(r'(^|\n)([↑•])\s*(.+)', r'\1<span class="chat-bullet">\2</span> \3', formatted)
+    
+    # Line breaks: convert \n to <br> for proper display
+    return formatted.replace('\n', '<br>')
+
+
+def sanitize_xp_result(xp_result) -> dict:
+    """Replace inf/nan values in an award_xp result so it serializes to JSON"""
+    def sanitize_float(value):
+        """Convert inf/nan to None or 0, ensure value is float"""
+        if value is None:
+            return None
+        try:
+            val = float(value)
+            if math.isinf(val) or math.isnan(val):
+                return None  # Return None for inf/nan instead of 0
+            return val
+        except (ValueError, TypeError):
+            return None
+    
+    sanitized_xp_result = {}
+    if xp_result:
+        for key, value in xp_result.items():
+            if key == "level_info" and isinstance(value, dict):
+                # Sanitize level_info dict
+                sanitized_level_info = {}
+                for level_key, level_value in value.items():
+                    if level_key == "max_xp":
+                        # Replace inf with None or a large number
+                        if isinstance(level_value, float) and math.isinf(level_value):
+                            sanitized_level_info[level_key] = None  # or 999999
+                        else:
+                            sanitized_level_info[level_key] = sanitize_float(level_value) if isinstance(level_value, (int, float)) else level_value
+                    elif level_key == "progress_percentage":
+                        sanitized_level_info[level_key] = sanitize_float(level_value) if isinstance(level_value, (int, float)) else level_value
+                    else:
+                        sanitized_level_info[level_key] = level_value
+                sanitized_xp_result[key] = sanitized_level_info
+            elif isinstance(value, (int, float)):
+                sanitized_xp_result[key] = sanitize_float(value)
+            else:
+                sanitized_xp_result[key] = value
+    return sanitized_xp_result
+
+
+def load_chat_history(db: Session, user_id: int) -> list:
+    """Last 10 chat messages, oldest first"""
+    recent_messages = db.query(ChatMessage).filter(
+        ChatMessage.user_id == user_id
+    ).order_by(ChatMessage.timestamp.desc()).limit(10).all()
+    
+    return [
+        {"role": msg.role, "content": msg.content}
+        for msg in reversed(recent_messages)
+    ]
+
+
 @app.post("/api/chat")
 async def send_chat_message(
     request: Request,
@@ -38,17 +107,10 @@ async def send_chat_message(
     db_context = build_db_context(db, user.id)
     
     # Get recent chat history
-    recent_messages = db.query(ChatMessage).filter(
-        ChatMessage.user_id == user.id
-    ).order_by(ChatMessage.timestamp.desc()).limit(10).all()
-    
-    chat_history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in reversed(recent_messages)
-    ]
+    chat_history = load_chat_history(db, user.id)
     
     # Get AI response with dynamic persona (force Azerbaijani replies)
-    ai_response = ai_service.chat_with_cfo(
+    ai_response = await ai_service.chat_with_cfo_async(
         message,
         db_context,
         chat_history,
@@ -57,19 +119,7 @@ async def send_chat_message(
     )
     
     # Convert markdown to HTML in AI response for better formatting
-    import re
-    
-    # Bold text: **text** -> <strong>text</strong>
-    ai_response_formatted = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', ai_response)
-    
-    # Italic text: *text* (but not ** which is bold)
-    ai_response_formatted = re.sub(r'(?<!\*)\*(?!\*)([^\*]+?)\*(?!\*)', r'<em>\1</em>', ai_response_formatted)
-    
-    # Bullet points: ↑ or • at start of line -> styled bullet
-    ai_response_formatted = re.sub(r'(^|\n)([↑•])\s*(.+)', r'\1<span class="chat-bullet">\2</span> \3', ai_response_formatted)
-    
-    # Line breaks: convert \n to <br> for proper display
-    ai_response_formatted = ai_response_formatted.replace('\n', '<br>')
+    ai_response_formatted = format_ai_response(ai_response)
     
     # Save AI response
     ai_msg = ChatMessage(
@@ -87,7 +137,6 @@ async def send_chat_message(
     # Deduct coins for non-premium users (1-2 coins per message)
     coins_deducted = 0
     if not user.is_premium:
-        import random
         coins_to_deduct = random.randint(1, 2)  # 1-2 coins randomly
         if user.coins is None:
             user.coins = 0
@@ -108,41 +157,7 @@ async def send_chat_message(
     db.refresh(user)  # Refresh to get updated XP and coins
     
     # Sanitize xp_result to handle inf values
-    def sanitize_float(value):
-        """Convert inf/nan to None or 0, ensure value is float"""
-        if value is None:
-            return None
-        try:
-            val = float(value)
-            if math.isinf(val) or math.isnan(val):
-                return None  # Return None for inf/nan instead of 0
-            return val
-        except (ValueError, TypeError):
-            return None
-    
-    # Sanitize xp_result
-    sanitized_xp_result = {}
-    if xp_result:
-        for key, value in xp_result.items():
-            if key == "level_info" and isinstance(value, dict):
-                # Sanitize level_info dict
-                sanitized_level_info = {}
-                for level_key, level_value in value.items():
-                    if level_key == "max_xp":
-                        # Replace inf with None or a large number
-                        if isinstance(level_value, float) and math.isinf(level_value):
-                            sanitized_level_info[level_key] = None  # or 999999
-                        else:
-                            sanitized_level_info[level_key] = sanitize_float(level_value) if isinstance(level_value, (int, float)) else level_value
-                    elif level_key == "progress_percentage":
-                        sanitized_level_info[level_key] = sanitize_float(level_value) if isinstance(level_value, (int, float)) else level_value
-                    else:
-                        sanitized_level_info[level_key] = level_value
-                sanitized_xp_result[key] = sanitized_level_info
-            elif isinstance(value, (int, float)):
-                sanitized_xp_result[key] = sanitize_float(value)
-            else:
-                sanitized_xp_result[key] = value
+    sanitized_xp_result = sanitize_xp_result(xp_result)
     
     # Return JSON for React frontend - return raw AI response (frontend will handle markdown rendering)
     return JSONResponse({
@@ -157,6 +172,137 @@ async def send_chat_message(
     })
 
 
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def stream_chat_message(
+    request: Request,
+    message: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Streaming variant of /api/chat (Server-Sent Events)
+
+    Events:
+        delta - {"text": raw chunk, "html": HTML of lines completed by this chunk (may be empty)}
+        done  - same payload as /api/chat plus "response_html" and "tail_html"
+                (HTML of the last, unterminated line)
+        error - {"success": False, "error": ..., "partial": text streamed so far};
+                nothing is saved for the answer and no coins are deducted
+    """
+    user = get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    # Coins are checked up front so an unaffordable message never reaches Gemini
+    coins_to_deduct = 0
+    if not user.is_premium:
+        coins_to_deduct = random.randint(1, 2)  # 1-2 coins randomly
+        coins_available = user.coins or 0
+        if coins_available < coins_to_deduct:
+            return JSONResponse({
+                "success": False,
+                "error": f"Kifayət qədər coin yoxdur. Lazım: {coins_to_deduct}, Sizin: {coins_available}",
+                "coins_required": coins_to_deduct,
+                "coins_available": coins_available
+            }, status_code=400)
+    
+    user_id = user.id
+    
+    async def event_stream():
+        # The request-scoped session may already be closed while the body streams
+        stream_db = SessionLocal()
+        try:
+            stream_user = stream_db.query(User).filter(User.id == user_id).first()
+            
+            # Save user message
+            stream_db.add(ChatMessage(
+                user_id=user_id,
+                role="user",
+                content=message,
+                timestamp=datetime.utcnow()
+            ))
+            stream_db.commit()
+            
+            db_context = build_db_context(stream_db, user_id)
+            chat_history = load_chat_history(stream_db, user_id)
+            
+            parts = []
+            pending_line = ""
+            try:
+                async for chunk in ai_service.chat_with_cfo_stream(
+                    message,
+                    db_context,
+                    chat_history,
+                    "az",
+                    stream_user
+                ):
+                    parts.append(chunk)
+                    
+                    # Format only completed lines - markdown never spans a line break
+                    pending_line += chunk
+                    html = ""
+                    if "\n" in pending_line:
+                        completed, pending_line = pending_line.rsplit("\n", 1)
+                        html = format_ai_response(completed) + "<br>"
+                    yield _sse("delta", {"text": chunk, "html": html})
+            except ChatStreamError as e:
+                # Broken answer is not saved, and no XP / coins change hands
+                yield _sse("error", {
+                    "success": False,
+                    "error": str(e),
+                    "partial": "".join(parts).strip(),
+                    "user_message": message
+                })
+                return
+            
+            ai_response = "".join(parts).strip()
+            ai_response_formatted = format_ai_response(ai_response)
+            
+            # Save AI response
+            stream_db.add(ChatMessage(
+                user_id=user_id,
+                role="ai",
+                content=ai_response_formatted,
+                timestamp=datetime.utcnow()
+            ))
+            stream_db.commit()
+            
+            # Award XP for chat interaction
+            xp_result = gamification.award_xp(stream_user, "chat_message", stream_db)
+            
+            coins_deducted = 0
+            if not stream_user.is_premium and (stream_user.coins or 0) >= coins_to_deduct:
+                stream_user.coins = (stream_user.coins or 0) - coins_to_deduct
+                coins_deducted = coins_to_deduct
+            stream_db.commit()
+            
+            sanitized_xp_result = sanitize_xp_result(xp_result)
+            yield _sse("done", {
+                "success": True,
+                "response": ai_response,
+                "response_html": ai_response_formatted,
+                "tail_html": format_ai_response(pending_line) if pending_line else "",
+                "user_message": message,
+                "xp_awarded": sanitized_xp_result.get("xp_awarded", 0) if sanitized_xp_result else 0,
+                "xp_result": sanitized_xp_result,
+                "coins_deducted": coins_deducted,
+                "coins_remaining": stream_user.coins if stream_user.coins is not None else 0,
+                "is_premium": stream_user.is_premium
+            })
+        finally:
+            stream_db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/chat-history")
 async def get_chat_history(request: Request, db: Session = Depends(get_db)):
     """Get chat history for current user"""
@@ -6,6 +6,7 @@ from database import get_db
 from models import  Expense
 from config import app
 from utils.auth import get_current_user
+from utils.month_summary import get_month_totals
 from datetime import datetime
 from math import isinf, isnan
 
@@ -38,16 +39,9 @@ async def get_dashboard_updates(request: Request, db: Session = Depends(get_db))
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
-    now = datetime.now()
-    start_of_month = datetime(now.year, now.month, 1)
+    month_totals = get_month_totals(db, user.id, datetime.now())
 
-    expenses = (
-        db.query(Expense)
-        .filter(Expense.user_id == user.id, Expense.date >= start_of_month)
-        .all()
-    )
-
-    total_spending = float(sum(e.amount for e in expenses))
+    total_spending = float(month_totals["total_spending"])
 
     monthly_budget = float(user.monthly_budget or 0)
 
@@ -61,9 +55,7 @@ async def get_dashboard_updates(request: Request, db: Session = Depends(get_db))
         budget_percentage = 0
 
     # Category totals
-    category_data = {}
-    for exp in expenses:
-        category_data[exp.category] = category_data.get(exp.category, 0) + float(exp.amount)
+    category_data = dict(month_totals["category_breakdown"])
 
     # Recent expense list
     recent_expenses = (
@@ -5,9 +5,10 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 from database import get_db
-from models import Expense, Dream, Income
+from models import Expense, Dream
 from config import app
 from utils.auth import get_current_user
+from utils.month_summary import get_month_totals, record_expense
 from gamification import gamification
 from datetime import datetime
 
@@ -246,24 +247,10 @@ async def add_dream_savings(
         raise HTTPException(status_code=404, detail="Dream not found")
 
     try:
-        # Check if user has enough balance
-        now = datetime.utcnow()
-        month_start = datetime(now.year, now.month, 1)
-
-        # Calculate current balance (all in AZN)
-        expenses = (
-            db.query(Expense)
-            .filter(Expense.user_id == user.id, Expense.date >= month_start)
-            .all()
-        )
-        incomes = (
-            db.query(Income)
-            .filter(Income.user_id == user.id, Income.date >= month_start)
-            .all()
-        )
-
-        total_spending_azn = sum(exp.amount for exp in expenses)
-        total_income_azn = sum(inc.amount for inc in incomes)
+        # Check if user has enough balance (all in AZN, from the monthly rollup)
+        month_totals = get_month_totals(db, user.id)
+        total_spending_azn = month_totals["total_spending"]
+        total_income_azn = month_totals["total_income"]
         current_balance_azn = (
             user.monthly_budget + total_income_azn - total_spending_azn
         )
@@ -306,6 +293,7 @@ async def add_dream_savings(
             notes=f"Arzuya qənaət: {dream.title}",
         )
         db.add(expense)
+        record_expense(db, expense)
 
         dream.saved_amount += actual_amount_to_deduct
 
@@ -1,6 +1,6 @@
 """Route handlers"""
-from fastapi import Request, Depends, Form, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, Response
+from fastapi import Request, Depends, Form, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, date as date_type
 from typing import Optional
@@ -9,8 +9,16 @@ import math
 from database import get_db
 from models import  Expense, Income
 from config import app
-from utils.auth import get_current_user
+from utils.auth import get_current_user, get_current_user_profile
 from utils.ai_notifications import generate_ai_notification
+from utils.category_classifier import category_classifier
+from utils.month_summary import (
+    snapshot_expense,
+    record_expense,
+    record_expense_update,
+    record_expense_removed,
+    record_income,
+)
 
 from gamification import gamification
 from forecast_service import forecast_service
@@ -35,9 +43,11 @@ async def update_expense(
         raise HTTPException(status_code=404, detail="Expense not found")
     
     try:
+        previous = snapshot_expense(expense)
         expense.merchant = merchant
         expense.amount = amount
         expense.category = category if category else (expense.category or "Digər")  # Keep existing or default to "Digər"
+        record_expense_update(db, expense, previous)
         
         db.commit()
         db.refresh(expense)
@@ -140,14 +150,7 @@ async def confirm_voice_expense(
             date=datetime.utcnow()
         )
         db.add(expense)
-        db.commit()
-        
-        # Award XP - Fixed to 15 XP for voice commands
-        xp_result = gamification.award_xp(user, "voice_command", db)
-        db.refresh(user)
-        
-        # Always award 15 XP for voice commands
-        xp_awarded = 15
+        record_expense(db, expense)
         
         # Award FinMate Coins for voice expense
         # Base: 10 coins, plus bonus based on amount
@@ -160,8 +163,12 @@ async def confirm_voice_expense(
         if user.coins is None:
             user.coins = 0
         user.coins += coins_to_award
-        db.commit()
-        db.refresh(user)
+        
+        # Award XP - Fixed to 15 XP for voice commands (one commit for expense, coins and XP)
+        xp_result = gamification.award_xp(user, "voice_command", db)
+        
+        # Always award 15 XP for voice commands
+        xp_awarded = 15
         
         # Send real-time notification via WebSocket - AI bildirişi
         try:
@@ -254,12 +261,12 @@ async def confirm_voice_expense(
 @app.get("/api/forecast")
 async def get_forecast_endpoint(request: Request, db: Session = Depends(get_db)):
     """Get spending forecast for current month"""
-    user = get_current_user(request, db)
+    user = get_current_user_profile(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
     try:
-        forecast = forecast_service.get_forecast(user.id, db)
+        forecast = forecast_service.get_forecast(user.id, db, user=user)
         return JSONResponse(forecast)
     except Exception as e:
         print(f"❌ Forecast Error: {e}")
@@ -269,7 +276,7 @@ async def get_forecast_endpoint(request: Request, db: Session = Depends(get_db))
 @app.get("/api/forecast-chart")
 async def get_forecast_chart_endpoint(request: Request, db: Session = Depends(get_db)):
     """Get forecast data points for chart"""
-    user = get_current_user(request, db)
+    user = get_current_user_profile(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
@@ -317,6 +324,68 @@ async def text_to_speech(
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 
+@app.get("/api/tts/stream")
+async def text_to_speech_stream(
+    text: str = Query(..., max_length=2000),
+    language: str = Query("az"),
+    rate: str = Query("+0%"),
+    pitch: str = Query("+0Hz"),
+    volume: str = Query("+0%")
+):
+    """
+    Stream TTS audio as chunked audio/mpeg - usable directly as an <audio> src
+
+    Playback can start on the first chunk; no temp file and no base64 copy.
+    """
+    audio_stream = voice_service.stream_voice_response(
+        text, language, rate=rate, pitch=pitch, volume=volume
+    )
+    
+    # Pull the first chunk before answering so failures still return a JSON error
+    try:
+        first_chunk = await audio_stream.__anext__()
+    except StopAsyncIteration:
+        return JSONResponse({"success": False, "error": "TTS failed"}, status_code=500)
+    except Exception as e:
+        print(f"❌ TTS Stream Error: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    
+    async def audio_chunks():
+        yield first_chunk
+        try:
+            async for chunk in audio_stream:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent - the client just sees a truncated stream
+            print(f"❌ TTS Stream Error: {e}")
+    
+    return StreamingResponse(
+        audio_chunks(),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+
+
+@app.get("/api/suggest-category")
+async def suggest_category(
+    request: Request,
+    merchant: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(3, ge=1, le=10),
+    db: Session = Depends(get_db)
+):
+    """Merchant adına görə kateqoriya təklifi (autocomplete üçün, LLM-siz)"""
+    user = get_current_user_profile(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    suggestions = category_classifier.predict(db, user.id, merchant, limit=limit)
+    return JSONResponse({
+        "merchant": merchant,
+        "suggestions": suggestions,
+        "category": suggestions[0]["category"] if suggestions else None
+    })
 
 
 # Import WebSocket notification function (circular import-u qarşısını almaq üçün lazy import)
@@ -353,6 +422,7 @@ async def add_manual_expense(
             date=datetime.utcnow()
         )
         db.add(expense)
+        record_expense(db, expense)
         db.commit()
         db.refresh(expense)
         
@@ -511,21 +581,10 @@ async def delete_expense(request: Request, expense_id: int, db: Session = Depend
         if user.coins and user.coins > 0:
             user.coins -= 1
             
+        record_expense_removed(db, expense)
         db.delete(expense)
         db.commit()
-        
-        # Send real-time notification via WebSocket
-        try:
-            from routes.websocket import send_notification_to_user, generate_notifications_for_user
-            notifications = await generate_notifications_for_user(user, db)
-            await send_notification_to_user(user.id, {
-                "type": "notifications",
-                "notifications": notifications,
-                "count": len(notifications),
-                "trigger": "expense_deleted"
-            })
-        except Exception as ws_error:
-            print(f"WebSocket notification error: {ws_error}")
+        # Notification list is pushed by notification_engine (EXPENSE_CHANGED) if it changed
         
         # Return response with HX-Refresh header to reload page and recalculate totals
         return Response(
@@ -621,6 +680,7 @@ async def add_income(
         print(f"   Creating Income record: {amount} {source} on {income_date}")
         
         db.add(income)
+        record_income(db, income)
         db.commit()
         db.refresh(income)
         db.refresh(user)
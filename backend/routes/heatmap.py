@@ -6,7 +6,7 @@ from datetime import datetime
 from database import get_db
 from models import Expense
 from config import app
-from utils.auth import get_current_user
+from utils.auth import get_current_user_profile
 from utils.calculations import pseudo_coords_for_merchant
 
 @app.get("/heatmap")
@@ -20,7 +20,7 @@ async def heatmap_page(request: Request, db: Session = Depends(get_db)):
 @app.get("/api/heatmap")
 async def get_heatmap_data(request: Request, db: Session = Depends(get_db)):
     """Get heatmap data - JSON for React frontend"""
-    user = get_current_user(request, db)
+    user = get_current_user_profile(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
@@ -55,7 +55,7 @@ async def get_heatmap_data(request: Request, db: Session = Depends(get_db)):
 @app.get("/api/ghost-subscriptions")
 async def ghost_subscriptions(request: Request, db: Session = Depends(get_db)):
     """Detect potential hidden subscriptions"""
-    user = get_current_user(request, db)
+    user = get_current_user_profile(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     now = datetime.utcnow()
@@ -2,19 +2,33 @@
 from fastapi import Request, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse, RedirectResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func
 from datetime import datetime, timedelta, date as date_type
 from typing import Optional
 import math
 from config import app
-from database import get_db
+from database import get_db, get_async_db
 from models import Expense, XPLog, Income
-from utils.auth import get_current_user
+from utils.auth import get_current_user, get_current_user_async
 from utils.calculations import (
     detect_financial_personality, 
 )
+from utils.aggregations import (
+    expense_summary,
+    category_totals,
+    income_by_source,
+    subscription_total,
+    week_total,
+    day_bounds,
+    today_total as today_expense_total,
+)
+from utils.month_summary import get_month_totals
 from gamification import gamification
 
+# Income sources treated as salary
+SALARY_SOURCES = ["maaş", "salary", "maas"]
+
 @app.get("/profile")
 async def profile_page(request: Request, db: Session = Depends(get_db)):
     """User profile page"""
@@ -174,13 +188,35 @@ async def get_dashboard_data(
     year: Optional[str] = Query(None, description="Year filter: YYYY"),
     start_date: Optional[str] = Query(None, description="Range start: YYYY-MM-DD"),
     end_date: Optional[str] = Query(None, description="Range end: YYYY-MM-DD"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """API endpoint for dashboard data - React frontend üçün"""
-    user = get_current_user(request, db)
+    user = await get_current_user_async(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
-    
+
+    data = await db.run_sync(
+        build_dashboard_data, user, date, month, year, start_date, end_date
+    )
+    return JSONResponse(data)
+
+
+def build_dashboard_data(
+    db: Session,
+    user,
+    date: Optional[str] = None,
+    month: Optional[str] = None,
+    year: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    month_totals: Optional[dict] = None
+) -> dict:
+    """
+    Build dashboard payload (sync, run via AsyncSession.run_sync)
+
+    month_totals: current month's rollup, if the caller already has it - used for
+    the unfiltered (current month) window instead of re-aggregating expenses
+    """
     # Sanitize all float values to prevent inf/nan JSON serialization errors
     def sanitize_float(value):
         """Convert inf/nan to 0.0, ensure value is float"""
@@ -194,47 +230,21 @@ async def get_dashboard_data(
         except (ValueError, TypeError):
             return 0.0
     
-    # Get current month's expenses (or filtered by date/month/year)
+    # Resolve the selected window (default: current month)
     now = datetime.utcnow()
-    
-    # Initialize filter variables
-    day_start = None
-    day_end = None
-    month_start = datetime(now.year, now.month, 1)  # Default
-    month_end = None
-    year_start = None
-    year_end = None
+    month_start = datetime(now.year, now.month, 1)
+    window_start = month_start
+    window_end = None
     
     # Filter by day, month, or year
     if date:
         # Filter by specific day
         try:
             filter_date = datetime.strptime(date, "%Y-%m-%d").date()
-            day_start = datetime.combine(filter_date, datetime.min.time())
-            day_end = datetime.combine(filter_date, datetime.max.time())
-            
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= day_start,
-                Expense.date <= day_end
-            ).all()
-            
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= day_start,
-                Income.date <= day_end
-            ).all()
+            window_start, window_end = day_bounds(filter_date)
         except ValueError:
             # Invalid date format, fall back to current month
-            month_start = datetime(now.year, now.month, 1)
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start
-            ).all()
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= month_start
-            ).all()
+            pass
     elif month:
         # Filter by specific month
         try:
@@ -245,106 +255,45 @@ async def get_dashboard_data(
                 month_end = datetime(year + 1, 1, 1) - timedelta(days=1)
             else:
                 month_end = datetime(year, month_num + 1, 1) - timedelta(days=1)
-            month_end = datetime.combine(month_end, datetime.max.time())
-            
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end
-            ).all()
-            
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= month_start,
-                Income.date <= month_end
-            ).all()
+            window_start = month_start
+            window_end = datetime.combine(month_end, datetime.max.time())
         except (ValueError, IndexError):
             # Invalid month format, fall back to current month
             month_start = datetime(now.year, now.month, 1)
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start
-            ).all()
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= month_start
-            ).all()
     elif year:
         # Filter by specific year
         try:
             year_num = int(year)
-            year_start = datetime(year_num, 1, 1)
-            year_end = datetime(year_num, 12, 31, 23, 59, 59)
-            
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= year_start,
-                Expense.date <= year_end
-            ).all()
-            
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= year_start,
-                Income.date <= year_end
-            ).all()
+            window_start = datetime(year_num, 1, 1)
+            window_end = datetime(year_num, 12, 31, 23, 59, 59)
         except ValueError:
             # Invalid year format, fall back to current month
-            month_start = datetime(now.year, now.month, 1)
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start
-            ).all()
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= month_start
-            ).all()
+            pass
     elif start_date and end_date:
         # Filter by date range
         try:
             start_dt = datetime.strptime(start_date, "%Y-%m-%d")
             end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            # Set start to beginning of day
-            start_dt = datetime.combine(start_dt.date(), datetime.min.time())
-            # Set end to end of day
-            end_dt = datetime.combine(end_dt.date(), datetime.max.time())
-            
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= start_dt,
-                Expense.date <= end_dt
-            ).all()
-            
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= start_dt,
-                Income.date <= end_dt
-            ).all()
+            # Start of first day, end of last day
+            window_start = datetime.combine(start_dt.date(), datetime.min.time())
+            window_end = datetime.combine(end_dt.date(), datetime.max.time())
         except ValueError:
             # Invalid date format, fall back to current month
-            month_start = datetime(now.year, now.month, 1)
-            expenses = db.query(Expense).filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start
-            ).all()
-            incomes = db.query(Income).filter(
-                Income.user_id == user.id,
-                Income.date >= month_start
-            ).all()
+            pass
+    
+    # Aggregate in SQL - no ORM rows are loaded for the window
+    if month_totals is not None and not (date or month or year or (start_date and end_date)):
+        expense_stats = {"total": month_totals["total_spending"], "count": month_totals["expense_count"]}
+        category_data = dict(month_totals["category_breakdown"])
+        incomes_by_source = dict(month_totals["income_by_source"])
     else:
-        # Default: current month
-        month_start = datetime(now.year, now.month, 1)
-        expenses = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.date >= month_start
-        ).all()
-        incomes = db.query(Income).filter(
-            Income.user_id == user.id,
-            Income.date >= month_start
-        ).all()
+        expense_stats = expense_summary(db, user.id, window_start, window_end)
+        category_data = category_totals(db, user.id, window_start, window_end)
+        incomes_by_source = income_by_source(db, user.id, window_start, window_end)
     
     # Calculate stats (all amounts are stored in AZN)
-    total_spending_azn = sum(exp.amount for exp in expenses)
-    total_income_azn = sum(inc.amount for inc in incomes)
+    total_spending_azn = expense_stats["total"]
+    total_income_azn = sum(incomes_by_source.values())
     total_available_azn = user.monthly_budget + total_income_azn - total_spending_azn
     effective_budget_azn = user.monthly_budget + total_income_azn
     
@@ -354,13 +303,6 @@ async def get_dashboard_data(
     monthly_budget_display = effective_budget_azn
     remaining_budget = effective_budget_azn - total_spending_azn
     
-    # Category breakdown
-    category_data = {}
-    for exp in expenses:
-        if exp.category not in category_data:
-            category_data[exp.category] = 0
-        category_data[exp.category] += exp.amount
-    
     # Chart data
     chart_labels = list(category_data.keys())
     chart_values = list(category_data.values())
@@ -374,7 +316,7 @@ async def get_dashboard_data(
             "total": category_data[top_category_name]
         }
     
-    # Recent expenses (last 10) - includes both expenses and incomes
+    # Recent expenses (last 10) - the only rows we actually hydrate
     recent_expenses = db.query(Expense).filter(
         Expense.user_id == user.id
     ).order_by(Expense.created_at.desc()).limit(10).all()
@@ -386,46 +328,10 @@ async def get_dashboard_data(
     ).order_by(Income.created_at.desc(), Income.date.desc()).limit(10).all()
     
     # Last week total
-    week_ago = now - timedelta(days=7)
-    last_week_expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= week_ago
-    ).all()
-    last_week_total = sum(exp.amount for exp in last_week_expenses)
+    last_week_total = week_total(db, user.id, now)
     
-    # Subscriptions total - use the same filter as expenses
-    # For day filter, get subscriptions for that day
-    # For month filter, get subscriptions for that month
-    # For year filter, get subscriptions for that year
-    # For default, get subscriptions for current month
-    if date:
-        subscriptions = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.is_subscription == True,
-            Expense.date >= day_start,
-            Expense.date <= day_end
-        ).all()
-    elif month:
-        subscriptions = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.is_subscription == True,
-            Expense.date >= month_start,
-            Expense.date <= month_end
-        ).all()
-    elif year:
-        subscriptions = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.is_subscription == True,
-            Expense.date >= year_start,
-            Expense.date <= year_end
-        ).all()
-    else:
-        subscriptions = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.is_subscription == True,
-            Expense.date >= month_start
-        ).all()
-    subscriptions_total = sum(sub.amount for sub in subscriptions)
+    # Subscriptions total - same window as expenses
+    subscriptions_total = subscription_total(db, user.id, window_start, window_end)
     
     # Format recent expenses and incomes together
     recents = []
@@ -517,20 +423,16 @@ async def get_dashboard_data(
     # Calculate salary increase (compare to previous month)
     salary_increase_info = None
     current_month_salary = None
-    current_salary_incomes = [inc for inc in incomes if inc.source.lower() in ["maaş", "salary", "maas"]]
-    if current_salary_incomes:
-        current_month_salary = sum(inc.amount for inc in current_salary_incomes)
+    current_salary_sources = [source for source in incomes_by_source if source.lower() in SALARY_SOURCES]
+    if current_salary_sources:
+        current_month_salary = sum(incomes_by_source[source] for source in current_salary_sources)
         prev_month = month_start - timedelta(days=1)
         prev_month_start = datetime(prev_month.year, prev_month.month, 1)
-        prev_month_end = month_start
-        prev_salary_incomes = db.query(Income).filter(
-            Income.user_id == user.id,
-            Income.date >= prev_month_start,
-            Income.date < prev_month_end
-        ).all()
-        prev_salary_list = [inc for inc in prev_salary_incomes if inc.source.lower() in ["maaş", "salary", "maas"]]
+        prev_month_end = month_start - timedelta(microseconds=1)
+        prev_incomes_by_source = income_by_source(db, user.id, prev_month_start, prev_month_end)
+        prev_salary_list = [amount for source, amount in prev_incomes_by_source.items() if source.lower() in SALARY_SOURCES]
         if prev_salary_list:
-            prev_month_salary = sum(inc.amount for inc in prev_salary_list)
+            prev_month_salary = sum(prev_salary_list)
             if prev_month_salary > 0 and current_month_salary > prev_month_salary:
                 increase_amount = current_month_salary - prev_month_salary
                 increase_percentage = (increase_amount / prev_month_salary) * 100
@@ -544,13 +446,7 @@ async def get_dashboard_data(
     # Check daily budget limit
     daily_limit_alert = None
     if user.daily_budget_limit:
-        today = date_type.today()
-        today_expenses = db.query(Expense).filter(
-            Expense.user_id == user.id,
-            Expense.date >= today,
-            Expense.date < today + timedelta(days=1)
-        ).all()
-        today_total = sum(exp.amount for exp in today_expenses)
+        today_total = today_expense_total(db, user.id)
         today_total_rounded = round(today_total, 2)
         limit_rounded = round(user.daily_budget_limit, 2)
         if today_total_rounded > limit_rounded:
@@ -577,7 +473,7 @@ async def get_dashboard_data(
         merchant = expense.merchant
         amount = expense.amount
         is_expensive = any(exp_merchant.lower() in merchant.lower() for exp_merchant in expensive_merchants)
-        avg_amount = sanitize_float(total_spending_azn / len(expenses) if expenses else 0)
+        avg_amount = sanitize_float(total_spending_azn / expense_stats["count"] if expense_stats["count"] else 0)
         is_above_avg = amount > avg_amount * 1.5 if avg_amount > 0 else False
         if is_expensive or is_above_avg:
             alternatives = find_local_gems(merchant, amount, expense.category)
@@ -643,7 +539,7 @@ async def get_dashboard_data(
             if key in daily_limit_alert:
                 daily_limit_alert[key] = sanitize_float(daily_limit_alert[key])
     
-    return JSONResponse({
+    return {
         "context": {
             "total_spend": sanitize_float(total_spending),
             "budget": sanitize_float(monthly_budget_display),
@@ -670,45 +566,39 @@ async def get_dashboard_data(
         "chart_labels": chart_labels,
         "chart_values": sanitized_chart_values,
         "top_category": top_category
-    })
+    }
 
 
 @app.get("/api/dashboard-stats")
-async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
+async def get_dashboard_stats(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get dashboard stats for auto-update"""
-    user = get_current_user(request, db)
+    user = await get_current_user_async(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    # Get current month's expenses
+    # Get current month's totals from the monthly rollup
     now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
-    
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= month_start
-    ).all()
-    
-    # Get current month's incomes
-    incomes = db.query(Income).filter(
-        Income.user_id == user.id,
-        Income.date >= month_start
-    ).all()
+    month_totals = await db.run_sync(get_month_totals, user.id, now)
     
     # Debug logging for income calculation
     print(f"\n📊 Dashboard Stats Debug - User: {user.id} ({user.username})")
     print(f"   Current time (UTC): {now}")
-    print(f"   Month start: {month_start}")
-    print(f"   Found {len(incomes)} income(s) this month")
-    for inc in incomes:
-        print(f"     - {inc.source}: {inc.amount} AZN on {inc.date}")
+    for source, amount in month_totals["income_by_source"].items():
+        print(f"     - {source}: {amount} AZN")
+    
+    print(f"   Total income (AZN): {month_totals['total_income']}")
+    print(f"   Total spending (AZN): {month_totals['total_spending']}")
     
+    # Return JSON for React frontend
+    return JSONResponse(build_dashboard_stats(user, month_totals))
+
+
+def build_dashboard_stats(user, month_totals: dict) -> dict:
+    """Dashboard stats payload from the current month's rollup totals"""
     # Calculate stats (all amounts are stored in AZN)
-    total_spending_azn = sum(exp.amount for exp in expenses)
-    total_income_azn = sum(inc.amount for inc in incomes)
+    total_spending_azn = month_totals["total_spending"]
+    total_income_azn = month_totals["total_income"]
     
-    print(f"   Total income (AZN): {total_income_azn}")
-    print(f"   Total spending (AZN): {total_spending_azn}")
     total_available_azn = user.monthly_budget + total_income_azn - total_spending_azn
     effective_budget_azn = user.monthly_budget + total_income_azn  # Base budget + Extra income
     
@@ -737,8 +627,7 @@ async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
         except (ValueError, TypeError):
             return 0.0
     
-    # Return JSON for React frontend
-    return JSONResponse({
+    return {
         "total_spending": sanitize_float(total_spending),
         "total_income": sanitize_float(total_income),
         "monthly_income_display": sanitize_float(monthly_income_display),
@@ -747,6 +636,6 @@ async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
         "total_available": sanitize_float(total_available),
         "budget_percentage": sanitize_float(budget_percentage),
         "currency": "AZN"
-    })
+    }
 
 
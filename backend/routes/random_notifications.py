@@ -1,12 +1,20 @@
 """Random notifications scheduler - Ayrı vaxtda random bildirişlər göndərir"""
 import asyncio
-from datetime import datetime
-from sqlalchemy.orm import Session
-from database import get_db
+import os
+import time
+from typing import List, Set
 from models import User
-from routes.websocket import send_notification_to_user, active_connections
+from routes.websocket import send_notification_to_user
+from notification_broker import notification_broker
+from utils.timer_wheel import TimerWheel
 import random
 
+RANDOM_NOTIFICATION_INTERVAL = 600  # 10 dəqiqə
+RANDOM_NOTIFICATION_TICK = int(os.getenv("RANDOM_NOTIFICATION_TICK", "5"))  # Wheel tick (saniyə)
+RANDOM_SEND_CONCURRENCY = int(os.getenv("RANDOM_SEND_CONCURRENCY", "50"))
+LEADER_RENEW_SECONDS = 30
+PRESENCE_REFRESH_SECONDS = 60
+
 # Random təkliflər siyahısı
 RANDOM_SUGGESTIONS = [
     {
@@ -51,39 +59,129 @@ RANDOM_SUGGESTIONS = [
     }
 ]
 
-async def send_random_notifications():
-    """Hər 10 dəqiqədə bir random bildiriş göndər (yalnız aktiv WebSocket connection-lar üçün)"""
-    from database import SessionLocal
-    
-    while True:
+class RandomNotificationScheduler:
+    """
+    Hər istifadəçi üçün bir timer wheel slotu - göndərişlər interval boyunca bərabər paylanır
+
+    The wheel ticks every RANDOM_NOTIFICATION_TICK seconds; each online user fires once
+    per interval in the slot its id hashes to, so every tick touches ~N/slots users.
+    Due users are loaded with one IN query and sent to with bounded concurrency.
+    """
+
+    def __init__(self):
+        self.wheel = TimerWheel(max(1, RANDOM_NOTIFICATION_INTERVAL // RANDOM_NOTIFICATION_TICK))
+        self.online: Set[int] = set()
+        self.is_leader = False
+        self._last_leader_check = 0.0
+        self._last_presence_refresh = 0.0
+        self._semaphore = asyncio.Semaphore(RANDOM_SEND_CONCURRENCY)
+        self.stats = {"ticks": 0, "due": 0, "sent": 0, "skipped_offline": 0, "errors": 0}
+
+    async def _refresh_leadership(self, now: float):
+        if now - self._last_leader_check < LEADER_RENEW_SECONDS:
+            return
+        self._last_leader_check = now
+        # Renewed every LEADER_RENEW_SECONDS, so a dead leader is replaced within the TTL
+        self.is_leader = await notification_broker.acquire_leadership(
+            "random_notifications", ttl=LEADER_RENEW_SECONDS * 3
+        )
+
+    async def _refresh_presence(self, now: float):
+        if now - self._last_presence_refresh < PRESENCE_REFRESH_SECONDS:
+            return
+        self._last_presence_refresh = now
+        self.online = await notification_broker.online_users()
+        for user_id in self.online:
+            if user_id not in self.wheel:
+                # Stable per-user offset spreads users over the whole interval
+                self.wheel.schedule(user_id, 1 + user_id % self.wheel.size)
+
+    async def _send(self, user_id: int):
+        async with self._semaphore:
+            try:
+                # Random təklif seç və WebSocket vasitəsilə göndər
+                await send_notification_to_user(user_id, {
+                    "type": "new_notification",
+                    "notification": random.choice(RANDOM_SUGGESTIONS)
+                })
+                self.stats["sent"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Random notification error: {e}")
+
+    def _load_existing_users(self, user_ids: List[int]) -> List[int]:
+        """One IN query per tick instead of one query per user"""
+        from database import SessionLocal
+        db = SessionLocal()
         try:
-            await asyncio.sleep(600)  # 10 dəqiqə gözlə
-            
-            # Aktiv connection-lar üçün random bildiriş göndər
-            if active_connections:
-                db = SessionLocal()
-                try:
-                    for user_id in list(active_connections.keys()):
-                        # Yalnız 20% ehtimalla göndər (çox tez-tez gəlməsin)
-                        if random.random() < 0.2:
-                            user = db.query(User).filter(User.id == user_id).first()
-                            if user:
-                                # Random təklif seç
-                                selected_suggestion = random.choice(RANDOM_SUGGESTIONS)
-                                
-                                # WebSocket vasitəsilə göndər
-                                await send_notification_to_user(user_id, {
-                                    "type": "new_notification",
-                                    "notification": selected_suggestion
-                                })
-                finally:
-                    db.close()
-        except Exception as e:
-            print(f"Random notification error: {e}")
-            await asyncio.sleep(60)  # Xəta olduqda 1 dəqiqə gözlə
+            return [row.id for row in db.query(User.id).filter(User.id.in_(user_ids)).all()]
+        finally:
+            db.close()
+
+    async def tick(self):
+        now = time.monotonic()
+        self.stats["ticks"] += 1
+        await self._refresh_leadership(now)
+        due = self.wheel.advance()
+        if not self.is_leader:
+            if len(self.wheel):
+                # Lost leadership - the new leader owns the schedule
+                self.wheel = TimerWheel(self.wheel.size)
+                self.online = set()
+                self._last_presence_refresh = 0.0
+            return
+        await self._refresh_presence(now)
+
+        selected = []
+        for user_id in due:
+            if user_id not in self.online:
+                self.stats["skipped_offline"] += 1
+                continue
+            self.wheel.schedule(user_id, self.wheel.size)  # Next turn - one interval later
+            # Yalnız 20% ehtimalla göndər (çox tez-tez gəlməsin)
+            if random.random() < 0.2:
+                selected.append(user_id)
+        self.stats["due"] += len(due)
+
+        if selected:
+            # Sync query - keep it off the event loop
+            user_ids = await asyncio.to_thread(self._load_existing_users, selected)
+            await asyncio.gather(*(self._send(user_id) for user_id in user_ids))
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.sleep(RANDOM_NOTIFICATION_TICK)
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Random notification error: {e}")
+                await asyncio.sleep(60)  # Xəta olduqda 1 dəqiqə gözlə
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "is_leader": self.is_leader,
+            "scheduled": len(self.wheel),
+            "online": len(self.online),
+            "slots": self.wheel.size,
+        }
+
+
+random_notification_scheduler = RandomNotificationScheduler()
+
+
+async def send_random_notifications():
+    """Hər 10 dəqiqədə hər online istifadəçiyə (20% ehtimalla) random bildiriş göndər
+
+    Bir neçə worker olduqda yalnız leader worker göndərir; online istifadəçilər
+    broker-in presence məlumatından (bütün worker-lər üzrə) götürülür.
+    """
+    await random_notification_scheduler.run()
 
 # Background task kimi başlat
 def start_random_notifications():
     """Random bildirişlər task-ını başlat"""
     asyncio.create_task(send_random_notifications())
-
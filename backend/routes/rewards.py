@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import UserReward
 from config import app
-from utils.auth import get_current_user
+from utils.auth import get_current_user, invalidate_user_cache
 
 @app.get("/rewards")
 def rewards_page(request: Request, db: Session = Depends(get_db)):
@@ -98,6 +98,7 @@ async def claim_reward(
     )
     db.add(claimed_reward)
     db.commit()
+    invalidate_user_cache(user.id)
     db.refresh(user)
     
     return JSONResponse({
@@ -1,24 +1,52 @@
 """Scan/Receipt routes"""
-from fastapi import Request, Depends, Form, UploadFile, File, HTTPException
+from fastapi import Request, Depends, Form, UploadFile, File, HTTPException, Query
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, date as date_type, timezone
-from database import get_db
-from models import  Expense
+from typing import Optional
+import asyncio
+import copy
+import os
+from sqlalchemy.exc import IntegrityError
+from database import get_db, SessionLocal
+from models import  Expense, User, ReceiptScan
 from config import app
 from utils.auth import get_current_user
 from utils.ai_notifications import generate_ai_notification
+from utils.month_summary import record_expense
+from utils.image_processing import store_receipt_upload
+from utils.category_classifier import category_classifier
 from ai_service import ai_service
 from gamification import gamification
+from job_queue import job_queue
+
+# Queue scans by default (clients can override per request with ?background=)
+SCAN_QUEUE_MODE = os.getenv("SCAN_QUEUE_MODE", "0") == "1"
+
+
+def scan_error_payload(error: Exception) -> dict:
+    """Payload returned when a scan fails unexpectedly"""
+    return {
+        "success": False,
+        "receipt_data": {
+            "error": f"Xəta baş verdi: {str(error)}",
+            "items": [],
+            "merchant": "Error",
+            "total": 0.0,
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "suggested_category": "Error"
+        }
+    }
 
 
 @app.post("/api/scan-receipt")
 async def scan_receipt(
     request: Request,
     file: UploadFile = File(...),
+    background: Optional[bool] = Query(None, description="Queue the scan; the result is pushed over /ws/notifications"),
     db: Session = Depends(get_db)
 ):
-    """Process uploaded receipt image"""
+    """Process uploaded receipt image (inline, or as a background job)"""
     user = get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -39,14 +67,188 @@ async def scan_receipt(
     # Always return JSON for React frontend
     
     try:
-        # Save uploaded file
-        file_path = f"static/uploads/{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Downscale/recompress and save under the content hash (Pillow work runs off the loop)
+        content = await file.read()
+        file_path, receipt_hash = await asyncio.to_thread(
+            store_receipt_upload, content, file.filename
+        )
+    except Exception as e:
+        return JSONResponse(scan_error_payload(e))
+    
+    # Get client date/time from request headers (browser's local time)
+    client_date_str = request.headers.get("X-Client-Date", None)
+    
+    use_queue = SCAN_QUEUE_MODE if background is None else background
+    if use_queue:
+        job_id = await job_queue.submit(
+            "scan_receipt",
+            user.id,
+            {
+                "file_path": file_path,
+                "client_date": client_date_str,
+                "content_hash": receipt_hash,
+                "original_name": file.filename
+            }
+        )
+        if job_id:
+            return JSONResponse({
+                "success": True,
+                "queued": True,
+                "job_id": job_id,
+                "status": "queued"
+            }, status_code=202)
+        # Queue is full - process inline instead of rejecting the upload
+        print("⚠️ Scan job queue full, processing receipt inline")
+    
+    return JSONResponse(await process_receipt(
+        db, user, file_path, client_date_str, receipt_hash, file.filename
+    ))
+
+
+async def run_scan_job(job: dict) -> dict:
+    """Job worker: process a queued receipt with its own session and push the result"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == job["user_id"]).first()
+        if not user:
+            raise ValueError("User not found")
+        payload = job["payload"]
+        result = await process_receipt(
+            db, user, payload["file_path"], payload["client_date"],
+            payload.get("content_hash"), payload.get("original_name")
+        )
+    finally:
+        db.close()
+    
+    try:
+        from routes.websocket import send_notification_to_user
+        await send_notification_to_user(job["user_id"], {
+            "type": "scan_job_completed",
+            "job_id": job["id"],
+            "result": result
+        })
+    except Exception as ws_error:
+        print(f"WebSocket notification error: {ws_error}")
+    
+    return result
+
+
+job_queue.register_handler("scan_receipt", run_scan_job)
+
+
+@app.get("/api/scan-jobs/{job_id}")
+async def get_scan_job(job_id: str, request: Request, db: Session = Depends(get_db)):
+    """Status/result of a queued receipt scan (fallback for clients without WebSocket)"""
+    user = get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    job = await job_queue.get(job_id)
+    if not job or job["user_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JSONResponse(job_queue.public_view(job))
+
+
+def duplicate_scan_payload(user, receipt_data: dict, expense: Expense) -> dict:
+    """Response for a photo that was already scanned and saved (nothing new is written)"""
+    receipt_data["merchant"] = expense.merchant
+    receipt_data["total"] = float(expense.amount or 0.0)
+    receipt_data["suggested_category"] = expense.category
+    receipt_data["currency"] = "AZN"
+    if expense.date:
+        receipt_data["date"] = expense.date.strftime("%d.%m.%Y")
+        receipt_data["time"] = expense.date.strftime("%H:%M")
+        receipt_data["date_time"] = expense.date.strftime("%d.%m.%Y, %H:%M")
+    return {
+        "success": True,
+        "receipt_data": receipt_data,
+        "conversion_note": "Bu qəbz artıq əlavə edilib - yeni xərc yaradılmadı.",
+        "expense_id": expense.id,
+        "xp_result": {
+            "xp_awarded": 0,
+            "new_total": user.xp_points,
+            "level_up": False,
+            "new_level": None,
+            "level_info": None,
+            "coins_awarded": 0,
+        },
+        "coins": user.coins,
+        "milestone_reached": None,
+        "daily_limit_alert": None,
+        "remaining_tokens": user.ai_tokens if not user.is_premium else None,
+        "duplicate_scan": True
+    }
+
+
+def is_cacheable_receipt(receipt_data: dict) -> bool:
+    """Only real, successfully extracted receipts are reused for duplicate uploads"""
+    return (
+        isinstance(receipt_data, dict)
+        and receipt_data.get("is_receipt", True)
+        and "error" not in receipt_data
+        and "note" not in receipt_data  # Offline/fallback result
+        and float(receipt_data.get("total") or 0) > 0
+    )
+
+
+async def process_receipt(
+    db: Session,
+    user,
+    file_path: str,
+    client_date_str: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    original_name: Optional[str] = None
+) -> dict:
+    """
+    Analyze a saved receipt image and save it as an expense
+
+    Shared by the inline /api/scan-receipt path and the scan job worker.
+    client_date_str is the browser's X-Client-Date header (used when the receipt has no date).
+    A known content_hash reuses the cached extraction instead of calling the AI again.
+    Returns the JSON payload for the client.
+    """
+    try:
+        cached_scan = None
+        if content_hash:
+            cached_scan = db.query(ReceiptScan).filter(
+                ReceiptScan.user_id == user.id,
+                ReceiptScan.content_hash == content_hash
+            ).first()
         
-        # Analyze receipt with AI
-        receipt_data = ai_service.analyze_receipt(file_path)
+        scan_row = cached_scan  # Linked to the expense saved below
+        if cached_scan:
+            # Duplicate upload - same photo was already analyzed
+            receipt_data = copy.deepcopy(cached_scan.receipt_data)
+            from_cache = True
+            existing_expense = None
+            if cached_scan.expense_id:
+                existing_expense = db.query(Expense).filter(
+                    Expense.id == cached_scan.expense_id,
+                    Expense.user_id == user.id
+                ).first()
+            if existing_expense:
+                # Already saved - no second expense, no XP / coins
+                return duplicate_scan_payload(user, receipt_data, existing_expense)
+        else:
+            # Analyze receipt with AI
+            receipt_data = await ai_service.analyze_receipt_async(file_path, original_name)
+            from_cache = False
+            
+            if content_hash and is_cacheable_receipt(receipt_data):
+                try:
+                    scan_row = ReceiptScan(
+                        user_id=user.id,
+                        content_hash=content_hash,
+                        file_path=file_path,
+                        receipt_data=copy.deepcopy(receipt_data)
+                    )
+                    db.add(scan_row)
+                    db.commit()
+                except IntegrityError:
+                    # Same photo analyzed concurrently - the other copy wins
+                    db.rollback()
+                    scan_row = None
 
         # Normalize payload to avoid JSON serialization issues
         items = receipt_data.get("items", [])
@@ -58,6 +260,12 @@ async def scan_receipt(
         receipt_data["items"] = items
         receipt_data["merchant"] = receipt_data.get("merchant") or "Unknown Merchant"
         receipt_data["suggested_category"] = receipt_data.get("suggested_category") or "Other"
+        # Learned merchant -> category mapping beats the model's generic guess
+        learned_category = None
+        if receipt_data["merchant"] != "Unknown Merchant":
+            learned_category = category_classifier.suggest(db, user.id, receipt_data["merchant"])
+        if learned_category:
+            receipt_data["suggested_category"] = learned_category
         # Don't override date if AI extracted it, only set default if missing
         if not receipt_data.get("date") or receipt_data.get("date") == "null":
             # Will use current date/time from browser or UTC+4
@@ -65,13 +273,13 @@ async def scan_receipt(
     
         # Check if this is actually a receipt
         if not receipt_data.get("is_receipt", True):
-                return JSONResponse({
+                return {
                     "success": False,
                     "receipt_data": {
                         "error": "Bu qəbz deyil. Xahiş edirik qəbz şəkli yükləyin.",
                         "is_not_receipt": True
                     }
-            })
+                }
         
         # Only AZN supported - no currency conversion
         receipt_data["currency"] = "AZN"
@@ -83,17 +291,14 @@ async def scan_receipt(
     
         # Check if error occurred
         if "error" in receipt_data:
-                return JSONResponse({
+                return {
                     "success": False,
                     "receipt_data": receipt_data
-            })
+                }
 
         # Auto-save expense (skip manual confirmation)
         try:
             raw_date = receipt_data.get("date")
-            # Get client date/time from request headers (browser's local time)
-            client_date_str = request.headers.get("X-Client-Date", None)
-            
             try:
                 raw_time = receipt_data.get("time")
                 if raw_date and raw_date != "null" and raw_date.lower() != "none":
@@ -151,6 +356,10 @@ async def scan_receipt(
                 items=items_list
             )
             db.add(expense)
+            record_expense(db, expense)
+            if scan_row is not None:
+                db.flush()
+                scan_row.expense_id = expense.id
             db.commit()
             db.refresh(expense)
             
@@ -193,78 +402,83 @@ async def scan_receipt(
                             "limit": user.daily_budget_limit
                         }
 
-            # Deduct token (only for non-premium users)
-            if not user.is_premium:
+            # Deduct token (only for non-premium users, and only when the AI was called)
+            if not user.is_premium and not from_cache:
                 user.ai_tokens = max(0, (user.ai_tokens if user.ai_tokens is not None else 10) - 1)
                 db.commit()
                 db.refresh(user)
             
-            scan_xp = gamification.award_xp(user, "scan_receipt", db)
+            # A re-scan of a photo whose expense was deleted re-creates the expense,
+            # but only the first scan of a photo earns XP and coins
+            scan_xp = None
+            coins_to_award = 0
+            milestone_reached = None
+            if not from_cache:
+                scan_xp = gamification.award_xp(user, "scan_receipt", db)
             
-            # Award FinMate Coins based on receipt amount
-            # Yeni coin sistemi:
-            # 0-49 AZN: 1 coin
-            # 50-99 AZN: 5 coin
-            # 100-500 AZN: 10 coin
-            # 500-999 AZN: 15 coin
-            if user.coins is None:
-                user.coins = 0
+                # Award FinMate Coins based on receipt amount
+                # Yeni coin sistemi:
+                # 0-49 AZN: 1 coin
+                # 50-99 AZN: 5 coin
+                # 100-500 AZN: 10 coin
+                # 500-999 AZN: 15 coin
+                if user.coins is None:
+                    user.coins = 0
             
-            # Calculate coins based on total amount
-            total_amount = receipt_data.get("total", 0)
-            try:
-                total_amount = float(total_amount)
-            except (ValueError, TypeError):
-                total_amount = 0
+                # Calculate coins based on total amount
+                total_amount = receipt_data.get("total", 0)
+                try:
+                    total_amount = float(total_amount)
+                except (ValueError, TypeError):
+                    total_amount = 0
             
-            # Coin calculation based on amount ranges
-            if total_amount < 50:
-                coins_to_award = 1
-            elif total_amount < 100:
-                coins_to_award = 5
-            elif total_amount < 500:
-                coins_to_award = 10
-            elif total_amount < 1000:
-                coins_to_award = 15
-            else:
-                # 1000+ AZN üçün hər 500 AZN-ə 15 coin əlavə et
-                coins_to_award = 15 + (int((total_amount - 1000) / 500) * 15)
+                # Coin calculation based on amount ranges
+                if total_amount < 50:
+                    coins_to_award = 1
+                elif total_amount < 100:
+                    coins_to_award = 5
+                elif total_amount < 500:
+                    coins_to_award = 10
+                elif total_amount < 1000:
+                    coins_to_award = 15
+                else:
+                    # 1000+ AZN üçün hər 500 AZN-ə 15 coin əlavə et
+                    coins_to_award = 15 + (int((total_amount - 1000) / 500) * 15)
             
-            user.coins += coins_to_award
-            milestone_reached = None
+                user.coins += coins_to_award
             
-            # Check for milestones
-            milestones = {
-                100: {"name": "🥉 Bronz", "reward": "1 Coffee Kuponu"},
-                200: {"name": "🥈 Gümüş", "reward": "3 Coffee Kuponu"},
-                500: {"name": "🥇 Qızıl", "reward": "5 AZN pul mükafatı"},
-                5000: {"name": "💎 Platin", "reward": "Premium 1 ay + 20 AZN"}
-            }
-            
-            if user.coins in milestones:
-                milestone_reached = {
-                    "coins": user.coins,
-                    "name": milestones[user.coins]["name"],
-                    "reward": milestones[user.coins]["reward"]
+                # Check for milestones
+                milestones = {
+                    100: {"name": "🥉 Bronz", "reward": "1 Coffee Kuponu"},
+                    200: {"name": "🥈 Gümüş", "reward": "3 Coffee Kuponu"},
+                    500: {"name": "🥇 Qızıl", "reward": "5 AZN pul mükafatı"},
+                    5000: {"name": "💎 Platin", "reward": "Premium 1 ay + 20 AZN"}
                 }
             
-            db.commit()
-            db.refresh(user)
-
-            # Send real-time notification via WebSocket - Coin qazandı
-            try:
-                from routes.websocket import send_notification_to_user
-                # Coin bildirişi göndər
-                await send_notification_to_user(user.id, {
-                    "type": "new_notification",
-                    "notification": {
-                        "icon": "🪙",
-                        "color": "yellow-500",
-                        "message": f"Təbriklər! Qəbz scan etdiyinizə görə {coins_to_award} coin qazandınız! 💰 Cari balans: {user.coins} coin"
+                if user.coins in milestones:
+                    milestone_reached = {
+                        "coins": user.coins,
+                        "name": milestones[user.coins]["name"],
+                        "reward": milestones[user.coins]["reward"]
                     }
-                })
-            except Exception as ws_error:
-                print(f"WebSocket notification error: {ws_error}")
+            
+                db.commit()
+                db.refresh(user)
+
+                # Send real-time notification via WebSocket - Coin qazandı
+                try:
+                    from routes.websocket import send_notification_to_user
+                    # Coin bildirişi göndər
+                    await send_notification_to_user(user.id, {
+                        "type": "new_notification",
+                        "notification": {
+                            "icon": "🪙",
+                            "color": "yellow-500",
+                            "message": f"Təbriklər! Qəbz scan etdiyinizə görə {coins_to_award} coin qazandınız! 💰 Cari balans: {user.coins} coin"
+                        }
+                    })
+                except Exception as ws_error:
+                    print(f"WebSocket notification error: {ws_error}")
             
             # AI ilə xərcləmə analizi və bildiriş yarat
             scan_amount = float(receipt_data.get("total", 0.0) or 0.0)
@@ -312,7 +526,7 @@ async def scan_receipt(
                     traceback.print_exc()
 
             # Return JSON for React frontend
-            return JSONResponse({
+            return {
                     "success": True,
                     "receipt_data": receipt_data,
                     "conversion_note": conversion_note,
@@ -328,28 +542,19 @@ async def scan_receipt(
                     "coins": user.coins,
                     "milestone_reached": milestone_reached,
                     "daily_limit_alert": daily_limit_alert,
-                    "remaining_tokens": user.ai_tokens if not user.is_premium else None
-            })
+                    "remaining_tokens": user.ai_tokens if not user.is_premium else None,
+                    "duplicate_scan": from_cache
+            }
         except Exception as save_err:
-                return JSONResponse({
+                return {
                     "success": False,
                     "receipt_data": {
                         "error": f"Yadda saxlama xətası: {save_err}"
                     }
-            })
+                }
         
     except Exception as e:
-            return JSONResponse({
-                "success": False,
-                "receipt_data": {
-                    "error": f"Xəta baş verdi: {str(e)}",
-                    "items": [],
-                    "merchant": "Error",
-                    "total": 0.0,
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "suggested_category": "Error"
-                }
-        })
+        return scan_error_payload(e)
 
 
 @app.post("/api/confirm-receipt")
@@ -398,6 +603,7 @@ async def confirm_receipt(
             items=items_list
         )
         db.add(expense)
+        record_expense(db, expense)
         db.commit()
         
         # Check daily budget limit - only for today's receipts
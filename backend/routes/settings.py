@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from database import get_db, reset_demo_data
 from models import User
 from config import app
-from utils.auth import get_current_user
+from utils.auth import get_current_user, invalidate_user_cache, user_cache
 
 @app.get("/settings")
 async def settings_page(request: Request, db: Session = Depends(get_db)):
@@ -112,6 +112,7 @@ async def update_settings(request: Request, db: Session = Depends(get_db)):
                 
                 # Commit immediately to ensure it's saved
                 db.commit()
+                invalidate_user_cache(user.id)
                 db.refresh(user)
                 
                 # Verify it was saved
@@ -220,6 +221,7 @@ async def update_settings(request: Request, db: Session = Depends(get_db)):
 
         # Final commit (if monthly_income wasn't already committed)
         db.commit()
+        invalidate_user_cache(user.id)
         db.refresh(user)
 
         print(f"✅ Settings updated successfully for user {user.id} (username: {user.username})")
@@ -257,6 +259,7 @@ async def reset_demo_endpoint():
     """Reset database to curated demo data (manual action)"""
     try:
         reset_demo_data()
+        user_cache.clear()
         return JSONResponse({"success": True, "message": "Demo məlumatları yeniləndi"})
     except Exception as e:
         print(f"❌ Reset Demo Error: {e}")
@@ -275,6 +278,7 @@ async def activate_trial_endpoint(request: Request, db: Session = Depends(get_db
 
         user.is_premium = True
         db.commit()
+        invalidate_user_cache(user.id)
         return JSONResponse(
             {
                 "success": True,
@@ -310,6 +314,7 @@ async def set_budget(
             user.currency = "AZN"
 
         db.commit()
+        invalidate_user_cache(user.id)
         db.refresh(user)
 
         print(f"✅ Budget set: {monthly_budget} AZN for user {user.id}")
@@ -1,47 +1,82 @@
 """Stats and utility routes"""
-from fastapi import Request, Depends
+import hmac
+import os
+from fastapi import Request, Depends, HTTPException
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from datetime import datetime
-from database import get_db
-from models import Expense
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, get_pool_stats
 from config import app
-from utils.auth import get_current_user
+from utils.auth import get_current_user_profile_async
+from utils.month_summary import get_month_totals
 from gamification import gamification
+from ai_service import ai_service
+from utils.cache import get_cache_stats
+from utils.response_cache import get_response_cache_stats
+from job_queue import job_queue
+from utils.tts_cache import tts_cache
+from utils.proxy_pool import proxy_pool
+from utils.expense_parser import get_parse_stats
+from utils.category_classifier import category_classifier
+from notification_engine import notification_engine
+from notification_broker import notification_broker
+from routes.websocket import get_connection_stats
+from routes.random_notifications import random_notification_scheduler
+
+# /api/metrics is off unless set; clients send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 
 @app.get("/api/stats")
-async def get_user_stats(request: Request, db: Session = Depends(get_db)):
+async def get_user_stats(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Return updated user stats - React frontend üçün JSON"""
-    user = get_current_user(request, db)
+    user = await get_current_user_profile_async(request, db)
     if not user:
         return JSONResponse({"user": None})
     
     # Get user stats
-    now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
-    
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= month_start
-    ).all()
-    
-    total_spent = sum(exp.amount for exp in expenses)
-    total_transactions = len(expenses)
-    
+    month_totals = await db.run_sync(get_month_totals, user.id)
+    return JSONResponse({"user": build_user_stats(user, month_totals)})
+
+
+def build_user_stats(user, month_totals: dict) -> dict:
+    """Header/profile stats for a user from the current month's rollup totals"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "xp": user.xp_points or 0,
+        "total_spent": month_totals["total_spending"],
+        "total_transactions": month_totals["expense_count"],
+        "currency": user.currency or "AZN",
+        "is_premium": user.is_premium or False,
+        "monthly_budget": user.monthly_budget,
+        "monthly_income": user.monthly_income,  # Include monthly_income
+        "login_streak": user.login_streak or 0,
+        "level_title": gamification.get_level_info(user.xp_points or 0).get("title", "")
+    }
+
+
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    """Runtime metrics (connection pool, caches, queues) for monitoring - needs METRICS_TOKEN"""
+    # Disabled unless a token is configured; exposes internals (hostnames, queue sizes ...)
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
     return JSONResponse({
-        "user": {
-            "id": user.id,
-            "username": user.username,
-            "xp": user.xp_points or 0,
-            "total_spent": total_spent,
-            "total_transactions": total_transactions,
-            "currency": user.currency or "AZN",
-            "is_premium": user.is_premium or False,
-            "monthly_budget": user.monthly_budget,
-            "monthly_income": user.monthly_income,  # Include monthly_income
-            "login_streak": user.login_streak or 0,
-            "level_title": gamification.get_level_info(user.xp_points or 0).get("title", "")
-        }
+        "db_pool": get_pool_stats(),
+        "ai": ai_service.get_stats(),
+        "caches": get_cache_stats(),
+        "response_cache": get_response_cache_stats(),
+        "job_queue": job_queue.get_stats(),
+        "tts_cache": tts_cache.get_stats(),
+        "tts_proxies": proxy_pool.get_stats(),
+        "voice_parser": get_parse_stats(),
+        "category_classifier": category_classifier.get_stats(),
+        "notifications": notification_engine.get_stats(),
+        "notification_broker": notification_broker.get_stats(),
+        "websocket": get_connection_stats(),
+        "random_notifications": random_notification_scheduler.get_stats(),
     })
-
@@ -1,36 +1,44 @@
 """WebSocket routes for real-time notifications"""
-from fastapi import WebSocket, WebSocketDisconnect, Depends
+from fastapi import WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketDisconnect as StarletteWebSocketDisconnect
 from sqlalchemy.orm import Session
-from database import get_db
-from models import User, Expense
-from datetime import datetime, timedelta, date as date_type
-from typing import Dict, List
+from database import SessionLocal
+from models import User
+from typing import Dict, List, Optional
+from utils.auth import verify_ws_token
+from notification_engine import notification_engine
+from notification_broker import notification_broker, WORKER_ID
+from utils.ws_writer import ConnectionWriter, writer_stats
+from utils.response_cache import bump_data_version
 
 # Active WebSocket connections
 active_connections: Dict[int, List[WebSocket]] = {}
 
-async def get_user_from_websocket(websocket: WebSocket, db: Session):
-    """Get user from WebSocket query params or cookies"""
-    # Try to get user_id from query params
-    user_id = websocket.query_params.get("user_id")
-    if user_id:
-        user = db.query(User).filter(User.id == int(user_id)).first()
-        if user:
-            return user
-    
-    # Fallback: try to get from session/cookies
-    # For now, we'll use a simple approach - get from query params
-    return None
+# Protocol 1: full notification list on every change
+# Protocol 2: snapshot once, then sequenced add/remove/replace deltas (resumable)
+LATEST_PROTOCOL = 2
+
+def get_user_id_from_websocket(websocket: WebSocket) -> Optional[int]:
+    """User id from the signed `token` query param (issued by /api/login and /api/ws-token)"""
+    return verify_ws_token(websocket.query_params.get("token"))
 
 async def connect_websocket(websocket: WebSocket, user_id: int):
-    """Add WebSocket connection for user"""
+    """Add WebSocket connection for user (with its own outgoing queue + writer task)"""
+    protocol = getattr(websocket.state, "protocol", 1)
+    websocket.state.writer = ConnectionWriter(
+        websocket,
+        snapshot_factory=lambda: notifications_snapshot_message(notification_engine.get_log(user_id), protocol),
+        on_close=lambda: disconnect_websocket(websocket, user_id)
+    )
     if user_id not in active_connections:
         active_connections[user_id] = []
     active_connections[user_id].append(websocket)
 
 async def disconnect_websocket(websocket: WebSocket, user_id: int):
     """Remove WebSocket connection for user"""
+    writer = getattr(websocket.state, "writer", None)
+    if writer is not None:
+        writer.close()
     if user_id in active_connections:
         if websocket in active_connections[user_id]:
             active_connections[user_id].remove(websocket)
@@ -38,214 +46,137 @@ async def disconnect_websocket(websocket: WebSocket, user_id: int):
             del active_connections[user_id]
 
 async def send_notification_to_user(user_id: int, notification: dict):
-    """Send notification to all WebSocket connections of a user"""
-    if user_id in active_connections:
-        disconnected = []
-        for websocket in active_connections[user_id]:
-            try:
-                # Check if connection is still open
-                if websocket.client_state.name == "CONNECTED":
-                    await websocket.send_json(notification)
-            except (WebSocketDisconnect, StarletteWebSocketDisconnect, Exception) as e:
-                # Connection closed or other error - silently handle it
-                # This is normal when client disconnects
-                disconnected.append(websocket)
-        
-        # Remove disconnected connections
-        for ws in disconnected:
-            try:
-                await disconnect_websocket(ws, user_id)
-            except:
-                pass
+    """Send notification to all WebSocket connections of a user (in every worker)"""
+    await notification_broker.publish(user_id, {"kind": "send", "message": notification})
+
+async def handle_broker_message(user_id: int, payload: dict, origin: str):
+    """Broker delivery - runs in every worker for every published message"""
+    kind = payload.get("kind")
+    if kind == "send":
+        await deliver_to_local_connections(user_id, payload["message"])
+    elif kind == "refresh" and origin != WORKER_ID:
+        # Another worker saved data for this user - our cached responses and rolling
+        # notification state are stale (reloaded on next connect if nobody is online)
+        bump_data_version(user_id)
+        notification_engine.invalidate(user_id)
+        if user_id in active_connections:
+            await notification_engine.push_if_changed(user_id)
+
+async def start_notification_broker():
+    """Subscribe this worker to the broker (call from the app startup event)"""
+    await notification_broker.start(handle_broker_message, lambda: list(active_connections))
+
+async def deliver_to_local_connections(user_id: int, notification: dict):
+    """Queue a message on this worker's WebSocket connections of a user (never waits on a client)"""
+    for websocket in list(active_connections.get(user_id, [])):
+        websocket.state.writer.send(notification)
+
+def get_connection_stats() -> dict:
+    """Connection count and outgoing queue depth for /api/metrics"""
+    writers = [ws.state.writer for sockets in active_connections.values() for ws in sockets]
+    depths = [len(writer) for writer in writers]
+    return {
+        **writer_stats,
+        "users": len(active_connections),
+        "connections": len(writers),
+        "queued": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+    }
+
+def notifications_snapshot_message(log, protocol: int) -> dict:
+    """Full list message (protocol 2 also carries the epoch/seq to resume from)"""
+    notifications = log.snapshot()
+    message = {
+        "type": "notifications",
+        "notifications": notifications,
+        "count": len(notifications)
+    }
+    if protocol >= 2:
+        message.update({"v": protocol, "epoch": log.epoch, "seq": log.seq})
+    return message
+
+async def broadcast_notification_delta(user_id: int, log, delta: dict):
+    """Queue a delta on protocol-2 sockets and a fresh list on protocol-1 sockets"""
+    delta_message = {"type": "notifications_delta", "v": 2, "epoch": log.epoch, **delta}
+    for websocket in list(active_connections.get(user_id, [])):
+        if getattr(websocket.state, "protocol", 1) >= 2:
+            websocket.state.writer.send_delta(delta_message)
+        else:
+            # Coalesces with any list update still waiting in the queue
+            websocket.state.writer.send_snapshot()
 
 async def send_single_notification_to_user(user_id: int, notification: dict, db: Session):
-    """Send single notification and refresh all notifications"""
-    # Send single notification
+    """Send single notification, then the notification list if it changed"""
     await send_notification_to_user(user_id, {
         "type": "new_notification",
         "notification": notification
     })
-    
-    # Also refresh all notifications
-    user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        all_notifications = await generate_notifications_for_user(user, db)
-        await send_notification_to_user(user_id, {
-            "type": "notifications",
-            "notifications": all_notifications,
-            "count": len(all_notifications)
-        })
+    await notification_engine.push_if_changed(user_id, db=db)
 
 async def generate_notifications_for_user(user: User, db: Session) -> List[dict]:
-    """Generate notifications for user (same logic as notifications.py)"""
-    notifications = []
-    
-    # Get current month's data
-    now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= month_start
-    ).all()
-    
-    total_spending = sum(exp.amount for exp in expenses)
-    budget_percentage = (total_spending / user.monthly_budget * 100) if user.monthly_budget > 0 else 0
-    
-    # Budget warning
-    if budget_percentage >= 100:
-        notifications.append({
-            "icon": "⚠️",
-            "color": "red-500",
-            "message": f"Büdcə limiti keçildi! {budget_percentage:.0f}% istifadə edilib."
-        })
-    elif budget_percentage >= 80:
-        notifications.append({
-            "icon": "⚡",
-            "color": "amber-500",
-            "message": f"Diqqət: Büdcənin {budget_percentage:.0f}%-ni istifadə etmisən."
-        })
-    
-    # Maaşın yarısını ayın ilk 10 günündə xərcləmə xəbərdarlığı
-    if user.monthly_income and user.monthly_income > 0:
-        current_day = now.day
-        salary_half = user.monthly_income / 2
-        
-        if current_day <= 10 and total_spending >= salary_half:
-            remaining_days = 30 - current_day
-            daily_allowance = (user.monthly_income - total_spending) / remaining_days if remaining_days > 0 else 0
-            notifications.append({
-                "icon": "🚨",
-                "color": "red-500",
-                "message": f"Diqqət! Ayın ilk 10 günündə maaşının yarısını ({total_spending:.0f} AZN) xərcləmisən. Qənaət etməsən ac qalacaqsan! Gündəlik limit: {daily_allowance:.0f} AZN"
-            })
-        elif current_day <= 10 and total_spending >= user.monthly_income * 0.4:
-            notifications.append({
-                "icon": "⚠️",
-                "color": "amber-500",
-                "message": f"Diqqət! Ayın ilk 10 günündə maaşının 40%-ni ({total_spending:.0f} AZN) xərcləmisən. Qənaət etməyə başla!"
-            })
-    
-    # Ayın ilk yarısında maaşın 70%-ni xərcləmə xəbərdarlığı
-    if user.monthly_income and user.monthly_income > 0:
-        current_day = now.day
-        if current_day <= 15 and total_spending >= user.monthly_income * 0.7:
-            notifications.append({
-                "icon": "🔥",
-                "color": "red-500",
-                "message": f"Təhlükə! Ayın ilk yarısında maaşının 70%-ni ({total_spending:.0f} AZN) xərcləmisən. Dərhal qənaət etməyə başla!"
-            })
-    
-    # Həftəlik xərcləmə analizi
-    week_start = now - timedelta(days=now.weekday())
-    week_expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= week_start,
-        Expense.date <= now
-    ).all()
-    week_total = sum(exp.amount for exp in week_expenses)
-    
-    if user.monthly_income and user.monthly_income > 0:
-        weekly_budget = user.monthly_income / 4
-        if week_total > weekly_budget * 1.2:
-            notifications.append({
-                "icon": "📊",
-                "color": "amber-500",
-                "message": f"Bu həftə həftəlik büdcənizi ({weekly_budget:.0f} AZN) 20% artıq keçmisiniz. Cari: {week_total:.0f} AZN"
-            })
-    
-    # Kategoriya əsaslı xəbərdarlıqlar
-    if expenses:
-        category_totals = {}
-        for exp in expenses:
-            category = exp.category or exp.category_name or "Digər"
-            category_totals[category] = category_totals.get(category, 0) + exp.amount
-        
-        if category_totals:
-            top_category = max(category_totals.items(), key=lambda x: x[1])
-            top_category_name, top_category_amount = top_category
-            top_category_percentage = (top_category_amount / total_spending * 100) if total_spending > 0 else 0
-            
-            if top_category_percentage > 50:
-                notifications.append({
-                    "icon": "🎯",
-                    "color": "blue-500",
-                    "message": f"'{top_category_name}' kateqoriyasına xərclərinizin {top_category_percentage:.0f}%-ni ({top_category_amount:.0f} AZN) xərcləmisiniz. Diversifikasiya edin!"
-                })
-    
-    # Qənaət təklifləri
-    if user.monthly_income and user.monthly_income > 0:
-        savings_potential = user.monthly_income - total_spending
-        if savings_potential > user.monthly_income * 0.2 and now.day >= 20:
-            notifications.append({
-                "icon": "💰",
-                "color": "green-500",
-                "message": f"Əla! Bu ay {savings_potential:.0f} AZN qənaət edə bilərsən. Arzu qutusuna əlavə et!"
-            })
-    
-    # Günün sonu xəbərdarlığı
-    today = date_type.today()
-    today_expenses = db.query(Expense).filter(
-        Expense.user_id == user.id,
-        Expense.date >= today,
-        Expense.date < today + timedelta(days=1)
-    ).all()
-    today_total = sum(exp.amount for exp in today_expenses)
-    
-    if user.monthly_income and user.monthly_income > 0:
-        daily_budget = user.monthly_income / 30
-        if today_total > daily_budget * 1.5:
-            notifications.append({
-                "icon": "🌙",
-                "color": "amber-500",
-                "message": f"Bu gün gündəlik büdcənizi ({daily_budget:.0f} AZN) 50% artıq keçmisiniz. Sabah daha diqqətli olun!"
-            })
-    
-    # Scan/Coin bildirişləri - silindi, çünki scan edildikdə onsuzda coin bildirişi WebSocket ilə gəlir
-    # Random təkliflər - silindi, çünki scan edildikdə atılmamalıdır
-    
-    # Positive message if no critical notifications
-    critical_notifications = [n for n in notifications if n.get("color") in ["red-500", "amber-500"]]
-    if not critical_notifications:
-        notifications.append({
-            "icon": "✅",
-            "color": "green-500",
-            "message": "Maliyyə vəziyyətiniz yaxşıdır!"
-        })
-    
-    return notifications
+    """Generate notifications for user (shared rules in notification_engine)"""
+    return notification_engine.get_notifications(db, user)
 
 from config import app
 
 @app.websocket("/ws/notifications")
-async def websocket_notifications(websocket: WebSocket, db: Session = Depends(get_db)):
-    """WebSocket endpoint for real-time notifications"""
+async def websocket_notifications(websocket: WebSocket):
+    """WebSocket endpoint for real-time notifications
+
+    No DB session is held for the socket's lifetime - a short-lived one is opened on
+    connect to bring the notification list up to date.
+    """
     await websocket.accept()
     
-    # Get user_id from query params
-    user_id = websocket.query_params.get("user_id")
+    # Signed token - no DB lookup needed to identify the user
+    user_id = get_user_id_from_websocket(websocket)
     if not user_id:
-        await websocket.close(code=1008, reason="User ID required")
+        await websocket.close(code=1008, reason="Invalid or expired token")
         return
     
     try:
-        user_id = int(user_id)
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            await websocket.close(code=1008, reason="User not found")
-            return
-        
-        # Connect WebSocket
-        await connect_websocket(websocket, user_id)
+        try:
+            protocol = min(int(websocket.query_params.get("protocol", 1)), LATEST_PROTOCOL)
+        except ValueError:
+            protocol = 1
+        websocket.state.protocol = protocol
         
-        # Send initial notifications
+        # Send initial notifications - resume from the client's last seq when possible
         try:
-            notifications = await generate_notifications_for_user(user, db)
-            if websocket.client_state.name == "CONNECTED":
-                await websocket.send_json({
-                    "type": "notifications",
-                    "notifications": notifications,
-                    "count": len(notifications)
+            # Re-evaluate on every connect: writes made while the user had no socket here
+            # and time-driven rules (day / week rollover, salary days) never reached the log
+            db = SessionLocal()
+            try:
+                user = db.query(User).filter(User.id == user_id).first()
+                if not user:
+                    await websocket.close(code=1008, reason="User not found")
+                    return
+                await notification_engine.push_if_changed(user_id, user=user, db=db)
+            finally:
+                db.close()
+
+            log = notification_engine.get_log(user_id)
+            deltas = None
+            if protocol >= 2 and websocket.query_params.get("since"):
+                try:
+                    since = int(websocket.query_params.get("since"))
+                except ValueError:
+                    since = None
+                deltas = log.deltas_since(websocket.query_params.get("epoch"), since)
+
+            # Register and queue the first message with no await in between, so every
+            # later delta is queued behind it
+            await connect_websocket(websocket, user_id)
+            writer = websocket.state.writer
+            if deltas is not None:
+                writer.send({
+                    "type": "notifications_resume", "v": protocol,
+                    "epoch": log.epoch, "seq": log.seq, "deltas": deltas
                 })
+                notification_engine.stats["resumes"] += 1
+            else:
+                writer.send_snapshot()
+                notification_engine.stats["snapshots"] += 1
         except (WebSocketDisconnect, StarletteWebSocketDisconnect, Exception) as e:
             # Client disconnected before we could send - this is normal
             raise WebSocketDisconnect
@@ -253,8 +184,8 @@ async def websocket_notifications(websocket: WebSocket, db: Session = Depends(ge
         # Keep connection alive and listen for updates
         while True:
             try:
-                # Check if connection is still open
-                if websocket.client_state.name != "CONNECTED":
+                # Check if connection is still open (writer stops on a stuck/closed client)
+                if websocket.client_state.name != "CONNECTED" or writer.closed:
                     break
                 
                 # Wait for ping or close (with timeout to prevent hanging)
@@ -262,15 +193,13 @@ async def websocket_notifications(websocket: WebSocket, db: Session = Depends(ge
                 try:
                     data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
                     if data == "ping":
-                        if websocket.client_state.name == "CONNECTED":
-                            await websocket.send_text("pong")
+                        writer.send_text("pong")
+                    elif data == "resync":
+                        # Client saw a sequence gap - resend the logged list (no recomputation)
+                        writer.send_snapshot()
                 except asyncio.TimeoutError:
                     # Send ping to keep connection alive
-                    try:
-                        if websocket.client_state.name == "CONNECTED":
-                            await websocket.send_text("ping")
-                    except:
-                        break
+                    writer.send_text("ping")
             except WebSocketDisconnect:
                 break
             except Exception as e:
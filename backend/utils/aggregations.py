@@ -0,0 +1,117 @@
+"""SQL-side aggregation helpers - SUM/GROUP BY instead of loading ORM rows"""
+from datetime import datetime, timedelta, date as date_type
+from typing import Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Expense, Income
+
+
+def _apply_window(query, column, start: Optional[datetime], end: Optional[datetime]):
+    """Apply inclusive [start, end] date window to a query"""
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column <= end)
+    return query
+
+
+def expense_summary(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    subscriptions_only: bool = False
+) -> Dict[str, float]:
+    """Total amount and row count of expenses in the window"""
+    query = db.query(
+        func.coalesce(func.sum(Expense.amount), 0.0),
+        func.count(Expense.id)
+    ).filter(Expense.user_id == user_id)
+    if subscriptions_only:
+        query = query.filter(Expense.is_subscription == True)
+    total, count = _apply_window(query, Expense.date, start, end).one()
+    return {"total": float(total or 0.0), "count": int(count or 0)}
+
+
+def expense_total(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> float:
+    """Total expense amount in the window"""
+    return expense_summary(db, user_id, start, end)["total"]
+
+
+def subscription_total(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> float:
+    """Total amount of subscription expenses in the window"""
+    return expense_summary(db, user_id, start, end, subscriptions_only=True)["total"]
+
+
+def category_totals(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, float]:
+    """Expense totals grouped by category (in first-seen order, like the old Python loop)"""
+    query = db.query(
+        Expense.category,
+        func.sum(Expense.amount),
+        func.min(Expense.id)
+    ).filter(Expense.user_id == user_id)
+    rows = (
+        _apply_window(query, Expense.date, start, end)
+        .group_by(Expense.category)
+        .order_by(func.min(Expense.id))
+        .all()
+    )
+    return {category: float(total or 0.0) for category, total, _ in rows}
+
+
+def income_total(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> float:
+    """Total income amount in the window"""
+    query = db.query(func.coalesce(func.sum(Income.amount), 0.0)).filter(Income.user_id == user_id)
+    return float(_apply_window(query, Income.date, start, end).scalar() or 0.0)
+
+
+def income_by_source(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, float]:
+    """Income totals grouped by source"""
+    query = db.query(Income.source, func.sum(Income.amount)).filter(Income.user_id == user_id)
+    rows = _apply_window(query, Income.date, start, end).group_by(Income.source).all()
+    return {source: float(total or 0.0) for source, total in rows if source is not None}
+
+
+def day_bounds(day: date_type) -> tuple:
+    """Return (start, end) datetimes covering a whole day"""
+    return (
+        datetime.combine(day, datetime.min.time()),
+        datetime.combine(day, datetime.max.time())
+    )
+
+
+def today_total(db: Session, user_id: int, today: Optional[date_type] = None) -> float:
+    """Total expense amount for today"""
+    day_start, day_end = day_bounds(today or date_type.today())
+    return expense_total(db, user_id, day_start, day_end)
+
+
+def week_total(db: Session, user_id: int, now: Optional[datetime] = None, days: int = 7) -> float:
+    """Total expense amount for the last N days"""
+    now = now or datetime.utcnow()
+    return expense_total(db, user_id, now - timedelta(days=days))
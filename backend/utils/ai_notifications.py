@@ -115,7 +115,7 @@ Cavabı yalnız Azərbaycan dilində yaz, qısa və effektiv olsun (maksimum 2 c
 Cavabı yalnız bildiriş mətnini yaz, başqa heç nə yazma."""
         
         # AI ilə bildiriş yarat
-        ai_notification = ai_service.chat_with_cfo(
+        ai_notification = await ai_service.chat_with_cfo_async(
             ai_prompt,
             db_context,
             None,  # Chat history yoxdur
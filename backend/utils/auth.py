@@ -1,9 +1,28 @@
 """Authentication helper functions"""
 from fastapi import Request, HTTPException
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Optional, Union
 import hashlib
+import os
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from models import User
+from config import SESSION_SECRET_KEY
+from utils.cache import get_cache
+
+# WebSocket auth tokens - signed user id, verified without a DB lookup
+WS_TOKEN_MAX_AGE = int(os.getenv("WS_TOKEN_MAX_AGE", str(24 * 3600)))
+_ws_token_serializer = URLSafeTimedSerializer(SESSION_SECRET_KEY, salt="finmate-ws")
+
+# Read-only user snapshots for endpoints that only display profile fields.
+# Writes to a User row invalidate its entry (see _track_user_writes); the TTL bounds
+# staleness for writes made by other workers.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+user_cache = get_cache("user_identity", maxsize=5000, ttl=USER_CACHE_TTL)
+
+# Never copied into the cached snapshot
+_PRIVATE_USER_FIELDS = {"password_hash"}
 
 
 def hash_password(password: str) -> str:
@@ -16,22 +35,149 @@ def verify_password(password: str, password_hash: str) -> bool:
     return hash_password(password) == password_hash
 
 
+def create_ws_token(user_id: int) -> str:
+    """Signed, expiring token that identifies the user on /ws/notifications"""
+    return _ws_token_serializer.dumps({"uid": user_id})
+
+
+def verify_ws_token(token: Optional[str]) -> Optional[int]:
+    """User id from a WebSocket token, or None if it is missing, forged or expired"""
+    if not token:
+        return None
+    try:
+        data = _ws_token_serializer.loads(token, max_age=WS_TOKEN_MAX_AGE)
+    except (BadSignature, SignatureExpired):
+        return None
+    return data.get("uid") if isinstance(data, dict) else None
+
+
+class UserProfile:
+    """Detached, read-only copy of a User row's columns (no DB session needed)"""
+
+    __slots__ = ("_fields",)
+
+    def __init__(self, fields: Dict[str, Any]):
+        object.__setattr__(self, "_fields", fields)
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("UserProfile is read-only - load the User to modify it")
+
+    def __repr__(self):
+        return f"<UserProfile(id={self._fields.get('id')}, username='{self._fields.get('username')}')>"
+
+
+def snapshot_user(user: User) -> UserProfile:
+    """Detached read-only copy of the user's columns (password_hash is excluded)"""
+    fields = {
+        column.key: getattr(user, column.key)
+        for column in inspect(User).column_attrs
+        if column.key not in _PRIVATE_USER_FIELDS
+    }
+    return UserProfile(fields)
+
+
+def invalidate_user_cache(user_id: Optional[int]):
+    """Drop the cached profile snapshot after the user's row changed"""
+    if user_id is not None:
+        user_cache.delete(user_id)
+
+
+def _memoized_user(request: Request, db: Any, user_id: int) -> Optional[User]:
+    """User already loaded by this request through the same session"""
+    memo = getattr(request.state, "current_user", None)
+    if memo is not None and memo[0] is db and memo[1] == user_id:
+        return memo[2]
+    return None
+
+
+def _remember_user(request: Request, db: Any, user: Optional[User]):
+    if user is None:
+        # Clear session if user doesn't exist (prevents redirect loops)
+        request.session.clear()
+        return
+    request.state.current_user = (db, user.id, user)
+    user_cache.set(user.id, snapshot_user(user))
+
+
 def get_current_user(request: Request, db: Session) -> Optional[User]:
-    """Get current logged in user from session"""
+    """Get current logged in user from session (loaded at most once per request)"""
     user_id = request.session.get("user_id")
     if not user_id:
         return None
-    
-    db.expire_all()
-    user = db.query(User).filter(User.id == user_id).first()
-    
-    # Clear session if user doesn't exist (prevents redirect loops)
-    if not user:
-        request.session.clear()
-    
+
+    user = _memoized_user(request, db, user_id)
+    if user is not None:
+        return user
+
+    user = db.get(User, user_id)
+    _remember_user(request, db, user)
+    return user
+
+
+async def get_current_user_async(request: Request, db: AsyncSession) -> Optional[User]:
+    """Get current logged in user from session (async session variant)"""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return None
+
+    user = _memoized_user(request, db, user_id)
+    if user is not None:
+        return user
+
+    user = await db.get(User, user_id)
+    _remember_user(request, db, user)
     return user
 
 
+def get_current_user_profile(request: Request, db: Session) -> Optional[Union[UserProfile, User]]:
+    """
+    Current user for read-only endpoints
+
+    Served from the identity cache when possible; falls back to get_current_user.
+    The result must not be modified or committed.
+    """
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return None
+    return user_cache.get(user_id) or get_current_user(request, db)
+
+
+async def get_current_user_profile_async(request: Request, db: AsyncSession) -> Optional[Union[UserProfile, User]]:
+    """get_current_user_profile for async sessions"""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return None
+    return user_cache.get(user_id) or await get_current_user_async(request, db)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_user_writes(session: Session, flush_context):
+    """Any flushed change to a User row (settings, XP, coins, tokens...) drops its snapshot"""
+    changed = session.info.setdefault("changed_user_ids", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+            invalidate_user_cache(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session):
+    # Again after commit, in case a concurrent request re-cached the old row in between
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user_cache(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session):
+    session.info.pop("changed_user_ids", None)
+
+
 def require_auth(request: Request, db: Session) -> User:
     """Require authentication, raise exception if not authenticated"""
     user = get_current_user(request, db)
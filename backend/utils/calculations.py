@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 import hashlib
 import random
 from models import Expense, User
+from utils.month_summary import get_month_totals
 
 
 def build_db_context(db: Session, user_id: int) -> dict:
@@ -11,22 +12,12 @@ def build_db_context(db: Session, user_id: int) -> dict:
     now = datetime.utcnow()
     month_start = datetime(now.year, now.month, 1)
     
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user_id,
-        Expense.date >= month_start
-    ).all()
-    
-    total_spending = sum(exp.amount for exp in expenses)
-    
-    # Category breakdown
-    category_breakdown = {}
-    for exp in expenses:
-        if exp.category not in category_breakdown:
-            category_breakdown[exp.category] = 0
-        category_breakdown[exp.category] += exp.amount
+    # Month totals come from the monthly rollup
+    month_totals = get_month_totals(db, user_id, now)
+    total_spending = month_totals["total_spending"]
     
     # Sort categories by amount
-    category_breakdown = dict(sorted(category_breakdown.items(), key=lambda x: x[1], reverse=True))
+    category_breakdown = dict(sorted(month_totals["category_breakdown"].items(), key=lambda x: x[1], reverse=True))
     
     # Subscription count
     subscription_count = db.query(Expense).filter(
@@ -154,15 +145,9 @@ def get_eco_tip(eco_breakdown):
 
 def detect_financial_personality(user_id: int, db: Session) -> dict:
     """Detect user's financial personality based on spending habits"""
-    now = datetime.utcnow()
-    month_start = datetime(now.year, now.month, 1)
+    month_totals = get_month_totals(db, user_id)
     
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user_id,
-        Expense.date >= month_start
-    ).all()
-    
-    if not expenses:
+    if not month_totals["expense_count"]:
         return {
             "title": "The Beginner",
             "emoji": "🌱",
@@ -171,14 +156,9 @@ def detect_financial_personality(user_id: int, db: Session) -> dict:
             "spending_score": 5
         }
     
-    # Calculate category totals
-    category_totals = {}
-    total_spending = 0
-    for exp in expenses:
-        total_spending += exp.amount
-        if exp.category not in category_totals:
-            category_totals[exp.category] = 0
-        category_totals[exp.category] += exp.amount
+    # Category totals from the monthly rollup
+    category_totals = month_totals["category_breakdown"]
+    total_spending = month_totals["total_spending"]
     
     # Find top category
     top_category = max(category_totals, key=category_totals.get) if category_totals else "Digər"
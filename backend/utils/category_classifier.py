@@ -0,0 +1,207 @@
+"""Merchant -> category classifier learned from expense history
+
+Each user gets an n-gram index (character trigrams + whole words of the merchant
+name) with per-category frequency counts, built once from their Expense rows and then
+updated incrementally from EXPENSE_CHANGED events. A global index over all users (plus
+the local gems catalogue) acts as the prior for merchants the user never paid before.
+"""
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from local_gems import BAKU_LOCAL_GEMS
+from models import Expense
+from utils.cache import get_cache
+from utils.events import subscribe, EXPENSE_CHANGED
+from utils.expense_parser import normalize_text
+
+# Top suggestion must reach this share of the total score to auto-fill a category
+CATEGORY_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CATEGORY_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+USER_WEIGHT = 2.0  # User's own history outweighs the global prior
+EXACT_MATCH_WEIGHT = 3.0  # Whole-merchant hits outweigh partial n-gram hits
+GLOBAL_PRIOR_ROWS = 5000
+# Indexes are rebuilt after this long - other workers' writes never reach our events
+INDEX_TTL_SECONDS = 1800
+
+# Categories that carry no information and are never learned
+IGNORED_CATEGORIES = {"", "Digər", "Other", "Error"}
+
+
+def merchant_ngrams(merchant: str) -> List[str]:
+    """Character trigrams of each word (space padded) plus the words themselves"""
+    grams = []
+    for word in normalize_text(merchant).split():
+        grams.append(f"w:{word}")
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class MerchantIndex:
+    """Merchant and n-gram -> category frequency counts"""
+
+    def __init__(self):
+        self.merchants: Dict[str, Counter] = defaultdict(Counter)
+        self.ngrams: Dict[str, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def add(self, merchant: Optional[str], category: Optional[str], count: int = 1):
+        """Add (count > 0) or remove (count < 0) observations"""
+        key = normalize_text(merchant)
+        if not key or not category or category in IGNORED_CATEGORIES:
+            return
+        with self._lock:
+            self._bump(self.merchants, key, category, count)
+            for gram in merchant_ngrams(key):
+                self._bump(self.ngrams, gram, category, count)
+
+    @staticmethod
+    def _bump(table: Dict[str, Counter], key: str, category: str, count: int):
+        counts = table[key]
+        counts[category] += count
+        if counts[category] <= 0:
+            del counts[category]
+        if not counts:
+            del table[key]
+
+    def score(self, merchant: str) -> Counter:
+        """Category scores for a (possibly partial) merchant name"""
+        key = normalize_text(merchant)
+        scores = Counter()
+        if not key:
+            return scores
+
+        with self._lock:
+            exact = self.merchants.get(key)
+            if exact:
+                total = sum(exact.values())
+                for category, count in exact.items():
+                    scores[category] += EXACT_MATCH_WEIGHT * count / total
+
+            grams = merchant_ngrams(key)
+            for gram in grams:
+                counts = self.ngrams.get(gram)
+                if not counts:
+                    continue
+                total = sum(counts.values())
+                for category, count in counts.items():
+                    scores[category] += count / total / len(grams)
+        return scores
+
+    def __len__(self) -> int:
+        return len(self.merchants)
+
+
+class CategoryClassifier:
+    """Per-user indexes (LRU) over a shared global prior"""
+
+    def __init__(self):
+        self.user_indexes = get_cache("category_index", maxsize=1000, ttl=INDEX_TTL_SECONDS)
+        self.global_index: Optional[MerchantIndex] = None
+        self.global_built_at = 0.0
+        self._build_lock = threading.Lock()
+        self.stats = {"predictions": 0, "confident": 0, "user_builds": 0, "updates": 0}
+        subscribe(EXPENSE_CHANGED, self._on_expense_changed)
+
+    def _on_expense_changed(self, event: Dict[str, Any]):
+        """Incremental update - only indexes already in memory are touched"""
+        user_index = self.user_indexes.peek(event["user_id"])
+        if user_index is not None:
+            user_index.add(event.get("merchant"), event.get("category"), event["count"])
+        if self.global_index is not None:
+            self.global_index.add(event.get("merchant"), event.get("category"), event["count"])
+        self.stats["updates"] += 1
+
+    def _global_fresh(self) -> bool:
+        return self.global_index is not None and time.monotonic() - self.global_built_at < INDEX_TTL_SECONDS
+
+    def _get_global_index(self, db: Session) -> MerchantIndex:
+        if self._global_fresh():
+            return self.global_index
+        with self._build_lock:
+            if not self._global_fresh():
+                index = MerchantIndex()
+                for gem_name, gem in BAKU_LOCAL_GEMS.items():
+                    index.add(gem_name, gem.get("category"))
+                    for alt in gem.get("alternatives", []):
+                        index.add(alt["name"], alt.get("category"))
+
+                rows = (
+                    db.query(Expense.merchant, Expense.category, func.count(Expense.id))
+                    .group_by(Expense.merchant, Expense.category)
+                    .order_by(func.count(Expense.id).desc())
+                    .limit(GLOBAL_PRIOR_ROWS)
+                    .all()
+                )
+                for merchant, category, count in rows:
+                    index.add(merchant, category, count)
+                self.global_index = index
+                self.global_built_at = time.monotonic()
+                print(f"🏷️ Category prior built from {len(rows)} merchant/category pairs")
+        return self.global_index
+
+    def _get_user_index(self, db: Session, user_id: int) -> MerchantIndex:
+        index = self.user_indexes.get(user_id)
+        if index is not None:
+            return index
+
+        index = MerchantIndex()
+        rows = (
+            db.query(Expense.merchant, Expense.category, func.count(Expense.id))
+            .filter(Expense.user_id == user_id)
+            .group_by(Expense.merchant, Expense.category)
+            .all()
+        )
+        for merchant, category, count in rows:
+            index.add(merchant, category, count)
+        self.user_indexes.set(user_id, index)
+        self.stats["user_builds"] += 1
+        return index
+
+    def predict(self, db: Session, user_id: int, merchant: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        Ranked category suggestions for a merchant
+
+        Returns:
+            [{"category": ..., "confidence": 0..1}, ...] (empty if nothing is known)
+        """
+        scores = Counter()
+        for category, score in self._get_user_index(db, user_id).score(merchant).items():
+            scores[category] += USER_WEIGHT * score
+        for category, score in self._get_global_index(db).score(merchant).items():
+            scores[category] += score
+
+        self.stats["predictions"] += 1
+        total = sum(scores.values())
+        if not total:
+            return []
+        return [
+            {"category": category, "confidence": round(score / total, 3)}
+            for category, score in scores.most_common(limit)
+        ]
+
+    def suggest(self, db: Session, user_id: int, merchant: Optional[str]) -> Optional[str]:
+        """Top category if it is confident enough to fill in without asking Gemini"""
+        if not merchant:
+            return None
+        ranked = self.predict(db, user_id, merchant, limit=1)
+        if ranked and ranked[0]["confidence"] >= CATEGORY_CLASSIFIER_MIN_CONFIDENCE:
+            self.stats["confident"] += 1
+            return ranked[0]["category"]
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "user_indexes": len(self.user_indexes),
+            "global_merchants": len(self.global_index) if self.global_index is not None else 0,
+        }
+
+
+# Singleton instance
+category_classifier = CategoryClassifier()
@@ -0,0 +1,48 @@
+"""In-process domain events - writes publish, caches and engines subscribe
+
+Payloads are plain dicts. Handlers run synchronously inside the publisher's call,
+so they must be cheap (invalidate a key, bump a counter) and must not touch the DB.
+Writes use publish_after_commit() so subscribers only ever see committed data.
+"""
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+EXPENSE_CHANGED = "expense_changed"
+INCOME_CHANGED = "income_changed"
+
+_subscribers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = defaultdict(list)
+
+
+def subscribe(event_type: str, handler: Callable[[Dict[str, Any]], None]):
+    """Register a handler for an event type"""
+    if handler not in _subscribers[event_type]:
+        _subscribers[event_type].append(handler)
+
+
+def publish(event_type: str, **payload):
+    """Deliver an event to every subscriber; a failing handler never breaks the write"""
+    payload["type"] = event_type
+    for handler in list(_subscribers.get(event_type, ())):
+        try:
+            handler(payload)
+        except Exception as e:
+            print(f"⚠️ Event handler error ({event_type}): {e}")
+
+
+def publish_after_commit(session: Session, event_type: str, **payload):
+    """Queue an event on the session; delivered after commit, dropped on rollback"""
+    session.info.setdefault("pending_events", []).append((event_type, payload))
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending_events(session: Session):
+    for event_type, payload in session.info.pop("pending_events", ()):
+        publish(event_type, **payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_events(session: Session):
+    session.info.pop("pending_events", None)
@@ -0,0 +1,304 @@
+"""Rule-based expense parser - the fast path for voice commands
+
+Most voice inputs look like "Bolt-a 8 manat verdim": one amount next to a currency
+word plus a merchant the user has paid before. Those are parsed here without an LLM
+round-trip; Gemini is only used when the parse confidence is low.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from local_gems import BAKU_LOCAL_GEMS
+from models import Expense
+from utils.cache import get_cache
+from utils.events import subscribe, EXPENSE_CHANGED
+
+# Parses below this confidence go to Gemini
+EXPENSE_PARSER_MIN_CONFIDENCE = float(os.getenv("EXPENSE_PARSER_MIN_CONFIDENCE", "0.8"))
+
+# Which path produced the final result of each voice parse
+parse_stats = {"rules": 0, "gemini": 0, "rules_fallback": 0, "failed": 0}
+
+# Number words per language: value words and multipliers
+NUMBER_WORDS = {
+    "az": {
+        "bir": 1, "iki": 2, "üç": 3, "dörd": 4, "beş": 5, "altı": 6, "yeddi": 7,
+        "səkkiz": 8, "doqquz": 9, "on": 10, "iyirmi": 20, "otuz": 30, "qırx": 40,
+        "əlli": 50, "altmış": 60, "yetmiş": 70, "səksən": 80, "doxsan": 90,
+        "yarım": 0.5,
+    },
+    "en": {
+        "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+        "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+        "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+        "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+        "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+    },
+    "ru": {
+        "один": 1, "одна": 1, "одну": 1, "два": 2, "две": 2, "три": 3, "четыре": 4,
+        "пять": 5, "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10,
+        "одиннадцать": 11, "двенадцать": 12, "тринадцать": 13, "четырнадцать": 14,
+        "пятнадцать": 15, "шестнадцать": 16, "семнадцать": 17, "восемнадцать": 18,
+        "девятнадцать": 19, "двадцать": 20, "тридцать": 30, "сорок": 40,
+        "пятьдесят": 50, "шестьдесят": 60, "семьдесят": 70, "восемьдесят": 80,
+        "девяносто": 90, "сто": 100, "двести": 200, "триста": 300, "четыреста": 400,
+        "пятьсот": 500, "шестьсот": 600, "семьсот": 700, "восемьсот": 800,
+        "девятьсот": 900,
+    },
+}
+HUNDRED_WORDS = {"yüz", "hundred"}
+THOUSAND_WORDS = {"min", "thousand", "тысяча", "тысячи", "тысяч", "тысячу"}
+
+# Currency words: main unit and 1/100 unit (AZN only)
+MAIN_CURRENCY_WORDS = {
+    "manat", "manata", "manatı", "manatlıq", "man", "azn", "₼",
+    "манат", "маната", "манатов",
+}
+MINOR_CURRENCY_WORDS = {
+    "qəpik", "qepik", "qəpiyə", "qəpiklik",
+    "копейка", "копейки", "копеек", "гяпик", "гяпиков",
+}
+
+# Any other currency needs conversion - the rules never guess it, Gemini does
+FOREIGN_CURRENCY_WORDS = {
+    "dollar", "dollars", "dolları", "dollara", "dolar", "доллар", "доллара", "долларов",
+    "euro", "euros", "avro", "yevro", "евро",
+    "rubl", "rubla", "рубль", "рубля", "рублей", "lira", "лир", "лиры",
+    "pound", "pounds", "фунт", "фунта", "фунтов",
+    "cent", "cents", "цент", "цента", "центов",
+    "usd", "eur", "rub", "gbp", "tl",
+}
+FOREIGN_CURRENCY_SYMBOLS = ("$", "€", "£", "₽", "₺")
+
+# Azerbaijani case suffixes left on merchant names ("Bolt-a", "Bravodan", "KFC-də")
+AZ_SUFFIXES = ("nın", "nin", "nun", "nün", "dan", "dən", "da", "də", "ya", "yə", "a", "ə")
+
+DIGIT_PATTERN = re.compile(r"^\d+(?:[.,]\d{1,2})?$")
+TOKEN_PATTERN = re.compile(r"[\w₼.,'’-]+", re.UNICODE)
+
+# Known merchants per user: user_id -> [(normalized name, display name, category)]
+merchant_cache = get_cache("known_merchants", maxsize=512, ttl=1800)
+
+
+def _invalidate_merchants(event: Dict[str, Any]):
+    merchant_cache.delete(event["user_id"])
+
+
+subscribe(EXPENSE_CHANGED, _invalidate_merchants)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase with Azerbaijani dotted/dotless i handled"""
+    return (text or "").replace("I", "ı").replace("İ", "i").lower().strip()
+
+
+def _tokenize(text: str) -> List[str]:
+    tokens = []
+    for raw in TOKEN_PATTERN.findall(normalize_text(text)):
+        token = raw.strip(".,'’-")
+        # "8-ə" / "Bolt-a" -> "8" / "bolt"
+        base = re.split(r"[-'’]", token, maxsplit=1)[0] if not DIGIT_PATTERN.match(token) else token
+        if base:
+            tokens.append(base)
+    return tokens
+
+
+def _strip_suffix(token: str) -> str:
+    for suffix in AZ_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def _parse_number_at(tokens: List[str], index: int, language: str) -> Tuple[Optional[float], int]:
+    """Parse a number (digits or words) starting at tokens[index]
+
+    Returns:
+        (value or None, number of tokens consumed)
+    """
+    token = tokens[index]
+    if DIGIT_PATTERN.match(token):
+        return float(token.replace(",", ".")), 1
+
+    words = NUMBER_WORDS.get(language, NUMBER_WORDS["az"])
+    total, current, consumed = 0.0, 0.0, 0
+    for word in tokens[index:]:
+        if word in words:
+            current += words[word]
+        elif word in HUNDRED_WORDS:
+            current = (current or 1) * 100
+        elif word in THOUSAND_WORDS:
+            total += (current or 1) * 1000
+            current = 0
+        else:
+            break
+        consumed += 1
+
+    if not consumed:
+        return None, 0
+    return total + current, consumed
+
+
+def has_foreign_currency(text: str, tokens: List[str]) -> bool:
+    """True if the transcript names a non-AZN currency ("five dollars", "$5", "10 евро")"""
+    if any(symbol in (text or "") for symbol in FOREIGN_CURRENCY_SYMBOLS):
+        return True
+    return any(
+        token in FOREIGN_CURRENCY_WORDS or _strip_suffix(token) in FOREIGN_CURRENCY_WORDS
+        for token in tokens
+    )
+
+
+def extract_amount(text: str, language: str = "az") -> Tuple[Optional[float], float]:
+    """
+    Find the expense amount in a transcript
+
+    Returns:
+        (amount or None, confidence) - 0.6 when the number sits next to a currency
+        word, 0.4 for a lone bare number, 0 when ambiguous or in a foreign currency
+    """
+    tokens = _tokenize(text)
+    if has_foreign_currency(text, tokens):
+        return None, 0.0
+
+    numbers = []  # (value, index after the number)
+    index = 0
+    while index < len(tokens):
+        value, consumed = _parse_number_at(tokens, index, language)
+        if value is None:
+            index += 1
+            continue
+        numbers.append((value, index + consumed))
+        index += consumed
+
+    with_currency = []
+    for position, (value, end) in enumerate(numbers):
+        unit = tokens[end] if end < len(tokens) else None
+        if unit in MAIN_CURRENCY_WORDS:
+            amount = value
+            # "8 manat 50 qəpik"
+            if position + 1 < len(numbers):
+                minor_value, minor_end = numbers[position + 1]
+                if minor_end < len(tokens) and tokens[minor_end] in MINOR_CURRENCY_WORDS:
+                    amount += minor_value / 100
+            with_currency.append(amount)
+        elif unit in MINOR_CURRENCY_WORDS and (position == 0 or tokens[numbers[position - 1][1]] not in MAIN_CURRENCY_WORDS):
+            with_currency.append(value / 100)
+
+    if len(with_currency) == 1:
+        return round(with_currency[0], 2), 0.6
+    if not with_currency and len(numbers) == 1:
+        return round(numbers[0][0], 2), 0.4
+    return None, 0.0
+
+
+def get_known_merchants(db: Session, user_id: int) -> List[Tuple[str, str, str]]:
+    """User's merchants (most used first) followed by the local gems catalogue"""
+    merchants = merchant_cache.get(user_id)
+    if merchants is not None:
+        return merchants
+
+    rows = (
+        db.query(Expense.merchant, Expense.category, func.count(Expense.id))
+        .filter(Expense.user_id == user_id)
+        .group_by(Expense.merchant, Expense.category)
+        .order_by(func.count(Expense.id).desc())
+        .limit(500)
+        .all()
+    )
+    merchants = []
+    seen = set()
+    for merchant, category, _ in rows:
+        key = normalize_text(merchant)
+        if key and key not in seen:
+            seen.add(key)
+            merchants.append((key, merchant, category))
+
+    for gem_name, gem in BAKU_LOCAL_GEMS.items():
+        entries = [(gem_name, gem.get("category"))]
+        entries += [(alt["name"], alt.get("category")) for alt in gem.get("alternatives", [])]
+        for name, category in entries:
+            key = normalize_text(name)
+            if key and key not in seen and category:
+                seen.add(key)
+                merchants.append((key, name, category))
+
+    merchant_cache.set(user_id, merchants)
+    return merchants
+
+
+def match_merchant(text: str, merchants: List[Tuple[str, str, str]]) -> Optional[Tuple[str, str]]:
+    """
+    Find a known merchant in the transcript
+
+    Full-name matches win; otherwise the merchant's first word (3+ letters) must equal
+    a transcript token with its Azerbaijani case suffix removed.
+
+    Returns:
+        (merchant display name, category) or None
+    """
+    normalized = normalize_text(text)
+    tokens = _tokenize(text)
+    token_set = set(tokens) | {_strip_suffix(token) for token in tokens}
+
+    best = None
+    best_length = 0
+    for key, display_name, category in merchants:
+        if len(key) > best_length and re.search(rf"(?<!\w){re.escape(key)}", normalized):
+            best, best_length = (display_name, category), len(key)
+
+    if best:
+        return best
+
+    for key, display_name, category in merchants:
+        head = re.split(r"[\s'’-]", key, maxsplit=1)[0]
+        if len(head) >= 3 and head in token_set:
+            return display_name, category
+    return None
+
+
+def parse_expense_rules(
+    text: str,
+    language: str = "az",
+    merchants: Optional[List[Tuple[str, str, str]]] = None
+) -> Dict[str, Any]:
+    """
+    Deterministic parse of a voice transcript
+
+    Returns:
+        dict with amount, merchant, category (any may be None) and confidence (0..1)
+    """
+    amount, confidence = extract_amount(text, language)
+    merchant, category = None, None
+
+    matched = match_merchant(text, merchants or [])
+    if matched:
+        merchant, category = matched
+        confidence += 0.4
+
+    if amount is None:
+        confidence = 0.0
+
+    return {
+        "amount": amount,
+        "merchant": merchant,
+        "category": category,
+        "confidence": round(min(confidence, 1.0), 2),
+    }
+
+
+def record_parse_path(path: str):
+    parse_stats[path] = parse_stats.get(path, 0) + 1
+
+
+def get_parse_stats() -> Dict[str, Any]:
+    total = sum(parse_stats.values())
+    return {
+        **parse_stats,
+        "total": total,
+        "rules_share": round(parse_stats["rules"] / total, 3) if total else 0.0,
+        "min_confidence": EXPENSE_PARSER_MIN_CONFIDENCE,
+    }
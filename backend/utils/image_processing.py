@@ -0,0 +1,63 @@
+"""Receipt image preprocessing - smaller uploads for the OCR model, stable hash-based names"""
+import hashlib
+import io
+import os
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest side after downscaling - enough for receipt text, a fraction of a phone photo
+RECEIPT_MAX_SIDE = int(os.getenv("RECEIPT_MAX_SIDE", "1600"))
+RECEIPT_JPEG_QUALITY = int(os.getenv("RECEIPT_JPEG_QUALITY", "80"))
+UPLOAD_DIR = "static/uploads"
+
+
+def content_hash(content: bytes) -> str:
+    """sha256 of the raw upload - identical photos get identical hashes"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def preprocess_receipt_image(content: bytes) -> Optional[bytes]:
+    """
+    Downscale, convert to grayscale and re-encode as JPEG
+
+    EXIF orientation is applied to the pixels first; the output carries no EXIF.
+    Returns None if the bytes are not a readable image.
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("L")
+            image.thumbnail((RECEIPT_MAX_SIDE, RECEIPT_MAX_SIDE), Image.LANCZOS)
+
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=RECEIPT_JPEG_QUALITY, optimize=True)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        print(f"⚠️ Receipt preprocessing skipped: {e}")
+        return None
+
+
+def store_receipt_upload(content: bytes, filename: str = "") -> Tuple[str, str]:
+    """
+    Preprocess an upload and store it under its content hash
+
+    Returns:
+        (file_path, content_hash)
+    """
+    digest = content_hash(content)
+    processed = preprocess_receipt_image(content)
+    if processed is not None:
+        data, extension = processed, ".jpg"
+    else:
+        # Unreadable by Pillow - keep the original bytes and let the model decide
+        data = content
+        extension = os.path.splitext(filename or "")[1].lower() or ".bin"
+
+    file_path = os.path.join(UPLOAD_DIR, f"{digest}{extension}")
+    if not os.path.exists(file_path):
+        with open(file_path, "wb") as f:
+            f.write(data)
+
+    print(f"🧾 Receipt stored: {file_path} ({len(content) // 1024} KB -> {len(data) // 1024} KB)")
+    return file_path, digest
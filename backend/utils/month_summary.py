@@ -0,0 +1,196 @@
+"""Per-user monthly rollup (user_month_summary) - incremental maintenance and reads
+
+Every expense/income write goes through one of the record_* helpers below, inside
+the same session (and transaction) as the write itself. Current-month reads then
+cost O(categories) instead of O(expenses). The helpers also queue an
+expense_changed / income_changed event (see utils.events) for caches and engines,
+delivered once the session commits.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from models import Expense, Income, UserMonthSummary
+from utils.events import publish_after_commit, EXPENSE_CHANGED, INCOME_CHANGED
+
+KIND_EXPENSE = "expense"
+KIND_INCOME = "income"
+
+
+def month_key(when: Optional[datetime] = None) -> str:
+    """Month key in "YYYY-MM" format"""
+    when = when or datetime.utcnow()
+    return f"{when.year:04d}-{when.month:02d}"
+
+
+def _apply_delta(db: Session, user_id: int, kind: str, when: Optional[datetime],
+                 category: Optional[str], amount: float, count: int):
+    """Atomically add amount/count to a summary row (upsert)"""
+    stmt = sqlite_insert(UserMonthSummary).values(
+        user_id=user_id,
+        month=month_key(when),
+        kind=kind,
+        category=category or "Digər",
+        total=float(amount or 0.0),
+        count=count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "month", "kind", "category"],
+        set_={
+            "total": UserMonthSummary.total + stmt.excluded.total,
+            "count": UserMonthSummary.count + stmt.excluded.count,
+        }
+    )
+    db.execute(stmt)
+
+
+def snapshot_expense(expense: Expense) -> dict:
+    """Capture the summary-relevant fields of an expense before it is mutated"""
+    return {
+        "user_id": expense.user_id,
+        "date": expense.date,
+        "category": expense.category,
+        "amount": expense.amount,
+        "merchant": expense.merchant,
+        "is_subscription": expense.is_subscription,
+    }
+
+
+def _publish_expense(db: Session, fields: dict, sign: int):
+    publish_after_commit(
+        db,
+        EXPENSE_CHANGED,
+        user_id=fields["user_id"],
+        date=fields["date"],
+        category=fields["category"] or "Digər",
+        amount=sign * (fields["amount"] or 0.0),
+        count=sign,
+        merchant=fields["merchant"],
+        is_subscription=bool(fields["is_subscription"]),
+    )
+
+
+def record_expense(db: Session, expense: Expense, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) an expense from the rollup"""
+    _apply_delta(
+        db, expense.user_id, KIND_EXPENSE, expense.date or datetime.utcnow(),
+        expense.category, sign * (expense.amount or 0.0), sign
+    )
+    _publish_expense(db, snapshot_expense(expense), sign)
+
+
+def record_expense_removed(db: Session, expense: Expense):
+    """Remove a deleted expense from the rollup"""
+    record_expense(db, expense, sign=-1)
+
+
+def record_expense_update(db: Session, expense: Expense, previous: dict):
+    """Move an edited expense from its previous values to its current ones"""
+    _apply_delta(
+        db, previous["user_id"], KIND_EXPENSE, previous["date"] or datetime.utcnow(),
+        previous["category"], -(previous["amount"] or 0.0), -1
+    )
+    _publish_expense(db, previous, -1)
+    record_expense(db, expense)
+
+
+def record_income(db: Session, income: Income, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) an income from the rollup"""
+    _apply_delta(
+        db, income.user_id, KIND_INCOME, income.date or datetime.utcnow(),
+        income.source, sign * (income.amount or 0.0), sign
+    )
+    publish_after_commit(
+        db,
+        INCOME_CHANGED,
+        user_id=income.user_id,
+        date=income.date,
+        source=income.source or "Digər",
+        amount=sign * (income.amount or 0.0),
+        count=sign,
+    )
+
+
+def get_month_totals(db: Session, user_id: int, when: Optional[datetime] = None) -> Dict:
+    """Read month totals for a user from the rollup
+
+    Returns:
+        dict with total_spending, expense_count, category_breakdown (first-seen order),
+        total_income, income_by_source
+    """
+    rows = (
+        db.query(UserMonthSummary.kind, UserMonthSummary.category,
+                 UserMonthSummary.total, UserMonthSummary.count)
+        .filter(
+            UserMonthSummary.user_id == user_id,
+            UserMonthSummary.month == month_key(when),
+            UserMonthSummary.count > 0
+        )
+        .order_by(UserMonthSummary.id)
+        .all()
+    )
+
+    category_breakdown = {}
+    income_by_source = {}
+    expense_count = 0
+    for kind, category, total, count in rows:
+        if kind == KIND_EXPENSE:
+            category_breakdown[category] = float(total or 0.0)
+            expense_count += count
+        elif kind == KIND_INCOME:
+            income_by_source[category] = float(total or 0.0)
+
+    return {
+        "total_spending": sum(category_breakdown.values()),
+        "expense_count": expense_count,
+        "category_breakdown": category_breakdown,
+        "total_income": sum(income_by_source.values()),
+        "income_by_source": income_by_source,
+    }
+
+
+def rebuild_month_summaries(db: Session, user_id: Optional[int] = None) -> int:
+    """Recompute the rollup from raw expense/income rows
+
+    Args:
+        user_id: Rebuild only this user's rows (all users if None)
+
+    Returns:
+        Number of summary rows written
+    """
+    delete_query = db.query(UserMonthSummary)
+    if user_id is not None:
+        delete_query = delete_query.filter(UserMonthSummary.user_id == user_id)
+    delete_query.delete(synchronize_session=False)
+
+    sources = [
+        (KIND_EXPENSE, Expense, func.coalesce(Expense.category, "Digər")),
+        (KIND_INCOME, Income, func.coalesce(Income.source, "Digər")),
+    ]
+    written = 0
+    for kind, model, category_column in sources:
+        month_column = func.strftime("%Y-%m", model.date)
+        query = db.query(
+            model.user_id, month_column, category_column,
+            func.sum(model.amount), func.count(model.id)
+        )
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        rows = query.group_by(model.user_id, month_column, category_column).all()
+
+        for row_user_id, month, category, total, count in rows:
+            if month is None:
+                continue
+            db.add(UserMonthSummary(
+                user_id=row_user_id,
+                month=month,
+                kind=kind,
+                category=category,
+                total=float(total or 0.0),
+                count=int(count or 0)
+            ))
+            written += 1
+
+    db.commit()
+    return written
@@ -0,0 +1,165 @@
+"""Health-scored proxy pool for edge-tts
+
+proxies.txt is loaded once and re-read only when its mtime changes. Each proxy keeps
+an EWMA of its success rate and of its time-to-first-audio; pick() returns the best
+scored proxies that are not cooling down. Repeatedly failing proxies are ejected for
+a cooldown that doubles on every ejection.
+"""
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+PROXY_FILE = os.getenv("TTS_PROXY_FILE", "proxies.txt")
+PROXY_EWMA_ALPHA = float(os.getenv("PROXY_EWMA_ALPHA", "0.3"))
+PROXY_MAX_FAILURES = int(os.getenv("PROXY_MAX_FAILURES", "2"))  # Consecutive failures before ejection
+PROXY_COOLDOWN_SECONDS = float(os.getenv("PROXY_COOLDOWN_SECONDS", "60"))
+PROXY_MAX_COOLDOWN_SECONDS = float(os.getenv("PROXY_MAX_COOLDOWN_SECONDS", "900"))
+PROXY_RELOAD_CHECK_SECONDS = 5.0
+DEFAULT_LATENCY = 1.0  # Seconds assumed for proxies without measurements
+
+
+def normalize_proxy(raw_proxy: str) -> str:
+    """Convert IP:PORT:USER:PASS (or IP:PORT) lines to proxy URLs"""
+    parts = raw_proxy.split(':')
+    if len(parts) == 4:
+        return f"http://{parts[2]}:{parts[3]}@{parts[0]}:{parts[1]}"
+    if not raw_proxy.startswith("http"):
+        return f"http://{raw_proxy}"
+    return raw_proxy
+
+
+def mask_proxy(url: str) -> str:
+    """Proxy URL without credentials (for logs and metrics)"""
+    return url.split("://", 1)[-1].rsplit("@", 1)[-1]
+
+
+class ProxyHealth:
+    """Rolling health of one proxy"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.success_rate = 1.0  # Optimistic start so new proxies get tried
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.cooldown_until = 0.0
+        self.uses = 0
+
+    def score(self, now: float) -> float:
+        if self.cooldown_until > now:
+            return 0.0
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return self.success_rate / (1.0 + latency)
+
+
+class ProxyPool:
+    """Long-lived proxy pool with EWMA scoring and cooldown ejection"""
+
+    def __init__(self, path: str = PROXY_FILE):
+        self.path = path
+        self.proxies: Dict[str, ProxyHealth] = {}
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self.stats = {"reloads": 0, "successes": 0, "failures": 0, "ejections": 0}
+
+    def _maybe_reload(self):
+        """Re-read the proxy file if it changed (checked at most every few seconds)"""
+        now = time.monotonic()
+        if now - self._last_check < PROXY_RELOAD_CHECK_SECONDS and self._mtime is not None:
+            return
+        self._last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self.proxies:
+                print(f"⚠️ Proxy file {self.path} disappeared, dropping proxies")
+            self.proxies = {}
+            self._mtime = None
+            return
+
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                urls = [
+                    normalize_proxy(line.strip())
+                    for line in f
+                    if line.strip() and not line.startswith("#")
+                ]
+        except OSError as e:
+            print(f"⚠️ Proxy Error: {e}")
+            return
+
+        # Keep the health history of proxies that are still listed
+        self.proxies = {url: self.proxies.get(url) or ProxyHealth(url) for url in urls}
+        self._mtime = mtime
+        self.stats["reloads"] += 1
+        print(f"📋 Loaded {len(self.proxies)} proxies from {self.path}")
+
+    def pick(self, count: int = 3) -> List[str]:
+        """Best `count` proxies that are not cooling down (random tie-break)"""
+        self._maybe_reload()
+        now = time.monotonic()
+        available = [health for health in self.proxies.values() if health.cooldown_until <= now]
+        available.sort(key=lambda health: (health.score(now), random.random()), reverse=True)
+        return [health.url for health in available[:count]]
+
+    def record_success(self, url: Optional[str], latency: float):
+        health = self.proxies.get(url) if url else None
+        self.stats["successes"] += 1
+        if health is None:
+            return
+        health.uses += 1
+        health.consecutive_failures = 0
+        health.ejections = 0
+        health.success_rate = PROXY_EWMA_ALPHA + (1 - PROXY_EWMA_ALPHA) * health.success_rate
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency = PROXY_EWMA_ALPHA * latency + (1 - PROXY_EWMA_ALPHA) * health.latency
+
+    def record_failure(self, url: Optional[str]):
+        health = self.proxies.get(url) if url else None
+        self.stats["failures"] += 1
+        if health is None:
+            return
+        health.uses += 1
+        health.consecutive_failures += 1
+        health.success_rate = (1 - PROXY_EWMA_ALPHA) * health.success_rate
+
+        if health.consecutive_failures >= PROXY_MAX_FAILURES:
+            cooldown = min(
+                PROXY_COOLDOWN_SECONDS * (2 ** health.ejections),
+                PROXY_MAX_COOLDOWN_SECONDS
+            )
+            health.cooldown_until = time.monotonic() + cooldown
+            health.ejections += 1
+            health.consecutive_failures = 0
+            self.stats["ejections"] += 1
+            print(f"🚫 Proxy {mask_proxy(url)} ejected for {cooldown:.0f}s")
+
+    def get_stats(self, top: int = 5) -> Dict[str, Any]:
+        self._maybe_reload()
+        now = time.monotonic()
+        ranked = sorted(self.proxies.values(), key=lambda health: health.score(now), reverse=True)
+        return {
+            **self.stats,
+            "total": len(self.proxies),
+            "cooling_down": sum(1 for health in self.proxies.values() if health.cooldown_until > now),
+            "best": [
+                {
+                    "proxy": mask_proxy(health.url),
+                    "success_rate": round(health.success_rate, 3),
+                    "latency": round(health.latency, 3) if health.latency is not None else None,
+                    "uses": health.uses,
+                }
+                for health in ranked[:top]
+            ],
+        }
+
+
+# Singleton instance
+proxy_pool = ProxyPool()
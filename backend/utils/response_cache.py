@@ -0,0 +1,194 @@
+"""ETag / 304 caching for the read endpoints the frontend polls
+
+Every user has a data version that is bumped by any write that touches them
+(expenses, incomes, dreams, XP, settings ...). A polled GET gets an ETag built from
+that version, so an unchanged poll is answered with 304 before the endpoint runs,
+and a client without the body gets it from an in-memory LRU instead of recomputing.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User
+from utils.cache import get_cache
+from utils.events import subscribe, EXPENSE_CHANGED, INCOME_CHANGED
+
+# Upper bound on staleness for writes this worker never hears about - bounds both
+# the 304 path (the ETag changes every TTL window) and the in-memory body cache
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_MAX_BODY = 512 * 1024  # Bigger bodies are not kept in memory
+
+CACHED_PATHS = {
+    "/api/dashboard-updates",
+    "/api/dashboard-stats",
+    "/api/stats",
+    "/api/notifications",
+    "/api/heatmap",
+    "/api/bootstrap",
+}
+
+# Versions are per process; a fresh epoch keeps another worker's ETags from matching
+_EPOCH = uuid.uuid4().hex[:8]
+_versions: Dict[int, int] = {}
+_versions_lock = threading.Lock()
+
+response_cache = get_cache("responses", maxsize=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+response_cache_stats = {"not_modified": 0, "served_from_cache": 0, "computed": 0, "uncacheable": 0}
+
+
+def get_data_version(user_id: int) -> int:
+    return _versions.get(user_id, 0)
+
+
+def bump_data_version(user_id: Optional[int]):
+    """Mark everything cached for this user as stale"""
+    if user_id is None:
+        return
+    with _versions_lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def _on_data_changed(event_payload: Dict[str, Any]):
+    bump_data_version(event_payload.get("user_id"))
+
+
+subscribe(EXPENSE_CHANGED, _on_data_changed)
+subscribe(INCOME_CHANGED, _on_data_changed)
+
+
+def _owner_id(obj: Any) -> Optional[int]:
+    if isinstance(obj, User):
+        return obj.id
+    return getattr(obj, "user_id", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_flushed_owners(session: Session, flush_context):
+    """Any ORM write to a user's row or to a row they own (user_id column) bumps them"""
+    owners = session.info.setdefault("changed_owner_ids", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        user_id = _owner_id(obj)
+        if user_id is not None:
+            owners.add(user_id)
+            bump_data_version(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_owners(session: Session):
+    # Again after commit: a concurrent poll may have cached the pre-commit data meanwhile
+    for user_id in session.info.pop("changed_owner_ids", ()):
+        bump_data_version(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_owners(session: Session):
+    session.info.pop("changed_owner_ids", None)
+
+
+def make_etag(user_id: int, version: int, path: str, query: bytes) -> str:
+    # The date is part of the tag: notifications and month totals roll over at midnight.
+    # The TTL window is too, so a write the version never saw expires on its own
+    window = int(time.time() // RESPONSE_CACHE_TTL) if RESPONSE_CACHE_TTL > 0 else 0
+    raw = f"{_EPOCH}:{user_id}:{version}:{datetime.utcnow():%Y-%m-%d}:{window}:{path}?{query.decode('latin-1')}"
+    return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison - proxies may strip or add the W/ prefix
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any(tag in (etag, bare, f"W/{bare}") for tag in candidates)
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware answering polled GETs from the per-user data version
+
+    Must run inside SessionMiddleware (add it to the app before SessionMiddleware)
+    so the session's user_id is available.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in CACHED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = (scope.get("session") or {}).get("user_id")
+        if not user_id:
+            await self.app(scope, receive, send)
+            return
+
+        version = get_data_version(user_id)
+        path, query = scope["path"], scope.get("query_string", b"")
+        etag = make_etag(user_id, version, path, query)
+        headers = dict((name.lower(), value) for name, value in scope["headers"])
+
+        if _etag_matches(headers.get(b"if-none-match", b"").decode("latin-1"), etag):
+            response_cache_stats["not_modified"] += 1
+            await self._send(send, 304, etag, [], b"")
+            return
+
+        key = (user_id, path, query)
+        cached = response_cache.get(key)
+        if cached is not None and cached[0] == etag:
+            response_cache_stats["served_from_cache"] += 1
+            await self._send(send, 200, etag, cached[1], cached[2])
+            return
+
+        status, response_headers, body = await self._capture(scope, receive)
+        response_cache_stats["computed"] += 1
+
+        # Only keep the result if nothing was written while it was being computed
+        if status == 200 and get_data_version(user_id) == version and len(body) <= RESPONSE_CACHE_MAX_BODY:
+            response_cache.set(key, (etag, response_headers, body))
+            await self._send(send, 200, etag, response_headers, body)
+        else:
+            response_cache_stats["uncacheable"] += 1
+            await self._send(send, status, None, response_headers, body)
+
+    async def _capture(self, scope, receive) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+        """Run the endpoint and collect its whole response"""
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture_send)
+        headers = [
+            (name, value) for name, value in start.get("headers", [])
+            if name.lower() not in (b"content-length", b"etag", b"cache-control")
+        ]
+        return start.get("status", 500), headers, b"".join(chunks)
+
+    @staticmethod
+    async def _send(send, status: int, etag: Optional[str], headers: List[Tuple[bytes, bytes]], body: bytes):
+        headers = list(headers)
+        if etag is not None:
+            headers.append((b"etag", etag.encode("latin-1")))
+            # Browsers keep the body but revalidate every poll (If-None-Match)
+            headers.append((b"cache-control", b"private, no-cache"))
+        if status != 304:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    return {**response_cache_stats, "tracked_users": len(_versions)}
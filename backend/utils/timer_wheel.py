@@ -0,0 +1,50 @@
+"""Hashed timer wheel - O(1) schedule/cancel, O(bucket) per tick"""
+from typing import Dict, Hashable, List
+
+
+class TimerWheel:
+    """
+    Fixed ring of slots advanced one tick at a time
+
+    A key scheduled `ticks` ahead lands in slot (position + ticks) % slots with the
+    number of full rotations it still has to wait; advance() returns the keys due now.
+    """
+
+    def __init__(self, slots: int):
+        self.size = max(1, slots)
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(self.size)]
+        self.position = 0
+        self._where: Dict[Hashable, int] = {}  # key -> slot index
+
+    def schedule(self, key: Hashable, ticks: int):
+        """(Re)schedule a key to fire `ticks` ticks from now (minimum 1)"""
+        ticks = max(1, int(ticks))
+        self.cancel(key)
+        slot = (self.position + ticks) % self.size
+        self.slots[slot][key] = (ticks - 1) // self.size
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def advance(self) -> List[Hashable]:
+        """Move one tick forward and return the keys that fire"""
+        self.position = (self.position + 1) % self.size
+        bucket = self.slots[self.position]
+        due = []
+        for key, rounds in list(bucket.items()):
+            if rounds <= 0:
+                due.append(key)
+                del bucket[key]
+                del self._where[key]
+            else:
+                bucket[key] = rounds - 1
+        return due
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def __len__(self) -> int:
+        return len(self._where)
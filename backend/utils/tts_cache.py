@@ -0,0 +1,167 @@
+"""Content-addressed TTS audio cache - memory LRU in front of a disk LRU
+
+Voice confirmations ("X manat Y kateqoriyasında saxlandı") and chat readouts repeat a
+lot, so synthesized audio is stored under sha256(text, voice, rate, pitch, volume).
+Both tiers are bounded by total bytes and evict least recently used entries.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_MB = float(os.getenv("TTS_CACHE_MEMORY_MB", "32"))
+TTS_CACHE_DISK_MB = float(os.getenv("TTS_CACHE_DISK_MB", "256"))
+
+
+def tts_cache_key(text: str, voice: str, rate: str, pitch: str, volume: str) -> str:
+    """Stable key for one synthesis request"""
+    payload = json.dumps([text, voice, rate, pitch, volume], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory + disk) byte-bounded LRU cache for audio blobs"""
+
+    def __init__(self, directory: str, memory_limit: int, disk_limit: int):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> file size
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        self._load_disk_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU order from file mtimes (oldest first)"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".mp3"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return audio
+
+            if key not in self._disk:
+                self.stats["misses"] += 1
+                return None
+
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))  # Keeps LRU order across restarts
+        except OSError:
+            with self._lock:
+                self._drop_disk_entry(key)
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self.stats["disk_hits"] += 1
+            self._put_memory(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        try:
+            tmp_path = self._path(key) + ".part"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"⚠️ TTS cache write error: {e}")
+            with self._lock:
+                self._put_memory(key, audio)
+            return
+
+        with self._lock:
+            self._drop_disk_entry(key, delete_file=False)
+            self._disk[key] = len(audio)
+            self._disk_bytes += len(audio)
+            self._evict_disk()
+            self._put_memory(key, audio)
+            self.stats["stores"] += 1
+
+    def _put_memory(self, key: str, audio: bytes):
+        if len(audio) > self.memory_limit:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_limit and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    def _drop_disk_entry(self, key: str, delete_file: bool = True):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        if delete_file:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_limit and self._disk:
+            key = next(iter(self._disk))
+            self._drop_disk_entry(key)
+            self.stats["disk_evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+# Singleton instance
+tts_cache = TTSCache(
+    TTS_CACHE_DIR,
+    memory_limit=int(TTS_CACHE_MEMORY_MB * 1024 * 1024),
+    disk_limit=int(TTS_CACHE_DISK_MB * 1024 * 1024),
+)
@@ -0,0 +1,155 @@
+"""Per-connection WebSocket writers - bounded outgoing queue + one writer task each
+
+Senders only enqueue, so a slow client never delays the user's other sockets or the
+request that triggered the notification. Notification lists are never queued as
+data: a SNAPSHOT sentinel is queued instead and the list is built when it is actually
+sent, so any number of pending list updates/deltas coalesce into one fresh snapshot.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "64"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))  # Seconds before a stuck client is dropped
+
+KIND_MESSAGE = "message"  # JSON message (new_notification, scan results, ...)
+KIND_TEXT = "text"  # Raw text frame (ping / pong)
+KIND_DELTA = "delta"  # Sequenced notification delta - superseded by a snapshot
+KIND_SNAPSHOT = "snapshot"  # Sentinel: build and send the current notification list
+
+writer_stats = {
+    "enqueued": 0,
+    "sent": 0,
+    "coalesced": 0,
+    "dropped": 0,
+    "send_timeouts": 0,
+    "send_errors": 0,
+}
+
+
+class ConnectionWriter:
+    """Bounded outgoing queue for one WebSocket, drained by its own task"""
+
+    def __init__(
+        self,
+        websocket,
+        snapshot_factory: Callable[[], Dict[str, Any]],
+        on_close: Optional[Callable[[], Any]] = None,
+        maxsize: int = WS_SEND_QUEUE_MAX
+    ):
+        self.websocket = websocket
+        self.snapshot_factory = snapshot_factory
+        self.on_close = on_close
+        self.maxsize = maxsize
+        self.queue: deque = deque()
+        self.dropped = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def _push(self, kind: str, payload: Any = None):
+        self.queue.append((kind, payload))
+        writer_stats["enqueued"] += 1
+        self._wakeup.set()
+
+    def send(self, message: Dict[str, Any]):
+        """Queue a JSON message; under pressure deltas collapse first, then the oldest message is dropped"""
+        if self.closed:
+            return
+        self._push(KIND_MESSAGE, message)
+        if len(self.queue) > self.maxsize:
+            self._collapse_deltas()
+        while len(self.queue) > self.maxsize:
+            for index, (kind, _) in enumerate(self.queue):
+                if kind != KIND_SNAPSHOT:
+                    del self.queue[index]
+                    break
+            else:
+                break
+            self.dropped += 1
+            writer_stats["dropped"] += 1
+
+    def send_text(self, text: str):
+        if not self.closed:
+            self._push(KIND_TEXT, text)
+
+    def send_delta(self, message: Dict[str, Any]):
+        """Queue a notification delta (dropped if a snapshot is already pending)"""
+        if self.closed:
+            return
+        if any(kind == KIND_SNAPSHOT for kind, _ in self.queue):
+            writer_stats["coalesced"] += 1
+            return
+        self._push(KIND_DELTA, message)
+        if len(self.queue) > self.maxsize:
+            self._collapse_deltas()
+
+    def send_snapshot(self):
+        """Queue the snapshot sentinel; pending deltas and list updates fold into it"""
+        if not self.closed:
+            self._fold_into_snapshot()
+
+    def _collapse_deltas(self):
+        """Replace queued deltas with one snapshot sentinel (the client resyncs from it)"""
+        if any(kind == KIND_DELTA for kind, _ in self.queue):
+            self._fold_into_snapshot()
+
+    def _fold_into_snapshot(self):
+        kept = deque(item for item in self.queue if item[0] != KIND_DELTA)
+        writer_stats["coalesced"] += len(self.queue) - len(kept)
+        self.queue = kept
+        if any(kind == KIND_SNAPSHOT for kind, _ in self.queue):
+            writer_stats["coalesced"] += 1
+            return
+        self._push(KIND_SNAPSHOT)
+
+    async def _run(self):
+        failed = False
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                kind, payload = self.queue.popleft()
+                if kind == KIND_SNAPSHOT:
+                    payload = self.snapshot_factory()
+
+                try:
+                    if kind == KIND_TEXT:
+                        await asyncio.wait_for(self.websocket.send_text(payload), timeout=WS_SEND_TIMEOUT)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_json(payload), timeout=WS_SEND_TIMEOUT)
+                    writer_stats["sent"] += 1
+                except asyncio.TimeoutError:
+                    writer_stats["send_timeouts"] += 1
+                    print(f"⏱️ WebSocket send timed out after {WS_SEND_TIMEOUT:.0f}s, dropping connection")
+                    failed = True
+                    break
+                except Exception:
+                    # Client went away - normal
+                    writer_stats["send_errors"] += 1
+                    failed = True
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.closed = True
+            self.queue.clear()
+            if failed and self.on_close is not None:
+                result = self.on_close()
+                if asyncio.iscoroutine(result):
+                    await result
+
+    def close(self):
+        """Stop the writer (queued messages are discarded)"""
+        if self.closed:
+            return
+        self.closed = True
+        if not self._task.done():
+            self._task.cancel()
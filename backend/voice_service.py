@@ -5,20 +5,62 @@ Handles voice-to-text, NLP parsing, and text-to-speech
 
 import os
 import base64
-import tempfile
 import asyncio
+import time
 from typing import Dict, Any, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 import edge_tts
 from ai_service import ai_service
 from models import Expense
+from utils.month_summary import record_expense
+from utils.tts_cache import tts_cache, tts_cache_key
+from utils.proxy_pool import proxy_pool, mask_proxy
+from utils.expense_parser import (
+    EXPENSE_PARSER_MIN_CONFIDENCE,
+    get_known_merchants,
+    parse_expense_rules,
+    record_parse_path,
+)
+from utils.category_classifier import category_classifier
 from datetime import datetime
 
-# API clients (prefer Groq Whisper, fallback to OpenAI)
+# Whisper transcription timeout (seconds) - async clients never block the event loop
+WHISPER_TIMEOUT_SECONDS = float(os.getenv("WHISPER_TIMEOUT_SECONDS", "30"))
+
+# API clients (prefer a local Whisper-compatible server, then Groq Whisper, then OpenAI)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-groq_client = OpenAI(api_key=GROQ_API_KEY, base_url="https://api.groq.com/openai/v1") if GROQ_API_KEY else None
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+WHISPER_BASE_URL = os.getenv("WHISPER_BASE_URL", "")  # e.g. http://localhost:8000/v1 (local stand-in)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+local_whisper_client = AsyncOpenAI(
+    api_key=os.getenv("WHISPER_API_KEY", "local"),
+    base_url=WHISPER_BASE_URL,
+    timeout=WHISPER_TIMEOUT_SECONDS,
+    max_retries=0
+) if WHISPER_BASE_URL else None
+groq_client = AsyncOpenAI(
+    api_key=GROQ_API_KEY,
+    base_url="https://api.groq.com/openai/v1",
+    timeout=WHISPER_TIMEOUT_SECONDS,
+    max_retries=1
+) if GROQ_API_KEY else None
+openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=WHISPER_TIMEOUT_SECONDS,
+    max_retries=1
+) if OPENAI_API_KEY else None
+
+# Audio mime type -> filename extension (Whisper detects the format from the name)
+AUDIO_SUFFIX_MAP = {
+    "audio/webm": ".webm",
+    "audio/mp4": ".mp4",
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+    "audio/wav": ".wav"
+}
+
+# Fail fast on dead proxies instead of waiting for edge-tts' default connect timeout
+TTS_CONNECT_TIMEOUT = int(os.getenv("TTS_CONNECT_TIMEOUT", "5"))
 
 
 class VoiceService:
@@ -30,39 +72,110 @@ class VoiceService:
     }
     
     @staticmethod
-    async def transcribe_audio(audio_file_path: str, language: str = "az") -> Dict[str, Any]:
+    async def transcribe_audio(
+        audio_data: bytes,
+        language: str = "az",
+        mime_type: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        Convert audio to text using Groq Whisper (preferred) or OpenAI Whisper
+        Convert audio to text using a local Whisper server, Groq Whisper or OpenAI Whisper
+
+        The audio is sent straight from memory - no temp file.
         """
-        if not groq_client and not openai_client:
+        if local_whisper_client:
+            client, model = local_whisper_client, WHISPER_MODEL
+        elif groq_client:
+            client, model = groq_client, "whisper-large-v3"
+        elif openai_client:
+            client, model = openai_client, "whisper-1"
+        else:
             return {"success": False, "error": "Groq/OpenAI API key not configured", "text": ""}
 
+        # Map language codes to Whisper format
+        lang_map = {"az": "az"}
+        whisper_lang = lang_map.get(language, "az")
+        suffix = AUDIO_SUFFIX_MAP.get(mime_type or "", ".webm")
+
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                # Map language codes to Whisper format
-                lang_map = {"az": "az"}
-                whisper_lang = lang_map.get(language, "az")
-
-                if groq_client:
-                    transcript = groq_client.audio.transcriptions.create(
-                        model="whisper-large-v3",
-                        file=audio_file,
-                        language=whisper_lang
-                    )
-                else:
-                    transcript = openai_client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language=whisper_lang
-                    )
-
-                return {"success": True, "text": transcript.text}
+            transcript = await asyncio.wait_for(
+                client.audio.transcriptions.create(
+                    model=model,
+                    file=(f"audio{suffix}", audio_data, mime_type or "audio/webm"),
+                    language=whisper_lang
+                ),
+                timeout=WHISPER_TIMEOUT_SECONDS
+            )
+            return {"success": True, "text": transcript.text}
+        except asyncio.TimeoutError:
+            print(f"⏱️ Whisper transcription timed out after {WHISPER_TIMEOUT_SECONDS:.0f}s")
+            return {"success": False, "error": "Transcription timed out", "text": ""}
         except Exception as e:
             print(f"❌ Whisper Transcription Error: {e}")
             return {"success": False, "error": str(e), "text": ""}
     
     @staticmethod
-    def parse_expense_from_text(text: str, user_language: str = "az") -> Dict[str, Any]:
+    def _rule_result(parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Rule parser output in the parse_expense_from_text payload shape"""
+        merchant = parsed["merchant"] or "Səslə Əlavə"
+        return {
+            "success": True,
+            "amount": float(parsed["amount"]),
+            "merchant": merchant,
+            "category": parsed["category"] or "Digər",
+            "items": [{"name": merchant, "price": float(parsed["amount"])}],
+        }
+
+    @staticmethod
+    async def parse_expense_from_text(
+        text: str,
+        user_language: str = "az",
+        db=None,
+        user_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Extract expense data - rule-based parser first, Gemini only on low confidence
+
+        Args:
+            text: Transcribed text from user
+            user_language: User's preferred language
+            db: Database session (enables matching against the user's merchants)
+            user_id: Owner of the merchant history
+
+        Returns:
+            dict with amount, merchant, category, or error
+        """
+        merchants = []
+        if db is not None and user_id is not None:
+            try:
+                merchants = get_known_merchants(db, user_id)
+            except Exception as e:
+                print(f"⚠️ Known merchants lookup failed: {e}")
+
+        parsed = parse_expense_rules(text, user_language, merchants)
+        if parsed["confidence"] >= EXPENSE_PARSER_MIN_CONFIDENCE:
+            record_parse_path("rules")
+            print(f"⚡ Voice parsed by rules ({parsed['confidence']}): {parsed['amount']} AZN @ {parsed['merchant']}")
+            return VoiceService._rule_result(parsed)
+
+        result = await VoiceService.parse_expense_with_gemini(text, user_language)
+        if result.get("success"):
+            record_parse_path("gemini")
+            # Prefer the category this user (or everyone) actually files the merchant under
+            if db is not None and user_id is not None:
+                learned = category_classifier.suggest(db, user_id, result["merchant"])
+                if learned:
+                    result["category"] = learned
+            return result
+
+        if parsed["amount"]:
+            record_parse_path("rules_fallback")
+            return VoiceService._rule_result(parsed)
+
+        record_parse_path("failed")
+        return result
+
+    @staticmethod
+    async def parse_expense_with_gemini(text: str, user_language: str = "az") -> Dict[str, Any]:
         """
         Use Gemini to extract expense data from natural language
         
@@ -116,7 +229,7 @@ Only return JSON, no other text.""",
         prompt = prompts.get(user_language, prompts["az"]).format(text=text)
         
         try:
-            response = ai_service.model.generate_content(prompt)
+            response = await ai_service.generate_content_async(prompt)
             response_text = response.text.strip()
             
             # Clean JSON response
@@ -208,6 +321,87 @@ Only return JSON, no other text.""",
                 "error": f"Could not parse expense: {str(e)}"
             }
     
+    @staticmethod
+    async def stream_voice_response(
+        text: str,
+        language: str = "az",
+        rate: str = "+0%",
+        pitch: str = "+0Hz",
+        volume: str = "+0%"
+    ):
+        """
+        Async generator of MP3 chunks straight from edge-tts (no temp file)
+
+        Cached audio is yielded as one chunk. Proxies come from the health-scored pool
+        (best first); a failed attempt is retried with the next proxy only if nothing
+        has been yielded yet. The complete audio is cached.
+        """
+        if not text or not text.strip():
+            raise ValueError("Empty text")
+        
+        # Repeated phrases are served from the TTS cache (no network)
+        voice = VoiceService.VOICE_MAP.get(language, VoiceService.VOICE_MAP["az"])
+        cache_key = tts_cache_key(text, voice, rate, pitch, volume)
+        cached_audio = tts_cache.get(cache_key)
+        if cached_audio:
+            print(f"⚡ TTS cache hit: {text[:50]}...")
+            yield cached_audio
+            return
+        
+        print(f"🔊 TTS: Generating with voice {voice}, rate={rate}, pitch={pitch}, text: {text[:50]}...")
+        # Best 3 healthy proxies; direct connection when none is available
+        candidates = proxy_pool.pick(3) or [None, None, None]
+        max_retries = len(candidates)
+        for attempt, proxy in enumerate(candidates):
+            if proxy:
+                print(f"🔄 TTS Attempt {attempt + 1}/{max_retries}: Using proxy: {mask_proxy(proxy)}")
+            else:
+                print(f"🔄 TTS Attempt {attempt + 1}/{max_retries}: No proxy")
+            
+            audio_parts = []
+            started = time.monotonic()
+            try:
+                # Generate audio using edge-tts with enhanced quality parameters
+                communicate = edge_tts.Communicate(
+                    text, 
+                    voice, 
+                    proxy=proxy,
+                    rate=rate,      # Speech rate: -50% to +100% (default: +0%)
+                    pitch=pitch,     # Pitch: -50Hz to +50Hz (default: +0Hz)
+                    volume=volume,   # Volume: -50% to +100% (default: +0%)
+                    connect_timeout=TTS_CONNECT_TIMEOUT
+                )
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio" and chunk["data"]:
+                        if not audio_parts:
+                            # Time to first audio is what the proxy score tracks
+                            proxy_pool.record_success(proxy, time.monotonic() - started)
+                        audio_parts.append(chunk["data"])
+                        yield chunk["data"]
+                
+                if not audio_parts:
+                    raise Exception("No audio data received")
+                
+                audio_data = b"".join(audio_parts)
+                print(f"✅ TTS: Generated {len(audio_data)} bytes")
+                tts_cache.put(cache_key, audio_data)
+                return
+                
+            except Exception as e:
+                print(f"❌ TTS Attempt {attempt + 1} failed: {e}")
+                if audio_parts:
+                    # Part of the audio is already on the wire - can't restart
+                    raise
+                proxy_pool.record_failure(proxy)
+                if attempt < max_retries - 1:
+                    if proxy is None:
+                        await asyncio.sleep(0.5)  # Small delay before a direct retry
+                    else:
+                        print(f"⏳ Retrying with next best proxy...")
+                    continue
+                print(f"❌ All {max_retries} attempts failed")
+                raise
+    
     @staticmethod
     async def generate_voice_response(
         text: str, 
@@ -225,112 +419,17 @@ Only return JSON, no other text.""",
             return None
         
         try:
-            voice = VoiceService.VOICE_MAP.get(language, VoiceService.VOICE_MAP["az"])
-            print(f"🔊 TTS: Generating with voice {voice}, rate={rate}, pitch={pitch}, text: {text[:50]}...")
-            
-            # Create temp file
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-            
-            # Load all proxies if available
-            all_proxies = []
-            proxies_file = "proxies.txt"
-            if os.path.exists(proxies_file):
-                try:
-                    with open(proxies_file, "r") as f:
-                        raw_proxies = [line.strip() for line in f if line.strip() and not line.startswith("#")]
-                    
-                    # Randomly select up to 100 proxies
-                    import random
-                    if len(raw_proxies) > 100:
-                        all_proxies = random.sample(raw_proxies, 100)
-                    else:
-                        all_proxies = raw_proxies.copy()
-                    
-                    # Shuffle them for random order
-                    random.shuffle(all_proxies)
-                    print(f"📋 Loaded {len(all_proxies)} random proxies")
-                except Exception as e:
-                    print(f"⚠️ Proxy Error: {e}")
-
-            # Try up to 3 different proxies before giving up
-            max_retries = min(3, len(all_proxies)) if all_proxies else 3
-            for attempt in range(max_retries):
-                proxy = None
-                if all_proxies and attempt < len(all_proxies):
-                    # Use shuffled list - each attempt gets next proxy
-                    raw_proxy = all_proxies[attempt]
-                    # Convert IP:PORT:USER:PASS to http://USER:PASS@IP:PORT
-                    parts = raw_proxy.split(':')
-                    if len(parts) == 4:
-                        proxy = f"http://{parts[2]}:{parts[3]}@{parts[0]}:{parts[1]}"
-                    else:
-                        if not raw_proxy.startswith("http"):
-                            proxy = f"http://{raw_proxy}"
-                        else:
-                            proxy = raw_proxy
-                    print(f"🔄 TTS Attempt {attempt + 1}/{max_retries}: Using proxy: {proxy}")
-                else:
-                    print(f"🔄 TTS Attempt {attempt + 1}/{max_retries}: No proxy")
-
-                try:
-                    # Generate audio using edge-tts with enhanced quality parameters
-                    # Format: rate (speed), pitch (tone), volume
-                    communicate = edge_tts.Communicate(
-                        text, 
-                        voice, 
-                        proxy=proxy,
-                        rate=rate,      # Speech rate: -50% to +100% (default: +0%)
-                        pitch=pitch,     # Pitch: -50Hz to +50Hz (default: +0Hz)
-                        volume=volume   # Volume: -50% to +100% (default: +0%)
-                    )
-                    await communicate.save(tmp_path)
-                    
-                    # Wait a bit to ensure file is written
-                    await asyncio.sleep(0.2)
-                    
-                    # Check file exists and has content
-                    if not os.path.exists(tmp_path):
-                        raise Exception("Audio file not created")
-                    
-                    file_size = os.path.getsize(tmp_path)
-                    if file_size == 0:
-                        raise Exception("Audio file is empty")
-                    
-                    print(f"✅ TTS: Generated {file_size} bytes")
-                    
-                    # Read and return audio
-                    with open(tmp_path, "rb") as f:
-                        audio_data = f.read()
-                    
-                    if not audio_data or len(audio_data) == 0:
-                        raise Exception("No audio data read from file")
-                    
-                    return audio_data
-                    
-                except Exception as e:
-                    print(f"❌ TTS Attempt {attempt + 1} failed: {e}")
-                    if attempt < max_retries - 1:
-                        print(f"⏳ Retrying with different proxy...")
-                        await asyncio.sleep(0.5)  # Small delay before retry
-                        continue
-                    else:
-                        print(f"❌ All {max_retries} attempts failed")
-                        raise
-            
+            audio_parts = [
+                chunk async for chunk in VoiceService.stream_voice_response(
+                    text, language, rate=rate, pitch=pitch, volume=volume
+                )
+            ]
+            return b"".join(audio_parts) or None
         except Exception as e:
             print(f"❌ TTS Error: {e}")
             import traceback
             traceback.print_exc()
             return None
-        finally:
-                # Clean up temp file
-                if os.path.exists(tmp_path):
-                    try:
-                        os.unlink(tmp_path)
-                    except:
-                        pass
-            
     
     
     @staticmethod
@@ -356,24 +455,9 @@ Only return JSON, no other text.""",
             dict with expense_data, ai_response_audio, success
         """
         
-        # Pick file suffix based on mime
-        suffix_map = {
-            "audio/webm": ".webm",
-            "audio/mp4": ".mp4",
-            "audio/mpeg": ".mp3",
-            "audio/ogg": ".ogg",
-            "audio/wav": ".wav"
-        }
-        suffix = suffix_map.get(mime_type or "", ".webm")
-        
-        # Save audio temporarily
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp_audio:
-            tmp_audio.write(audio_data)
-            audio_path = tmp_audio.name
-        
         try:
-            # Step 1: Transcribe audio
-            transcription = await VoiceService.transcribe_audio(audio_path, language)
+            # Step 1: Transcribe audio (in memory)
+            transcription = await VoiceService.transcribe_audio(audio_data, language, mime_type)
             
             if not transcription["success"]:
                 return {
@@ -384,7 +468,9 @@ Only return JSON, no other text.""",
             transcribed_text = transcription["text"]
             
             # Step 2: Parse expense from text
-            expense_info = VoiceService.parse_expense_from_text(transcribed_text, language)
+            expense_info = await VoiceService.parse_expense_from_text(
+                transcribed_text, language, db=db_session, user_id=user.id
+            )
             
             if not expense_info.get("success"):
                 return {
@@ -409,6 +495,7 @@ Only return JSON, no other text.""",
                 date=datetime.now()
             )
             db_session.add(expense)
+            record_expense(db_session, expense)
             db_session.commit()
             
             # Step 4: Generate AI response
@@ -438,10 +525,6 @@ Only return JSON, no other text.""",
                 "success": False,
                 "error": str(e)
             }
-        finally:
-            # Clean up temp file
-            if os.path.exists(audio_path):
-                os.unlink(audio_path)
 
 
 # Singleton instance
@@ -6,7 +6,7 @@
 import React, { useState, useEffect, useRef } from 'react'
 import { createPortal } from 'react-dom'
 import { BellIcon, CloseIcon } from '../icons/Icons'
-import { notificationsAPI } from '../../services/api'
+import { notificationsAPI, authAPI } from '../../services/api'
 import { useAuth } from '../../contexts/AuthContext'
 
 const AlertBell = () => {
@@ -21,6 +21,12 @@ const AlertBell = () => {
   const bellRef = useRef(null)
   const wsRef = useRef(null)
   const reconnectTimeoutRef = useRef(null)
+  // WebSocket auth token (/api/ws-token) - expired olduqda yenisi alınır
+  const wsTokenRef = useRef(null)
+  // Delta protocol (v2) - son alınan siyahı və sequence, reconnect zamanı resume üçün
+  const ruleNotificationsRef = useRef([])
+  const epochRef = useRef(null)
+  const seqRef = useRef(0)
 
   // Backend-dən notifications yüklə
   const fetchNotifications = async () => {
@@ -67,8 +73,46 @@ const AlertBell = () => {
     const wsUrl = API_BASE_URL.replace('http://', 'ws://').replace('https://', 'wss://')
     let reconnectAttempts = 0
     const maxReconnectAttempts = 5
+
+    // Bütün bildirişlər siyahısını UI formatına çevir
+    const renderNotificationList = (notifications, count) => {
+      const formattedAlerts = notifications.map((notif, index) => ({
+        id: `${notif.id || notif.icon}-${index}-${Date.now()}`,
+        type: notif.color?.includes('red') ? 'error' : 
+              notif.color?.includes('amber') ? 'warning' : 
+              notif.color?.includes('green') ? 'success' : 'info',
+        message: notif.message,
+        icon: notif.icon || '📢',
+        color: `text-${notif.color || 'blue-500'}`,
+        timestamp: Date.now(),
+        isNew: false,
+      }))
+      
+      setAlerts(formattedAlerts)
+      // Yalnız panel açıq deyilsə unread count artır
+      if (!showPanel) {
+        setUnreadCount(count || formattedAlerts.length)
+      }
+      setLoading(false)
+    }
+
+    // add / remove / replace əməliyyatlarını tətbiq et
+    const applyDelta = (delta) => {
+      let list = [...ruleNotificationsRef.current]
+      delta.ops.forEach((op) => {
+        if (op.op === 'remove') {
+          list = list.filter((n) => n.id !== op.id)
+        } else if (op.op === 'add') {
+          list.splice(Math.min(op.index ?? list.length, list.length), 0, op.notification)
+        } else if (op.op === 'replace') {
+          list = list.map((n) => (n.id === op.id ? op.notification : n))
+        }
+      })
+      ruleNotificationsRef.current = list
+      seqRef.current = delta.seq
+    }
     
-    const connectWebSocket = () => {
+    const connectWebSocket = async () => {
       // Əgər artıq bağlantı varsa, yeni bağlantı açma
       if (wsRef.current && (wsRef.current.readyState === WebSocket.OPEN || wsRef.current.readyState === WebSocket.CONNECTING)) {
         return
@@ -80,7 +124,16 @@ const AlertBell = () => {
           wsRef.current.close()
         }
 
-        const ws = new WebSocket(`${wsUrl}/ws/notifications?user_id=${user.id}`)
+        if (!wsTokenRef.current) {
+          const tokenResponse = await authAPI.getWsToken()
+          wsTokenRef.current = tokenResponse.data?.ws_token
+        }
+        const resumeParams = epochRef.current
+          ? `&epoch=${epochRef.current}&since=${seqRef.current}`
+          : ''
+        const ws = new WebSocket(
+          `${wsUrl}/ws/notifications?token=${encodeURIComponent(wsTokenRef.current)}&protocol=2${resumeParams}`
+        )
         wsRef.current = ws
 
         ws.onopen = () => {
@@ -146,29 +199,34 @@ const AlertBell = () => {
               
               setLoading(false)
             }
-            // Bütün bildirişlər yeniləndi
+            // Bütün bildirişlər yeniləndi (snapshot)
             else if (data.type === 'notifications' && data.notifications) {
-              // Backend formatını frontend formatına çevir
-              const formattedAlerts = data.notifications.map((notif, index) => ({
-                id: `${notif.icon}-${index}-${Date.now()}`,
-                type: notif.color?.includes('red') ? 'error' : 
-                      notif.color?.includes('amber') ? 'warning' : 
-                      notif.color?.includes('green') ? 'success' : 'info',
-                message: notif.message,
-                icon: notif.icon || '📢',
-                color: `text-${notif.color || 'blue-500'}`,
-                timestamp: Date.now(),
-                isNew: false,
-              }))
-              
-              const newCount = data.count || formattedAlerts.length
-              
-              setAlerts(formattedAlerts)
-              // Yalnız panel açıq deyilsə unread count artır
-              if (!showPanel) {
-                setUnreadCount(newCount)
+              if (data.v >= 2) {
+                epochRef.current = data.epoch
+                seqRef.current = data.seq
+                ruleNotificationsRef.current = data.notifications
+              }
+              renderNotificationList(data.notifications, data.count)
+            }
+            // Yalnız dəyişikliklər (v2)
+            else if (data.type === 'notifications_delta') {
+              // Artıq snapshot-da olan dəyişiklik
+              if (data.epoch === epochRef.current && data.seq <= seqRef.current) return
+              if (data.epoch !== epochRef.current || data.seq !== seqRef.current + 1) {
+                // Sequence boşluğu - serverdən tam siyahını istə
+                ws.send('resync')
+                return
+              }
+              applyDelta(data)
+              renderNotificationList(ruleNotificationsRef.current)
+            }
+            // Reconnect - son seq-dən sonrakı dəyişikliklər
+            else if (data.type === 'notifications_resume') {
+              data.deltas.forEach(applyDelta)
+              seqRef.current = data.seq
+              if (data.deltas.length) {
+                renderNotificationList(ruleNotificationsRef.current)
               }
-              
               setLoading(false)
             }
           } catch (err) {
@@ -184,6 +242,11 @@ const AlertBell = () => {
         ws.onclose = (event) => {
           console.log('WebSocket disconnected', event.code, event.reason)
           setIsConnected(false)
+
+          // 1008 = token etibarsızdır / vaxtı keçib - növbəti cəhddə yenisini al
+          if (event.code === 1008) {
+            wsTokenRef.current = null
+          }
           
           // Yalnız normal bağlanma deyilsə reconnect et (code 1000 = normal close)
           if (event.code !== 1000 && reconnectAttempts < maxReconnectAttempts) {
@@ -35,6 +35,11 @@ export const authAPI = {
     })
   },
 
+  // WebSocket token (signed, for /ws/notifications)
+  getWsToken: async () => {
+    return api.get('/api/ws-token')
+  },
+
   // Logout
   logout: async () => {
     return api.get('/logout')
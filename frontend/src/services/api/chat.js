@@ -19,6 +19,46 @@ export const chatAPI = {
     })
   },
 
+  // Send message and receive the answer as a stream (Server-Sent Events)
+  // onDelta({ text, html }) is called for every chunk; resolves with the "done" payload
+  // (or the "error" payload - success: false, partial text - if the answer broke off)
+  streamMessage: async (message, onDelta) => {
+    const formData = new FormData()
+    formData.append('message', message)
+    const response = await fetch(`${api.defaults.baseURL}/api/chat/stream`, {
+      method: 'POST',
+      body: formData,
+      credentials: 'include',
+      headers: { 'Accept': 'text/event-stream' },
+    })
+    if (!response.ok) {
+      // Coin / auth errors come back as plain JSON
+      return response.json()
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let result = null
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        const event = raw.match(/^event: (.*)$/m)?.[1]
+        const data = raw.match(/^data: (.*)$/m)?.[1]
+        if (!data) continue
+        const payload = JSON.parse(data)
+        if (event === 'delta' && onDelta) onDelta(payload)
+        if (event === 'done' || event === 'error') result = payload
+      }
+    }
+    return result
+  },
+
   // Get chat history
   getChatHistory: async () => {
     return api.get('/api/chat-history')
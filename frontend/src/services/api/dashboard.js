@@ -34,5 +34,14 @@ export const dashboardAPI = {
   getDashboardUpdates: async () => {
     return api.get('/api/dashboard-updates')
   },
+
+  // Bootstrap - stats, dashboard, dashboard_stats, forecast, forecast_chart, notifications in one request
+  getBootstrap: async (fields = null) => {
+    const params = {}
+    if (fields && fields.length) {
+      params.fields = Array.isArray(fields) ? fields.join(',') : fields
+    }
+    return api.get('/api/bootstrap', { params })
+  },
 }
 
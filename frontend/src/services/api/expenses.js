@@ -23,6 +23,11 @@ export const expensesAPI = {
   deleteExpense: async (expenseId) => {
     return api.delete(`/api/expenses/${expenseId}`)
   },
+
+  // Category suggestions for a merchant name (autocomplete)
+  suggestCategory: async (merchant, limit = 3) => {
+    return api.get('/api/suggest-category', { params: { merchant, limit } })
+  },
 }
 
 
@@ -29,5 +29,11 @@ export const voiceAPI = {
     formData.append('language', language)
     return api.post('/api/tts', formData)
   },
+
+  // Streaming text to speech - URL usable directly as <audio src> (starts on first chunk)
+  textToSpeechStreamUrl: (text, language = 'az') => {
+    const params = new URLSearchParams({ text, language })
+    return `${api.defaults.baseURL}/api/tts/stream?${params.toString()}`
+  },
 }
 